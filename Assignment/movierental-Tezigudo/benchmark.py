@@ -0,0 +1,217 @@
+"""Benchmarks of the movie catalog.
+
+Each benchmark writes a synthetic movie file with the number of rows
+asked for, in the format of movie.csv, and prints its timings.
+
+    python benchmark.py load --rows 100000
+    python benchmark.py snapshot --rows 1000000
+    python benchmark.py memory --rentals 1000000
+    python benchmark.py statement --rentals 10000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from typing import Callable
+
+import snapshot
+from movie import Movie, MovieCatalog, get_catalog, open_catalog, read_movie_rows
+from customer import Customer
+from rental import Rental
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Biography', 'Children', 'Comedy',
+          'Crime', 'Documentary', 'Drama', 'Family', 'Fantasy', 'History',
+          'Horror', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller',
+          'War', 'Western']
+
+
+def write_movie_file(path: str, rows: int, seed: int = 0) -> None:
+    """Write a movie file of rows random movies."""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        f.write('#id,title,year,genres\n')
+        for n in range(rows):
+            genres = rng.sample(GENRES, rng.randint(1, 4))
+            writer.writerow([n, f'Movie {n}', rng.randint(1920, 2022), '|'.join(genres)])
+
+
+def seconds_per_call(func: Callable, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_load(rows: int, repeat: int) -> None:
+    """Compare loading a catalog from the file with getting the shared one."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'movie.csv')
+        write_movie_file(path, rows)
+        cold = seconds_per_call(lambda: MovieCatalog(path), repeat)
+        get_catalog(path)
+        cached = seconds_per_call(lambda: get_catalog(path), 1000)
+    print(f'{rows} movies')
+    print(f'cold load (MovieCatalog):  {cold * 1000:10.3f} ms')
+    print(f'cached (get_catalog):      {cached * 1000:10.3f} ms')
+    print(f'speedup:                   {cold / cached:10.0f}x')
+
+
+def rss_kib() -> int:
+    """The resident set size of this process in KiB, or its peak where
+    the current size is not available.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # in KiB on Linux, but in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure_open(path: str) -> None:
+    """Open a catalog and look up a movie, and print the seconds taken and
+    the RSS of this process as JSON.
+    """
+    baseline = rss_kib()
+    start = time.perf_counter()
+    catalog = open_catalog(path)
+    catalog.get_movie('Movie 1')
+    seconds = time.perf_counter() - start
+    rss = rss_kib()
+    print(json.dumps({'seconds': seconds, 'rss_kib': rss, 'added_kib': rss - baseline}))
+
+
+def bench_snapshot(rows: int) -> None:
+    """Compare opening a movie file with opening a snapshot of it, each in
+    a new process.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'movie.csv')
+        snap_path = os.path.join(directory, 'movie.snap')
+        write_movie_file(csv_path, rows)
+        start = time.perf_counter()
+        snapshot.write_snapshot(read_movie_rows(csv_path), snap_path)
+        export = time.perf_counter() - start
+        results = {}
+        for name, path in (('csv', csv_path), ('snapshot', snap_path)):
+            output = subprocess.run(
+                [sys.executable, __file__, 'measure-open', path],
+                check=True, capture_output=True, text=True).stdout
+            results[name] = json.loads(output)
+            results[name]['file_kib'] = os.path.getsize(path) // 1024
+    print(f'{rows} movies; writing the snapshot took {export:.2f} s')
+    print(f'{"":10s} {"open ms":>10s} {"RSS KiB":>14s} {"added KiB":>12s} {"file KiB":>10s}')
+    for name, result in results.items():
+        print(f'{name:10s} {result["seconds"] * 1000:10.3f} {result["rss_kib"]:14d} '
+              f'{result["added_kib"]:12d} {result["file_kib"]:10d}')
+
+
+class DictMovie:
+    """Movie as it was before __slots__: a __dict__ and its own genre list."""
+
+    def __init__(self, title, year, genre):
+        self.__title = title
+        self.__year = year
+        self.__genre = genre
+
+
+class DictRental:
+    """Rental as it was before __slots__."""
+
+    def __init__(self, movie, days_rented):
+        self.movie = movie
+        self.days_rented = days_rented
+
+
+def allocated(make: Callable) -> tuple:
+    """Return what make() returns and the bytes it allocated."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = make()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(movies: int, rentals: int) -> None:
+    """Compare the bytes per movie and per rental of the __dict__ classes
+    with the slotted classes.
+    """
+    rng = random.Random(0)
+    rows = [(f'Movie {n}', rng.randint(1920, 2022), rng.sample(GENRES, rng.randint(1, 3)))
+            for n in range(movies)]
+    days = [rng.randint(1, 7) for _ in range(rentals)]
+    print(f'{movies} movies, {rentals} rentals')
+    print(f'{"":10s} {"bytes/movie":>12s} {"bytes/rental":>13s}')
+    for name, movie_class, rental_class in (('before', DictMovie, DictRental),
+                                            ('after', Movie, Rental)):
+        # the titles are not counted, since both kinds share them
+        catalog, movie_bytes = allocated(
+            lambda: [movie_class(title, year, list(genres)) for title, year, genres in rows])
+        # each rental in a list, as in Customer.rentals
+        rental_list, rental_bytes = allocated(
+            lambda: [rental_class(catalog[n % movies], day) for n, day in enumerate(days)])
+        print(f'{name:10s} {movie_bytes / movies:12.1f} {rental_bytes / rentals:13.1f}')
+        del catalog, rental_list
+
+
+def bench_statement(rentals: int, repeat: int) -> None:
+    """Time the statement of a customer with many rentals."""
+    rng = random.Random(0)
+    movies = [Movie(f'Movie {n}', rng.randint(1920, 2022), rng.sample(GENRES, rng.randint(1, 3)))
+              for n in range(1000)]
+    customer = Customer('Benchmark')
+    as_of = date(2022, 6, 1)
+    for n in range(rentals):
+        customer.add_rental(Rental(movies[n % len(movies)], rng.randint(1, 7), as_of))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        customer.statement()
+    print(f'statement of {rentals} rentals: '
+          f'{(time.perf_counter() - start) / repeat * 1000:.1f} ms')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('load', help=bench_load.__doc__)
+    load.add_argument('--rows', type=int, default=100000)
+    load.add_argument('--repeat', type=int, default=3, help='cold loads to average')
+    snap = commands.add_parser('snapshot', help=bench_snapshot.__doc__)
+    snap.add_argument('--rows', type=int, default=1000000)
+    memory = commands.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('--movies', type=int, default=10000)
+    memory.add_argument('--rentals', type=int, default=1000000)
+    statement = commands.add_parser('statement', help=bench_statement.__doc__)
+    statement.add_argument('--rentals', type=int, default=10000)
+    statement.add_argument('--repeat', type=int, default=10)
+    measure = commands.add_parser('measure-open', help=measure_open.__doc__)
+    measure.add_argument('path')
+    args = parser.parse_args()
+    if args.command == 'load':
+        bench_load(args.rows, args.repeat)
+    elif args.command == 'snapshot':
+        bench_snapshot(args.rows)
+    elif args.command == 'memory':
+        bench_memory(args.movies, args.rentals)
+    elif args.command == 'statement':
+        bench_statement(args.rentals, args.repeat)
+    elif args.command == 'measure-open':
+        measure_open(args.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ class Customer:
     movies rented for the current billing period,
     and can print a statement of his rentals.
     """
+    __slots__ = ('name', 'rentals')
 
     def __init__(self, name: str):
         """Initialize a new customer."""
@@ -38,6 +39,8 @@ class Customer:
     def statement(self):
         """Create a statement of rentals for the current period.
 
+        Each rental is priced once, and the total is the sum of those prices.
+
         Print all the rentals in the current period,
         along with total charges and frequent renter points.
 
@@ -46,25 +49,27 @@ class Customer:
         """
 
         # the .format method substitutes actual values into the fmt string
-        statement = f"Rental Report for {self.name}\n\n"
+        lines = [f"Rental Report for {self.name}\n\n"]
         header_fmt = "{:40s}  {:6s} {:6s}\n"
-        statement += header_fmt.format("Movie Title", "  Days", " Price")
+        lines.append(header_fmt.format("Movie Title", "  Days", " Price"))
         rental_fmt = "{:40s}  {:6d} {:6.2f}\n"
 
+        total = 0
+        points = 0
         for rental in self.rentals:
             # compute rental change
             charge = rental.get_price()
+            total += charge
+            points += rental.rental_points()
 
             #  add a detail line to statement
-            statement += rental_fmt.format(
+            lines.append(rental_fmt.format(
                 rental.get_movie().get_title(), rental.get_days_rented(), charge
-            )
+            ))
 
         # footer: summary of charges
-        statement += "\n"
-        statement += "{:40s}  {:6s} {:6.2f}\n".format(
-            "Total Charges", "", self.total_amount()
-        )
-        statement += f"Frequent Renter Points earned: {self.total_rental_points()}\n"
+        lines.append("\n")
+        lines.append("{:40s}  {:6s} {:6.2f}\n".format("Total Charges", "", total))
+        lines.append(f"Frequent Renter Points earned: {points}\n")
 
-        return statement
+        return "".join(lines)
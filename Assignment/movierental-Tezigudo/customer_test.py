@@ -1,9 +1,13 @@
 import re
 import unittest
+from datetime import date
 from customer import Customer
 from rental import Rental
 from movie import Movie
 
+# the movies from 2022 are new releases
+AS_OF = date(2022, 6, 1)
+
 
 class CustomerTest(unittest.TestCase):
     """Tests of the Customer class"""
@@ -27,7 +31,7 @@ class CustomerTest(unittest.TestCase):
         self.assertIsNotNone(matches)
         self.assertEqual("0.00", matches[1])
         # add a rental
-        self.c.add_rental(Rental(self.new_movie, 4))  # days
+        self.c.add_rental(Rental(self.new_movie, 4, AS_OF))  # days
         stmt = self.c.statement()
         matches = re.match(pattern, stmt.replace("\n", ""), flags=re.DOTALL)
         self.assertIsNotNone(matches)
@@ -36,11 +40,11 @@ class CustomerTest(unittest.TestCase):
     def test_total_amount(self):
         """test total_amount() for a customer"""
         self.assertEqual(self.c.total_amount(), 0.0)
-        self.c.add_rental(Rental(self.new_movie, 4))
+        self.c.add_rental(Rental(self.new_movie, 4, AS_OF))
         self.assertEqual(self.c.total_amount(), 12.0)
 
     def test_total_rental_points(self):
         """test total_rental_points() for a customer"""
         self.assertEqual(self.c.total_rental_points(), 0)
-        self.c.add_rental(Rental(self.new_movie, 4))
+        self.c.add_rental(Rental(self.new_movie, 4, AS_OF))
         self.assertEqual(self.c.total_rental_points(), 4)
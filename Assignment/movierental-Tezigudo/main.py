@@ -1,7 +1,9 @@
 # Demonstrate the movie rental code.
 # Create a customer with some movies and print a statement.
 
-from movie import Movie, MovieCatalog
+from datetime import date
+
+from movie import Movie, get_catalog
 from rental import Rental
 from customer import Customer
 
@@ -14,15 +16,16 @@ def make_movies():
     #     Movie("Top Gun: Maverick", Movie.NEW_RELEASE),
     #     Movie("Particle Fever", Movie.REGULAR),
     # ]
-    catalog = MovieCatalog()
-    return catalog.movies
+    return get_catalog().movies
 
 
 if __name__ == "__main__":
     # Create a customer with some rentals
     customer = Customer("Edward Snowden")
     days = 1
+    # one date for every rental, so they are priced alike
+    today = date.today()
     for movie in make_movies():
-        customer.add_rental(Rental(movie, days))
+        customer.add_rental(Rental(movie, days, today))
         days = (days + 2) % 5 + 1
     print(customer.statement())
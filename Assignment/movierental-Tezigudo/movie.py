@@ -1,20 +1,48 @@
 
-from typing import Collection
+from bisect import bisect_left, bisect_right
+from typing import (TYPE_CHECKING, Collection, Dict, FrozenSet, Iterator, List,
+                    Optional, Tuple, Union)
 from pricing import PriceCode
 import csv
+import os
+import sys
+import threading
+
+if TYPE_CHECKING:
+    from snapshot import SnapshotCatalog
 
 MOVIEFILE = 'movie.csv'
 
+# each distinct set of genres -> (that set, its case-folded genres); the
+# genre vocabulary is small, so the movies share a few of these sets
+_genre_sets: Dict[FrozenSet[str], Tuple[FrozenSet[str], FrozenSet[str]]] = {}
+
+
+def genre_set(genres: Collection[str]) -> FrozenSet[str]:
+    """Return the shared frozenset of these genres, with interned strings."""
+    key = frozenset(genres)
+    shared = _genre_sets.get(key)
+    if shared is None:
+        interned = frozenset(sys.intern(genre) for genre in key)
+        shared = _genre_sets.setdefault(
+            key, (interned, frozenset(sys.intern(genre.casefold()) for genre in key)))
+    return shared[0]
+
 
 class Movie:
     """
     A movie available for rent.
+
+    Movies use __slots__ and share their genre sets (see genre_set()), so
+    a large catalog costs little more than its titles.
     """
 
+    __slots__ = ('__title', '__year', '__genre', '__weakref__')
+
     def __init__(self, title: str, year: int, genre: Collection[str]) -> None:
         self.__title = title
         self.__year = year
-        self.__genre = genre
+        self.__genre = genre_set(genre)
 
     @property
     def title(self) -> str:
@@ -25,11 +53,12 @@ class Movie:
         return self.__year
 
     @property
-    def genre(self) -> Collection[str]:
+    def genre(self) -> FrozenSet[str]:
         return self.__genre
 
     def is_genre(self, genre: str):
-        return genre.lower() in map(str.lower, self.genre)
+        # the genres are case-folded once per genre set, not per call
+        return genre.casefold() in _genre_sets[self.__genre][1]
 
     def __repr__(self):
         return f"{self.title} ({self.year})"
@@ -39,22 +68,117 @@ class Movie:
         return self.title
 
 
-class MovieCatalog:
+def read_movie_rows(filename: Optional[str] = None) -> Iterator[Tuple[str, int, List[str]]]:
+    """Yield (title, year, genres) for each movie in a movie file."""
+    with open(filename or MOVIEFILE, 'r') as f:
+        for row in csv.reader(f):
+            if not row[0].startswith('#'):
+                yield row[1], int(row[2]), row[3].split('|')
 
-    def __init__(self) -> None:
-        self.movies = []
 
-        with open(MOVIEFILE, 'r') as f:
-            reader = csv.reader(f)
+class MovieCatalog:
+    """
+    The movies in a movie file (default MOVIEFILE), with indexes built once
+    at load, so lookups by title, year and genre do not scan the whole
+    catalog.  Use get_catalog() to share one catalog instead of loading
+    the file again.
+    """
 
-            self.movies.extend(Movie(row[1], int(row[2]), row[3].split(
-                '|')) for row in reader if not row[0].startswith('#'))
+    def __init__(self, filename: Optional[str] = None) -> None:
+        self.movies = [Movie(title, year, genres)
+                       for title, year, genres in read_movie_rows(filename)]
+        self.__build_indexes()
+
+    def __build_indexes(self) -> None:
+        # the first movie in the file wins, as it did for a linear scan
+        self.__by_title: Dict[str, Movie] = {}
+        self.__by_title_year: Dict[Tuple[str, int], Movie] = {}
+        # case-folded genre -> positions in self.movies, in order
+        self.__by_genre: Dict[str, List[int]] = {}
+        for position, movie in enumerate(self.movies):
+            self.__by_title.setdefault(movie.title, movie)
+            self.__by_title_year.setdefault((movie.title, movie.year), movie)
+            for genre in {g.casefold() for g in movie.genre}:
+                self.__by_genre.setdefault(genre, []).append(position)
+        # positions sorted by year, and their years, for bisect
+        self.__year_order = sorted(range(len(self.movies)),
+                                   key=lambda position: self.movies[position].year)
+        self.__years = [self.movies[position].year for position in self.__year_order]
 
     def get_movie(self, title: str, year: int = -1):
-        for movie in self.movies:
-            if year == -1:
-                if movie.title == title:
-                    return movie
+        if year == -1:
+            return self.__by_title.get(title)
+        return self.__by_title_year.get((title, year))
+
+    def by_genre(self, genre: str) -> List[Movie]:
+        """Return the movies in a genre, ignoring case, in catalog order."""
+        return [self.movies[position]
+                for position in self.__by_genre.get(genre.casefold(), [])]
+
+    def by_genres(self, *genres: str) -> List[Movie]:
+        """Return the movies in every one of the genres, in catalog order."""
+        if not genres:
+            return list(self.movies)
+        postings = sorted((self.__by_genre.get(g.casefold(), []) for g in genres), key=len)
+        # start from the smallest posting list, so the sets stay small
+        positions = set(postings[0])
+        for posting in postings[1:]:
+            positions.intersection_update(posting)
+        return [self.movies[position] for position in sorted(positions)]
+
+    def by_year_range(self, start: int, end: int) -> List[Movie]:
+        """Return the movies released from year start to year end, inclusive,
+        by year.
+        """
+        low = bisect_left(self.__years, start)
+        high = bisect_right(self.__years, end)
+        return [self.movies[position] for position in self.__year_order[low:high]]
+
+
+# what open_catalog() and get_catalog() return
+Catalog = Union[MovieCatalog, 'SnapshotCatalog']
+
+
+def open_catalog(filename: Optional[str] = None) -> Catalog:
+    """Load a catalog from a movie file, or map a snapshot of one (see
+    snapshot.py), whichever the file is.
+    """
+    # imported here, since snapshot.py imports this module
+    import snapshot
+
+    filename = filename or MOVIEFILE
+    with open(filename, 'rb') as f:
+        is_snapshot = f.read(len(snapshot.MAGIC)) == snapshot.MAGIC
+    if is_snapshot:
+        return snapshot.SnapshotCatalog(filename)
+    return MovieCatalog(filename)
+
 
-            elif movie.title == title and movie.year == year:
-                return movie
+# absolute path of a movie file -> ((mtime, size) when loaded, its catalog)
+_catalogs: Dict[str, Tuple[Tuple[int, int], Catalog]] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(filename: Optional[str] = None) -> Catalog:
+    """Return the shared catalog of a movie file (default MOVIEFILE) or
+    of a snapshot.
+
+    The file is loaded on first use, and loaded again only when its
+    modification time or size has changed, so callers can ask for the
+    catalog as often as they like.  Treat the catalog as read-only,
+    since it is shared.  A snapshot catalog that is replaced is closed,
+    so don't keep one after asking for its file again.
+    """
+    path = os.path.abspath(filename or MOVIEFILE)
+    # stat before loading: if the file changes while it is read, the
+    # next call sees a new stamp and loads it again
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _catalogs_lock:
+        loaded = _catalogs.get(path)
+        if loaded is None or loaded[0] != stamp:
+            old = loaded
+            loaded = _catalogs[path] = (stamp, open_catalog(path))
+            if old is not None and hasattr(old[1], 'close'):
+                old[1].close()
+        return loaded[1]
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from movie import Movie, MovieCatalog, get_catalog
+
+
+class MovieTest(unittest.TestCase):
+
+    def test_is_genre(self):
+        """is_genre ignores the case of the genre"""
+        m = Movie('Little Fish', 2020, ['Drama', 'Sci-fi'])
+        self.assertTrue(m.is_genre('sci-FI'))
+        self.assertTrue(m.is_genre('Drama'))
+        self.assertFalse(m.is_genre('Children'))
+
+    def test_genres_are_shared(self):
+        """movies with the same genres share one frozenset of them"""
+        first = Movie('Frozen', 2013, ['Animation', 'Children'])
+        second = Movie('Frozen II', 2019, ('Children', 'Animation'))
+        self.assertEqual(frozenset({'Animation', 'Children'}), first.genre)
+        self.assertIs(first.genre, second.genre)
+
+    def test_slots(self):
+        """movies have no __dict__, and their attributes are read-only"""
+        m = Movie('Frozen', 2013, ['Animation'])
+        self.assertFalse(hasattr(m, '__dict__'))
+        with self.assertRaises(AttributeError):
+            m.title = 'Frozen II'
+
+
+class MovieCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = MovieCatalog()
+
+    def test_get_movie(self):
+        """get_movie finds the first movie with a title, or with a title and year"""
+        self.assertEqual(2020, self.catalog.get_movie('Mulan').year)
+        self.assertEqual(1998, self.catalog.get_movie('Mulan', 1998).year)
+        self.assertIsNone(self.catalog.get_movie('Mulan', 1999))
+        self.assertIsNone(self.catalog.get_movie('No Such Movie'))
+
+    def test_by_genre(self):
+        """by_genre ignores case and keeps catalog order"""
+        movies = self.catalog.by_genre('CHILDREN')
+        self.assertEqual(12, len(movies))
+        self.assertTrue(all(m.is_genre('children') for m in movies))
+        self.assertEqual(movies, [m for m in self.catalog.movies if m in movies])
+        self.assertEqual([], self.catalog.by_genre('Opera'))
+
+    def test_by_genres(self):
+        """by_genres returns the movies in all of the genres"""
+        movies = self.catalog.by_genres('action', 'Crime')
+        self.assertEqual(['The Batman', 'Spectre'], [m.title for m in movies])
+        self.assertEqual([], self.catalog.by_genres('Action', 'Opera'))
+        self.assertEqual(self.catalog.movies, self.catalog.by_genres())
+
+    def test_by_year_range(self):
+        """by_year_range includes both ends and is sorted by year"""
+        movies = self.catalog.by_year_range(2015, 2020)
+        expected = [m for m in self.catalog.movies if 2015 <= m.year <= 2020]
+        self.assertCountEqual(expected, movies)
+        self.assertEqual(sorted(m.year for m in movies), [m.year for m in movies])
+        self.assertEqual([], self.catalog.by_year_range(2030, 2040))
+
+
+class SharedCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'movie.csv')
+        self.write('1,Frozen,2013,Animation|Children\n')
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def test_catalog_is_shared(self):
+        """get_catalog loads the file once and hands out the same catalog"""
+        catalog = get_catalog(self.path)
+        self.assertIs(catalog, get_catalog(self.path))
+        self.assertEqual(['Frozen'], [m.title for m in catalog.movies])
+
+    def test_catalog_reloads_when_file_changes(self):
+        catalog = get_catalog(self.path)
+        self.write('1,Frozen,2013,Animation|Children\n2,Spectre,2015,Action\n')
+        reloaded = get_catalog(self.path)
+        self.assertIsNot(catalog, reloaded)
+        self.assertEqual(2015, reloaded.get_movie('Spectre').year)
+
+    def test_default_file(self):
+        self.assertIs(get_catalog(), get_catalog('movie.csv'))
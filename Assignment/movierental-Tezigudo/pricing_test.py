@@ -1,10 +1,14 @@
 import unittest
+from datetime import date
 
 from customer import Customer
 from rental import Rental
 from movie import Movie
 from pricing import PriceCode
 
+# the movies from 2022 are new releases
+AS_OF = date(2022, 6, 1)
+
 
 class PricingTest(unittest.TestCase):
 
@@ -12,11 +16,11 @@ class PricingTest(unittest.TestCase):
 
         self.customer = Customer('Fred')
         self.movie0 = Movie('The Matrix', 1999, ['Action', 'Sci-Fi'])
-        self.rental0 = Rental(self.movie0, 3)
+        self.rental0 = Rental(self.movie0, 3, AS_OF)
         self.movie1 = Movie('Tom and Jerry', 2019, ['Children', 'Cartoon'])
-        self.rental1 = Rental(self.movie1, 3)
+        self.rental1 = Rental(self.movie1, 3, AS_OF)
         self.movie2 = Movie('The Godfather', 2022, ['Drama'])
-        self.rental2 = Rental(self.movie2, 3)
+        self.rental2 = Rental(self.movie2, 3, AS_OF)
 
     def test_regular_price(self) -> None:
         self.assertEqual(self.rental0.get_price(), 3.5)
@@ -1,4 +1,6 @@
-from datetime import datetime
+from datetime import date
+from typing import Optional
+
 from movie import Movie
 from pricing import PriceCode
 
@@ -12,23 +14,32 @@ class Rental:
     that the movie was rented and returned, from which the
     rental period is calculated.
     For simplicity of this application only days_rented is recorded.
+
+    The price code is decided once, when the rental is made, as of a
+    date (default: today), so a rental is billed the same however many
+    times it is priced, even if the year changes in between.
     """
+    # billing holds millions of rentals, so they have no __dict__
+    __slots__ = ('movie', 'days_rented', 'price_code')
+
     NEW_RELEASE = PriceCode.new_release
     REGULAR = PriceCode.regular
     CHILDRENS = PriceCode.childrens
 
-    def __init__(self, movie, days_rented):
+    def __init__(self, movie, days_rented, as_of: Optional[date] = None):
         """Initialize a new movie rental object for
-        a movie with known rental period (daysRented).
+        a movie with known rental period (daysRented),
+        priced as of a date (default: today).
         """
         self.movie = movie
         self.days_rented = days_rented
+        self.price_code = Rental.price_code_for_movie(movie, as_of)
 
     def get_price(self):
-        return Rental.price_code_for_movie(self.movie).get_price(self.days_rented)
+        return self.price_code.get_price(self.days_rented)
 
     def rental_points(self):
-        return Rental.price_code_for_movie(self.movie).get_rental_points(self.days_rented)
+        return self.price_code.get_rental_points(self.days_rented)
 
     def get_movie(self):
         return self.movie
@@ -37,8 +48,9 @@ class Rental:
         return self.days_rented
 
     @classmethod
-    def price_code_for_movie(cls, movie: Movie) -> PriceCode:
-        if movie.year == datetime.now().year:
+    def price_code_for_movie(cls, movie: Movie, as_of: Optional[date] = None) -> PriceCode:
+        """The price code of a movie as of a date (default: today)."""
+        if movie.year == (as_of or date.today()).year:
             return cls.NEW_RELEASE
         if 'Children' in movie.genre or 'Childrens' in movie.genre:
             return cls.CHILDRENS
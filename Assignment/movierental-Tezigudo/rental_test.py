@@ -1,8 +1,12 @@
 import unittest
+from datetime import date
 from rental import Rental
 from pricing import PriceCode
 from movie import Movie
 
+# the movies from 2022 are new releases
+AS_OF = date(2022, 6, 1)
+
 
 class RentalTest(unittest.TestCase):
     def setUp(self):
@@ -16,15 +20,36 @@ class RentalTest(unittest.TestCase):
         self.assertEqual("CitizenFour", m.get_title())
         self.assertEqual(PriceCode.regular, Rental.price_code_for_movie(m))
 
+    def test_price_code_as_of(self):
+        """a movie is a new release only in the year it came out"""
+        self.assertEqual(PriceCode.new_release,
+                         Rental.price_code_for_movie(self.new_movie, date(2022, 12, 31)))
+        self.assertEqual(PriceCode.regular,
+                         Rental.price_code_for_movie(self.new_movie, date(2023, 1, 1)))
+        self.assertEqual(PriceCode.childrens,
+                         Rental.price_code_for_movie(self.childrens_movie, AS_OF))
+
+    def test_price_code_is_kept(self):
+        """a rental keeps the price code it was made with"""
+        rental = Rental(self.new_movie, 2, date(2022, 12, 31))
+        self.assertEqual(PriceCode.new_release, rental.price_code)
+        self.assertEqual(6.0, rental.get_price())
+        self.assertEqual(2, rental.rental_points())
+
+    def test_rental_has_no_dict(self):
+        """rentals use __slots__, so they have no __dict__"""
+        rental = Rental(self.regular_movie, 3, AS_OF)
+        self.assertFalse(hasattr(rental, '__dict__'))
+        self.assertEqual(3, rental.get_days_rented())
 
     def test_rental_price(self):
         """test get_price() for a rental"""
-        rental_new_one_day = Rental(self.new_movie, 1)
-        rental_new_five_day = Rental(self.new_movie, 5)
-        rental_child_one_day = Rental(self.childrens_movie, 1)
-        rental_child_five_day = Rental(self.childrens_movie, 5)
-        rental_regular_one_day = Rental(self.regular_movie, 1)
-        rental_regular_five_day = Rental(self.regular_movie, 5)
+        rental_new_one_day = Rental(self.new_movie, 1, AS_OF)
+        rental_new_five_day = Rental(self.new_movie, 5, AS_OF)
+        rental_child_one_day = Rental(self.childrens_movie, 1, AS_OF)
+        rental_child_five_day = Rental(self.childrens_movie, 5, AS_OF)
+        rental_regular_one_day = Rental(self.regular_movie, 1, AS_OF)
+        rental_regular_five_day = Rental(self.regular_movie, 5, AS_OF)
 
         self.assertEqual(rental_new_one_day.get_price(), 3.0)
         self.assertEqual(rental_new_five_day.get_price(), 15.0)
@@ -35,9 +60,9 @@ class RentalTest(unittest.TestCase):
 
     def test_rental_points(self):
         """test rental_points() for a rental"""
-        rental_new_five_day = Rental(self.new_movie, 5)
-        rental_child_five_day = Rental(self.childrens_movie, 5)
-        rental_regular_five_day = Rental(self.regular_movie, 5)
+        rental_new_five_day = Rental(self.new_movie, 5, AS_OF)
+        rental_child_five_day = Rental(self.childrens_movie, 5, AS_OF)
+        rental_regular_five_day = Rental(self.regular_movie, 5, AS_OF)
 
         self.assertEqual(rental_new_five_day.rental_points(), 5)
         self.assertEqual(rental_child_five_day.rental_points(), 1)
@@ -0,0 +1,261 @@
+"""Binary snapshots of a movie catalog.
+
+A snapshot holds the movies of a movie file laid out so that it can be
+memory-mapped and used without parsing.  After a header, it has these
+sections, each an array of integers or bytes starting at a multiple of 8:
+
+    genre names       offsets into a UTF-8 string table of the distinct
+                      genres; a genre id is an index into it
+    years             a 16 bit year per movie
+    genres            per movie, offsets into an array of genre ids
+    titles            per movie, offsets into a UTF-8 string table
+    title order       movie positions sorted by title
+    year order        movie positions sorted by year
+    genre postings    for each genre id, offsets into an array of the
+                      positions of its movies
+
+The arrays are read in place with memoryview.cast(), so loading a
+snapshot only reads the header and the genre names, and the OS reads the
+rest of the file as it is used.  SnapshotCatalog has the queries of
+MovieCatalog, and makes a Movie for a position only when it is asked
+for.  Integers are in the byte order of the machine that wrote the
+snapshot.
+
+    python snapshot.py movie.csv movie.snap
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from typing import Dict, Iterable, List, Sequence as SequenceType, Tuple
+
+from movie import Movie, read_movie_rows
+
+MAGIC = b'MOVSNAP1'
+
+# magic, byte order mark, movies, genres, genre references, postings,
+# bytes of genre names, bytes of titles
+HEADER = struct.Struct('=8s7I')
+
+BYTE_ORDER_MARK = 0x01020304
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _strings(strings: Iterable[bytes]) -> Tuple[array, bytes]:
+    """An offsets array and a string table of strings."""
+    offsets = array('I', [0])
+    table = bytearray()
+    for string in strings:
+        table += string
+        offsets.append(len(table))
+    return offsets, bytes(table)
+
+
+def write_snapshot(rows: Iterable[Tuple[str, int, SequenceType[str]]], filename: str) -> int:
+    """Write a snapshot of movies, given as (title, year, genres).
+
+    :returns: the number of movies written
+    """
+    genre_ids: Dict[str, int] = {}
+    years = array('h')
+    genre_offsets = array('I', [0])
+    genre_refs = array('H')
+    titles = []
+    for title, year, genres in rows:
+        titles.append(title.encode())
+        years.append(year)
+        genre_refs.extend(genre_ids.setdefault(genre, len(genre_ids)) for genre in genres)
+        genre_offsets.append(len(genre_refs))
+    count = len(years)
+
+    postings: List[List[int]] = [[] for _ in genre_ids]
+    for position in range(count):
+        refs = genre_refs[genre_offsets[position]:genre_offsets[position + 1]]
+        for genre_id in sorted(set(refs)):
+            postings[genre_id].append(position)
+    posting_offsets = array('I', [0])
+    positions = array('I')
+    for posting in postings:
+        positions.extend(posting)
+        posting_offsets.append(len(positions))
+
+    name_offsets, names = _strings(name.encode() for name in genre_ids)
+    title_offsets, title_table = _strings(titles)
+    # sorted() is stable, so the first movie with a title comes first
+    title_order = array('I', sorted(range(count), key=titles.__getitem__))
+    year_order = array('I', sorted(range(count), key=years.__getitem__))
+
+    header = HEADER.pack(MAGIC, BYTE_ORDER_MARK, count, len(genre_ids), len(genre_refs),
+                         len(positions), len(names), len(title_table))
+    sections = [name_offsets, names, years, genre_offsets, genre_refs, title_offsets,
+                title_table, title_order, year_order, posting_offsets, positions]
+    # truncating a file that is mapped would break the catalogs using it
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)),
+                                prefix='.snapshot-')
+    try:
+        with open(fd, 'wb') as f:
+            f.write(header)
+            f.write(bytes(_aligned(len(header)) - len(header)))
+            for section in sections:
+                data = section.tobytes() if isinstance(section, array) else section
+                f.write(data)
+                f.write(bytes(_aligned(len(data)) - len(data)))
+        os.replace(temp, filename)
+    except BaseException:
+        os.unlink(temp)
+        raise
+    return count
+
+
+class _Movies(Sequence):
+    """The movies of a snapshot, made when they are asked for."""
+
+    def __init__(self, catalog: 'SnapshotCatalog') -> None:
+        self.__catalog = catalog
+
+    def __len__(self) -> int:
+        return self.__catalog.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__catalog.movie(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('movie index out of range')
+        return self.__catalog.movie(index)
+
+
+class SnapshotCatalog:
+    """
+    A catalog read from a memory-mapped snapshot, with the same queries as
+    MovieCatalog.  While a Movie from it is in use, asking for the same
+    movie again returns the same object.  After close(), the movies made
+    can still be used, but the catalog can't.
+    """
+
+    def __init__(self, filename: str) -> None:
+        with open(filename, 'rb') as f:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = self.__view = memoryview(self.__map)
+        (magic, mark, self.count, genres, refs, postings,
+         name_bytes, title_bytes) = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'{filename} is not a movie snapshot')
+        if mark != BYTE_ORDER_MARK:
+            raise ValueError(f'{filename} was written with another byte order')
+        offset = _aligned(HEADER.size)
+
+        def section(fmt: str, length: int) -> memoryview:
+            nonlocal offset
+            size = length * struct.calcsize(fmt)
+            data = view[offset:offset + size].cast(fmt)
+            offset += _aligned(size)
+            sections.append(data)
+            return data
+
+        # the views of the map, which close() releases
+        sections = self.__sections = []
+
+        name_offsets = section('I', genres + 1)
+        names = section('B', name_bytes)
+        self.__years = section('h', self.count)
+        self.__genre_offsets = section('I', self.count + 1)
+        self.__genre_refs = section('H', refs)
+        self.__title_offsets = section('I', self.count + 1)
+        self.__titles = section('B', title_bytes)
+        self.__title_order = section('I', self.count)
+        self.__year_order = section('I', self.count)
+        self.__posting_offsets = section('I', genres + 1)
+        self.__postings = section('I', postings)
+
+        # interned, so every movie shares the same genre strings
+        self.__genre_names = tuple(
+            sys.intern(bytes(names[name_offsets[i]:name_offsets[i + 1]]).decode())
+            for i in range(genres))
+        # case-folded genre -> ids of the genres that fold to it
+        self.__genre_ids: Dict[str, List[int]] = {}
+        for genre_id, name in enumerate(self.__genre_names):
+            self.__genre_ids.setdefault(name.casefold(), []).append(genre_id)
+        self.__made = weakref.WeakValueDictionary()
+        self.movies = _Movies(self)
+
+    def close(self) -> None:
+        """Unmap the snapshot."""
+        for section in self.__sections:
+            section.release()
+        self.__view.release()
+        self.__map.close()
+
+    def __title(self, position: int) -> bytes:
+        return bytes(self.__titles[self.__title_offsets[position]:
+                                   self.__title_offsets[position + 1]])
+
+    def movie(self, position: int) -> Movie:
+        """Return the movie at a position in the catalog."""
+        movie = self.__made.get(position)
+        if movie is None:
+            refs = self.__genre_refs[self.__genre_offsets[position]:
+                                     self.__genre_offsets[position + 1]]
+            movie = Movie(self.__title(position).decode(), self.__years[position],
+                          [self.__genre_names[genre_id] for genre_id in refs])
+            self.__made[position] = movie
+        return movie
+
+    def __posting(self, genre_id: int) -> memoryview:
+        return self.__postings[self.__posting_offsets[genre_id]:
+                               self.__posting_offsets[genre_id + 1]]
+
+    def __positions(self, genre: str) -> List[int]:
+        """Positions of the movies in a genre, ignoring case, in order."""
+        genre_ids = self.__genre_ids.get(genre.casefold(), [])
+        if len(genre_ids) == 1:
+            return list(self.__posting(genre_ids[0]))
+        return sorted({p for genre_id in genre_ids for p in self.__posting(genre_id)})
+
+    def get_movie(self, title: str, year: int = -1):
+        key = title.encode()
+        start = bisect_left(self.__title_order, key, key=self.__title)
+        for position in self.__title_order[start:]:
+            if self.__title(position) != key:
+                break
+            if year == -1 or self.__years[position] == year:
+                return self.movie(position)
+        return None
+
+    def by_genre(self, genre: str) -> List[Movie]:
+        """Return the movies in a genre, ignoring case, in catalog order."""
+        return [self.movie(position) for position in self.__positions(genre)]
+
+    def by_genres(self, *genres: str) -> List[Movie]:
+        """Return the movies in every one of the genres, in catalog order."""
+        if not genres:
+            return list(self.movies)
+        postings = sorted((self.__positions(genre) for genre in genres), key=len)
+        positions = set(postings[0])
+        for posting in postings[1:]:
+            positions.intersection_update(posting)
+        return [self.movie(position) for position in sorted(positions)]
+
+    def by_year_range(self, start: int, end: int) -> List[Movie]:
+        """Return the movies released from year start to year end, inclusive,
+        by year.
+        """
+        low = bisect_left(self.__year_order, start, key=self.__years.__getitem__)
+        high = bisect_right(self.__year_order, end, key=self.__years.__getitem__)
+        return [self.movie(position) for position in self.__year_order[low:high]]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(f'usage: {sys.argv[0]} MOVIEFILE SNAPSHOT')
+    written = write_snapshot(read_movie_rows(sys.argv[1]), sys.argv[2])
+    print(f'wrote {written} movies to {sys.argv[2]}')
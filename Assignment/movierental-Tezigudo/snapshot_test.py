@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from movie import MovieCatalog, get_catalog, open_catalog, read_movie_rows
+from snapshot import SnapshotCatalog, write_snapshot
+
+
+def describe(movies):
+    return [(m.title, m.year, m.genre) for m in movies]
+
+
+class SnapshotTest(unittest.TestCase):
+    """A snapshot of movie.csv answers queries as the catalog of movie.csv does"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'movie.snap')
+        self.assertEqual(57, write_snapshot(read_movie_rows('movie.csv'), self.path))
+        self.catalog = MovieCatalog()
+        self.snapshot = SnapshotCatalog(self.path)
+        self.addCleanup(self.snapshot.close)
+
+    def test_movies(self):
+        self.assertEqual(describe(self.catalog.movies), describe(self.snapshot.movies))
+        self.assertEqual('Cinderella', self.snapshot.movies[-1].title)
+        self.assertEqual(describe(self.catalog.movies[2:5]), describe(self.snapshot.movies[2:5]))
+        with self.assertRaises(IndexError):
+            self.snapshot.movies[57]
+
+    def test_get_movie(self):
+        for title, year in [('Mulan', -1), ('Mulan', 1998), ('Mulan', 1999), ('Nope', -1)]:
+            expected = self.catalog.get_movie(title, year)
+            movie = self.snapshot.get_movie(title, year)
+            self.assertEqual(expected and (expected.title, expected.year),
+                             movie and (movie.title, movie.year))
+
+    def test_same_movie_while_in_use(self):
+        movie = self.snapshot.get_movie('Frozen')
+        self.assertIs(movie, self.snapshot.get_movie('Frozen'))
+
+    def test_genres_are_shared(self):
+        first, second = self.snapshot.by_genre('drama')[:2]
+        self.assertIs(next(g for g in first.genre if g == 'Drama'),
+                      next(g for g in second.genre if g == 'Drama'))
+
+    def test_queries(self):
+        for genre in ['children', 'SCI-FI', 'Drama', 'Opera']:
+            self.assertEqual(describe(self.catalog.by_genre(genre)),
+                             describe(self.snapshot.by_genre(genre)))
+        self.assertEqual(describe(self.catalog.by_genres('action', 'crime')),
+                         describe(self.snapshot.by_genres('action', 'crime')))
+        self.assertEqual(describe(self.catalog.by_year_range(2000, 2019)),
+                         describe(self.snapshot.by_year_range(2000, 2019)))
+
+    def test_open_catalog(self):
+        """open_catalog and get_catalog map a snapshot, and load a movie file"""
+        self.assertIsInstance(open_catalog(self.path), SnapshotCatalog)
+        self.assertIsInstance(get_catalog(self.path), SnapshotCatalog)
+        self.assertIsInstance(open_catalog('movie.csv'), MovieCatalog)
+
+    def test_not_a_snapshot(self):
+        with self.assertRaises(ValueError):
+            SnapshotCatalog('movie.csv')
+
+    def test_rewrite_while_mapped(self):
+        """writing a snapshot replaces the file, so a catalog of the old one still works"""
+        expected = describe(self.snapshot.movies)
+        write_snapshot([('Only', 2020, ['Drama'])], self.path)
+        self.assertEqual(expected, describe(self.snapshot.movies))
+        # and the temporary file is gone
+        self.assertEqual(['movie.snap'], os.listdir(os.path.dirname(self.path)))
+
+    def test_get_catalog_closes_replaced_snapshot(self):
+        old = get_catalog(self.path)
+        movie = old.movies[0]
+        write_snapshot([('Only', 2020, ['Drama'])], self.path)
+        # a different size, so get_catalog sees the change
+        new = get_catalog(self.path)
+        self.assertEqual(['Only'], [m.title for m in new.movies])
+        self.assertEqual('The Batman', movie.title)
+        with self.assertRaises(ValueError):
+            old.by_genre('drama')
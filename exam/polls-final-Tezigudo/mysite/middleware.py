@@ -0,0 +1,175 @@
+"""Per-request timing and SQL instrumentation.
+
+RequestMetricsMiddleware records, for a sample of requests, the view
+that handled it, wall time, number of queries, total time spent in the
+database, and queries that were run many times with different
+parameters (the sign of an N+1 query).  The records are kept in a ring
+buffer, which can be read as JSON at /debug/requests/ from an address in
+INTERNAL_IPS, and are written to the "mysite.metrics" logger.  Slow
+requests and requests with repeated queries are logged as warnings.
+
+Settings (read from .env by settings.py):
+    REQUEST_METRICS_SAMPLE_RATE  fraction of requests recorded, 0 to 1
+    REQUEST_METRICS_SLOW_MS      requests at least this slow are warnings
+    REQUEST_METRICS_DUPLICATES   a query run this many times is a warning
+    REQUEST_METRICS_BUFFER_SIZE  number of recent records kept
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, JsonResponse
+
+logger = logging.getLogger("mysite.metrics")
+
+_buffer = deque(maxlen=200)
+_buffer_lock = threading.Lock()
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts and times queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            # the sql has placeholders for parameters, so the same
+            # query with different values has the same signature
+            self.signatures[sql] += 1
+
+    def duplicates(self, threshold: int):
+        """Signatures of queries run at least threshold times, most frequent first."""
+        return [
+            {"sql": sql, "count": count}
+            for sql, count in self.signatures.most_common()
+            if count >= threshold
+        ]
+
+
+def _sampled() -> bool:
+    sample_rate = getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 0.0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _install(stack: ExitStack, recorder: QueryRecorder):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(recorder))
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not _sampled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            _install(stack, recorder)
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        self.record(request, response, elapsed, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if not _sampled():
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # database connections belong to a thread, and the queries of an
+        # async request run in its thread-sensitive sync thread, so the
+        # recorder is installed there
+        with ExitStack() as stack:
+            await sync_to_async(_install)(stack, recorder)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        elapsed = time.perf_counter() - start
+        self.record(request, response, elapsed, recorder)
+        return response
+
+    @staticmethod
+    def record(request, response, elapsed, recorder):
+        match = request.resolver_match
+        duplicates = recorder.duplicates(
+            getattr(settings, "REQUEST_METRICS_DUPLICATES", 5)
+        )
+        entry = {
+            "time": time.time(),
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "wall_ms": round(elapsed * 1000, 3),
+            "queries": recorder.count,
+            "db_ms": round(recorder.seconds * 1000, 3),
+            "duplicate_queries": duplicates,
+        }
+        with _buffer_lock:
+            size = getattr(settings, "REQUEST_METRICS_BUFFER_SIZE", 200)
+            if _buffer.maxlen != size:
+                _resize_buffer(size)
+            _buffer.append(entry)
+        slow = entry["wall_ms"] >= getattr(settings, "REQUEST_METRICS_SLOW_MS", 500)
+        level = logging.WARNING if slow or duplicates else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(entry))
+
+
+def _resize_buffer(size):
+    global _buffer
+    _buffer = deque(_buffer, maxlen=size)
+
+
+def recent_requests():
+    """Return the recorded requests, oldest first."""
+    with _buffer_lock:
+        return list(_buffer)
+
+
+def clear_requests():
+    with _buffer_lock:
+        _buffer.clear()
+
+
+def request_metrics(request):
+    """Show the recorded requests as JSON. Only for INTERNAL_IPS."""
+    if request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS:
+        raise Http404()
+    # imported here so this module has no dependency on the polls app
+    from polls import ratelimit, results_cache
+
+    return JsonResponse(
+        {
+            "requests": recent_requests(),
+            "results_cache": results_cache.stats(),
+            "rate_limit": ratelimit.stats(),
+        }
+    )
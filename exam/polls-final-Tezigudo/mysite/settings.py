@@ -38,8 +38,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it also measures the other middleware
+    "mysite.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    # after the session middleware, which saves what it puts in the session
+    "polls.routers.ReplicaPinMiddleware",
     "django.middleware.common.CommonMiddleware",
     # removed to enable voting via web service
     #'django.middleware.csrf.CsrfViewMiddleware',
@@ -50,6 +54,19 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "mysite.urls"
 
+# Addresses allowed to read the request metrics at /debug/requests/
+INTERNAL_IPS = config("INTERNAL_IPS", default="127.0.0.1,::1", cast=Csv())
+
+# Request metrics (see mysite/middleware.py).
+# Fraction of requests to record, from 0 (off) to 1 (every request).
+REQUEST_METRICS_SAMPLE_RATE = config("REQUEST_METRICS_SAMPLE_RATE", default=0.1, cast=float)
+# Requests taking at least this many milliseconds are logged as warnings.
+REQUEST_METRICS_SLOW_MS = config("REQUEST_METRICS_SLOW_MS", default=500, cast=float)
+# A query run this many times in one request is logged as a warning.
+REQUEST_METRICS_DUPLICATES = config("REQUEST_METRICS_DUPLICATES", default=5, cast=int)
+# Number of recent requests kept for /debug/requests/
+REQUEST_METRICS_BUFFER_SIZE = config("REQUEST_METRICS_BUFFER_SIZE", default=200, cast=int)
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -75,6 +92,108 @@ DATABASES = {
     }
 }
 
+# SQLite production profile (see mysite/sqlite3/base.py). Set
+# SQLITE_PRODUCTION = True for WAL mode, tuned pragmas, transactions that
+# take the write lock when they begin, and persistent connections.
+SQLITE_PRODUCTION = config("SQLITE_PRODUCTION", default=False, cast=bool)
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    # milliseconds a writer waits for the lock before it fails
+    "busy_timeout": config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),
+    "mmap_size": config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+    # negative means KiB instead of pages
+    "cache_size": config("SQLITE_CACHE_SIZE", default=-64 * 1024, cast=int),
+    "temp_store": "memory",
+}
+if SQLITE_PRODUCTION:
+    DATABASES["default"].update(
+        ENGINE="mysite.sqlite3",
+        # seconds to keep a connection open between requests
+        CONN_MAX_AGE=config("CONN_MAX_AGE", default=600, cast=int),
+        CONN_HEALTH_CHECKS=True,
+    )
+
+# Read replicas of the default database (see polls/routers.py).
+# Comma separated database names, such as SQLite files kept in sync
+# with the primary by replication. Each gets the other settings of the
+# default database and the alias replica1, replica2, ...
+DATABASE_REPLICAS = config("DATABASE_REPLICAS", default="", cast=Csv())
+DATABASE_REPLICA_ALIASES = []
+for number, name in enumerate(DATABASE_REPLICAS, start=1):
+    alias = f"replica{number}"
+    # tests read the test primary through the replica aliases
+    DATABASES[alias] = dict(DATABASES["default"], NAME=name, TEST={"MIRROR": "default"})
+    DATABASE_REPLICA_ALIASES.append(alias)
+# Seconds that a session reads from the primary after it writes, so a
+# voter sees their own vote. Should be more than the replication lag.
+DATABASE_REPLICA_STICKY_SECONDS = config(
+    "DATABASE_REPLICA_STICKY_SECONDS", default=5, cast=float
+)
+DATABASE_ROUTERS = ["polls.routers.ReplicaRouter"]
+
+# Use the async poll views (polls/async_views.py). Set to True when
+# serving mysite.asgi with an ASGI server such as uvicorn or daphne.
+POLLS_ASYNC_VIEWS = config("POLLS_ASYNC_VIEWS", default=False, cast=bool)
+
+# Number of polls on each page of the poll index.
+POLLS_INDEX_PAGE_SIZE = config("POLLS_INDEX_PAGE_SIZE", default=20, cast=int)
+
+# Maximum number of votes in one request to the voting web service.
+POLLS_API_MAX_VOTES = config("POLLS_API_MAX_VOTES", default=1000, cast=int)
+
+# Cache used for poll results. Local memory by default; set CACHE_BACKEND
+# and CACHE_LOCATION to use a shared cache such as Redis or Memcached.
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default="polls"),
+    }
+}
+
+# Seconds to keep cached poll results.
+POLLS_RESULTS_CACHE_TIMEOUT = config("POLLS_RESULTS_CACHE_TIMEOUT", default=300, cast=int)
+# Seconds that results may be out of date after a vote. 0 means never.
+POLLS_RESULTS_STALE_SECONDS = config("POLLS_RESULTS_STALE_SECONDS", default=0, cast=float)
+
+# Seconds to keep whole index and detail pages cached for anonymous
+# users (see polls/page_cache.py). 0 turns off page caching.
+POLLS_PAGE_CACHE_TIMEOUT = config("POLLS_PAGE_CACHE_TIMEOUT", default=60, cast=int)
+
+# Rate limit of the vote views (see polls/ratelimit.py): each user and
+# each IP address can make BURST requests at once, and RATE more per
+# second after that. A BURST or RATE of 0 turns off rate limiting.
+POLLS_RATE_LIMIT_BURST = config("POLLS_RATE_LIMIT_BURST", default=20, cast=int)
+POLLS_RATE_LIMIT_RATE = config("POLLS_RATE_LIMIT_RATE", default=1.0, cast=float)
+POLLS_RATE_LIMIT_CACHE = config("POLLS_RATE_LIMIT_CACHE", default="default")
+# META key of the header a trusted reverse proxy puts the client address
+# in, e.g. HTTP_X_FORWARDED_FOR. Empty means REMOTE_ADDR.
+POLLS_RATE_LIMIT_IP_HEADER = config("POLLS_RATE_LIMIT_IP_HEADER", default="")
+# Whether logged in users are also limited by their IP address.
+POLLS_RATE_LIMIT_BY_IP = config("POLLS_RATE_LIMIT_BY_IP", default=True, cast=bool)
+
+# Live results (see polls/live.py).
+# Seconds between frames of vote counts sent to watchers of a poll.
+POLLS_LIVE_INTERVAL = config("POLLS_LIVE_INTERVAL", default=1.0, cast=float)
+# Seconds before a live results stream ends and the browser reconnects.
+POLLS_LIVE_STREAM_SECONDS = config("POLLS_LIVE_STREAM_SECONDS", default=300, cast=float)
+# Seconds between keepalive comments in a live results stream.
+POLLS_LIVE_KEEPALIVE = config("POLLS_LIVE_KEEPALIVE", default=15, cast=float)
+# Seconds a long poll for live results waits for new counts.
+POLLS_LIVE_POLL_TIMEOUT = config("POLLS_LIVE_POLL_TIMEOUT", default=25, cast=float)
+
+# Write-behind vote ingestion (see polls/vote_queue.py).
+# When enabled, votes are queued in memory and written in batches
+# by a background thread, every INTERVAL seconds or when BATCH_SIZE
+# votes are waiting. JOURNAL is an optional file (one per process) where
+# queued votes are also appended, for recovery with `manage.py flush_votes`.
+POLLS_VOTE_QUEUE = config("POLLS_VOTE_QUEUE", default=False, cast=bool)
+POLLS_VOTE_QUEUE_BATCH_SIZE = config("POLLS_VOTE_QUEUE_BATCH_SIZE", default=500, cast=int)
+POLLS_VOTE_QUEUE_INTERVAL = config("POLLS_VOTE_QUEUE_INTERVAL", default=1.0, cast=float)
+POLLS_VOTE_QUEUE_JOURNAL = config("POLLS_VOTE_QUEUE_JOURNAL", default="")
+
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 LOGIN_REDIRECT_URL = "/polls/"
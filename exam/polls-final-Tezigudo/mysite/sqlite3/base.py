@@ -0,0 +1,36 @@
+"""SQLite database backend for the production profile.
+
+Enable it with SQLITE_PRODUCTION = True in .env, which also keeps
+connections open between requests (CONN_MAX_AGE).  It differs from
+Django's SQLite backend in two ways:
+
+* When a connection is opened, the SQLITE_PRAGMAS setting is applied
+  with a connection_created signal handler: WAL journal mode, so readers
+  don't block the writer and the writer doesn't block readers,
+  synchronous=NORMAL, which is safe with WAL, a busy timeout, so a
+  writer waits for the lock instead of failing, and the mmap and page
+  cache sizes.
+* Transactions begin with BEGIN IMMEDIATE, so they take the write lock
+  when they start.  A transaction that reads and then writes, such as a
+  vote, would otherwise fail with "database is locked" at once, without
+  waiting, if another connection wrote since it read.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.dispatch import receiver
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
+
+
+@receiver(connection_created, sender=DatabaseWrapper)
+def set_pragmas(sender, connection, **kwargs):
+    if connection.is_in_memory_db():
+        # WAL and mmap don't apply to in-memory databases
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
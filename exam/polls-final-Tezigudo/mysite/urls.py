@@ -18,10 +18,13 @@ from django.http import HttpResponseRedirect
 from django.urls import include, path, reverse
 from django.views.generic import RedirectView
 
+from mysite.middleware import request_metrics
+
 
 urlpatterns = [
     path("polls/", include("polls.urls")),
     path("admin/", admin.site.urls),
+    path("debug/requests/", request_metrics, name="request_metrics"),
     path("accounts/", include("django.contrib.auth.urls")),
     path("", RedirectView.as_view(url="/polls/"), name="site_index"),
 ]
@@ -6,17 +6,47 @@ from .models import Choice, Question
 class ChoiceInline(admin.TabularInline):
     model = Choice
     extra = 3
+    # the stored counter, so showing it needs no query per choice
+    readonly_fields = ["votes"]
 
 
 class QuestionAdmin(admin.ModelAdmin):
     fieldsets = [
         (None, {"fields": ["question_text"]}),
-        ("Date information", {"fields": ["pub_date"], "classes": ["collapse"]}),
+        ("Date information", {"fields": ["pub_date", "end_date"], "classes": ["collapse"]}),
     ]
     inlines = [ChoiceInline]
-    list_display = ("question_text", "pub_date", "was_published_recently")
+    list_display = (
+        "question_text",
+        "pub_date",
+        "end_date",
+        "was_published_recently",
+        "vote_total",
+        "choice_count",
+    )
     list_filter = ["pub_date"]
     search_fields = ["question_text"]
+    search_help_text = "Questions that start with the text, ignoring case."
+
+    def get_queryset(self, request):
+        # the totals and counts come with the page of questions, instead of
+        # Question.total_votes doing a query for each row
+        return super().get_queryset(request).with_choice_stats()
+
+    def get_search_results(self, request, queryset, search_term):
+        """Prefix search, which uses the index on lower(question_text)."""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.text_startswith(search_term), False
+
+    @admin.display(description="Votes", ordering="vote_total")
+    def vote_total(self, question):
+        return question.vote_total
+
+    @admin.display(description="Choices", ordering="choice_count")
+    def choice_count(self, question):
+        return question.choice_count
 
 
 admin.site.register(Question, QuestionAdmin)
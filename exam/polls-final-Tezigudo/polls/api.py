@@ -0,0 +1,106 @@
+"""JSON web service for voting.
+
+POST /polls/api/votes/ with a JSON body such as
+
+    {"votes": [{"question": 1, "choice": 3}, {"question": 2, "choice": null}]}
+
+casts or changes the user's vote for each question, or removes it if the
+choice is null.  All votes in a request are written in one transaction
+with bulk queries.  The response has the status of each vote, in the
+same order:
+
+    {"results": [{"question": 1, "choice": 3, "status": "created"}, ...]}
+
+The status is one of the statuses of voting.apply_votes(), or
+"question_not_found", "voting_closed", "invalid" (the item is not a
+question id and a choice id or null; an item without a choice is
+invalid, rather than removing the vote), or "superseded" (a later item
+in the same request is for the same question).
+"""
+import json
+
+from django.conf import settings
+from django.http import HttpRequest, JsonResponse
+from django.views.decorators.http import require_POST
+
+from .models import Question
+from .ratelimit import rate_limited
+from .routers import primary_db
+from .voting import apply_votes
+
+QUESTION_NOT_FOUND = "question_not_found"
+VOTING_CLOSED = "voting_closed"
+INVALID = "invalid"
+SUPERSEDED = "superseded"
+
+
+def _parse_item(item):
+    """Return (question_id, choice_id) of a vote item, or None if invalid."""
+    # a missing choice is a mistake, not a request to remove the vote
+    if not isinstance(item, dict) or "choice" not in item:
+        return None
+    question_id, choice_id = item.get("question"), item.get("choice")
+    if not isinstance(question_id, int) or isinstance(question_id, bool):
+        return None
+    if choice_id is not None and (
+        not isinstance(choice_id, int) or isinstance(choice_id, bool)
+    ):
+        return None
+    return question_id, choice_id
+
+
+@require_POST
+@rate_limited
+@primary_db
+def votes(request: HttpRequest) -> JsonResponse:
+    """Cast, change or remove the user's votes on many questions."""
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    try:
+        items = json.loads(request.body)["votes"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": 'Expected JSON {"votes": [...]}'}, status=400)
+    if not isinstance(items, list):
+        return JsonResponse({"error": '"votes" must be a list'}, status=400)
+    max_votes = getattr(settings, "POLLS_API_MAX_VOTES", 1000)
+    if len(items) > max_votes:
+        return JsonResponse(
+            {"error": f"At most {max_votes} votes per request"}, status=400
+        )
+
+    parsed = [_parse_item(item) for item in items]
+    question_ids = {vote[0] for vote in parsed if vote}
+    questions = Question.objects.published().in_bulk(question_ids)
+
+    statuses = [None] * len(parsed)
+    batch = {}
+    position = {}
+    for index, vote in enumerate(parsed):
+        if vote is None:
+            statuses[index] = INVALID
+            continue
+        question_id, choice_id = vote
+        question = questions.get(question_id)
+        if question is None:
+            statuses[index] = QUESTION_NOT_FOUND
+        elif not question.can_vote():
+            statuses[index] = VOTING_CLOSED
+        else:
+            key = (request.user.id, question_id)
+            if key in position:
+                statuses[position[key]] = SUPERSEDED
+            batch[key] = choice_id
+            position[key] = index
+
+    for key, status in apply_votes(batch).items():
+        statuses[position[key]] = status
+
+    results = [
+        {
+            "question": vote[0] if vote else None,
+            "choice": vote[1] if vote else None,
+            "status": status,
+        }
+        for vote, status in zip(parsed, statuses)
+    ]
+    return JsonResponse({"results": results})
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class PollsConfig(AppConfig):
     name = "polls"
+
+    def ready(self):
+        # connect the signal handlers that invalidate cached results
+        # and pages, and publish live results
+        from . import live, page_cache, results_cache, schedule  # noqa: F401
@@ -0,0 +1,203 @@
+"""Async versions of the poll views, for ASGI servers.
+
+Under ASGI these views wait for the database and for the client without
+holding a thread, so many slow clients don't tie up the worker threads.
+They read with the async ORM methods (``aget``, ``afirst``, async
+iteration) and write votes with apply_votes(), which runs in a thread
+because transactions are not async in Django 4.2.  They return the same
+pages and redirects as the views in views.py.
+
+They are used instead of the sync views when POLLS_ASYNC_VIEWS is True,
+which is how mysite/asgi.py is meant to be deployed.  Under WSGI, Django
+runs each async view in its own event loop, which is slower.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    HttpResponseNotFound,
+    HttpResponseRedirect,
+)
+from django.shortcuts import render
+from django.urls import reverse
+from django.views import View
+
+from . import live, page_cache, results_cache, schedule, vote_queue, voting
+from .models import Question, Vote
+from .pagination import KeysetPaginator
+from .ratelimit import rate_limited
+from .routers import primary_db
+from .views import get_queued_choice
+
+
+async def get_user(request: HttpRequest):
+    """Load the user of a request.
+
+    Loading the user reads the session from the database, which can't be
+    done in async code, so it is done here in a thread.  After that the
+    user and the session can be used by templates and views.
+    """
+    def load():
+        request.user.is_authenticated
+        return request.user
+
+    return await sync_to_async(load)()
+
+
+async def get_question(queryset, **kwargs) -> Question:
+    """Async version of get_object_or_404() for questions."""
+    try:
+        return await queryset.aget(**kwargs)
+    except Question.DoesNotExist:
+        raise Http404("No poll question matches the given query.")
+
+
+async def adetail_context(question: Question, selected_choice=None) -> dict:
+    """Async version of views.detail_context()."""
+    return {
+        "question": question,
+        "selected_choice": selected_choice,
+        "version": await results_cache.aget_version(question.id),
+        "fragment_timeout": page_cache.fragment_timeout(),
+    }
+
+
+class IndexView(View):
+    async def get(self, request: HttpRequest):
+        """A page of published poll questions, sorted by question text."""
+        await get_user(request)
+        paginator = KeysetPaginator(
+            Question.objects.published(),
+            "question_text",
+            getattr(settings, "POLLS_INDEX_PAGE_SIZE", 20),
+        )
+        page = await paginator.apage(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+        context = {
+            "question_list": page.object_list,
+            "page": page,
+            "open_polls": await sync_to_async(schedule.get_open_polls)(),
+        }
+        return render(request, "polls/index.html", context)
+
+
+class DetailView(View):
+    async def get(self, request: HttpRequest, pk):
+        user = await get_user(request)
+        # prefetch the choices, since a query while rendering the
+        # fragment would be a sync query in async code
+        question = await get_question(
+            Question.objects.published().with_choices(), id=pk
+        )
+        # get user's previously selected choice
+        choice = None
+        if user.is_authenticated:
+            choice = get_queued_choice(question, user)
+            if choice is False:
+                vote = await (
+                    Vote.objects.select_related("choice")
+                    .filter(user=user, question=question)
+                    .afirst()
+                )
+                choice = vote.choice if vote else None
+        context = await adetail_context(question, choice)
+        return render(request, "polls/detail.html", context)
+
+
+class ResultsView(View):
+    async def get(self, request: HttpRequest, pk):
+        """Results of a poll, from the results cache."""
+        await get_user(request)
+
+        async def compute():
+            return await get_question(
+                Question.objects.with_choices().with_vote_totals(), pk=pk
+            )
+
+        question, status, version = await results_cache.aget_results(pk, compute)
+        context = {
+            "question": question,
+            "version": version,
+            "results_source": results_cache.read_source(),
+            "fragment_timeout": page_cache.fragment_timeout(),
+            "live_stream": live.can_stream(request),
+        }
+        response = render(request, "polls/results.html", context)
+        response["X-Results-Cache"] = status
+        return response
+
+
+@rate_limited
+@primary_db
+async def vote(request: HttpRequest, question_id):
+    """Vote for a choice on a poll. Must be a POST request."""
+    user = await get_user(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    question = await get_question(Question.objects.with_choices(), id=question_id)
+    context_data = await adetail_context(question)
+    if not question.can_vote():
+        messages.error(request, "Voting not allowed for this question")
+        return render(request, "polls/detail.html", context_data)
+    if request.method != "POST":
+        # this view accepts only POST
+        return HttpResponseNotAllowed(["POST"], "Only POST method is allowed")
+    # the choices are prefetched, so this needs no query
+    selected_choice = next(
+        (c for c in question.choice_set.all() if str(c.id) == request.POST.get("choice")),
+        None,
+    )
+    if selected_choice is None:
+        messages.error(request, "Please select a choice.")
+        return render(request, "polls/detail.html", context_data)
+
+    if vote_queue.is_enabled():
+        # the vote is written later by the vote queue
+        vote_queue.get_vote_queue().put(user.id, question.id, selected_choice.id)
+        messages.info(request, "Your vote was successfully recorded.")
+        return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+
+    key = (user.id, question.id)
+    statuses = await sync_to_async(voting.apply_votes)({key: selected_choice.id})
+    if statuses[key] == voting.INVALID_CHOICE:
+        # the choice was deleted after the question was loaded
+        messages.error(request, "Please select a choice.")
+        return render(request, "polls/detail.html", context_data)
+    if statuses[key] == voting.CREATED:
+        messages.info(request, "Your vote was successfully recorded.")
+    elif statuses[key] == voting.CHANGED:
+        messages.info(request, "Your vote was successfully updated.")
+    else:
+        messages.info(request, "You already voted for this choice.")
+    return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+
+
+@rate_limited
+@primary_db
+async def remove_vote(request: HttpRequest, question_id) -> HttpResponse:
+    """Remove a user's vote for a poll question."""
+    user = await get_user(request)
+    question = await get_question(Question.objects.with_choices(), id=question_id)
+    if not question.can_vote():
+        messages.error(request, "Voting not allowed for this question")
+        return render(request, "polls/detail.html", await adetail_context(question))
+
+    if vote_queue.is_enabled() and user.is_authenticated:
+        vote_queue.get_vote_queue().put(user.id, question.id, None)
+        messages.info(request, "Your vote was successfully removed")
+        return HttpResponseRedirect(reverse("polls:detail", args=(question.id,)))
+
+    if not user.is_authenticated:
+        return HttpResponseNotFound("You didnt vote yet")
+    key = (user.id, question.id)
+    statuses = await sync_to_async(voting.apply_votes)({key: None})
+    if statuses[key] != voting.REMOVED:
+        return HttpResponseNotFound("You didnt vote yet")
+    messages.info(request, "Your vote was successfully removed")
+    return HttpResponseRedirect(reverse("polls:detail", args=(question.id,)))
@@ -0,0 +1,214 @@
+"""The vote history: an append-only log of vote events.
+
+Every change to the Vote table also adds a VoteEvent (cast, change or
+remove) in the same transaction, with one INSERT per batch of votes, so
+the history of each user's vote on each question is kept for fraud
+review while Vote holds only the current state.
+
+The live table only holds recent events.  rollover() moves the events of
+each past month to an archive table named ``polls_voteevent_YYYYMM``,
+which is never written again, so the live table stays small and old
+months can be backed up or dropped on their own.
+
+replay() reads the archives in order and then the live table, and gives
+the vote of each user on each question after the last event; rebuild()
+writes that state back to the Vote table and recomputes the choice vote
+counters.  The ``compact_vote_events`` command does both.
+
+Votes that were made without events, such as votes loaded from a fixture
+with loaddata, have no history to replay.  rebuild() keeps them, and
+backfill() records a cast event for each of them.
+"""
+import datetime
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Choice, Question, Vote, VoteEvent
+from .signals import send_votes_changed
+
+# (user_id, question_id) of a vote
+VoteKey = Tuple[int, int]
+
+_ARCHIVE = re.compile(r"polls_voteevent_\d{6}")
+
+_COLUMNS = ["id", "action", "user_id", "question_id", "choice_id", "created"]
+
+
+def record(events: Iterable[Tuple[str, int, int, Optional[int]]], using=None) -> None:
+    """Add events, each (action, user_id, question_id, choice_id), to the log."""
+    now = timezone.now()
+    VoteEvent.objects.using(using).bulk_create(
+        [
+            VoteEvent(
+                action=action,
+                user_id=user_id,
+                question_id=question_id,
+                choice_id=choice_id,
+                created=now,
+            )
+            for action, user_id, question_id, choice_id in events
+        ]
+    )
+
+
+def month_start(when: datetime.datetime) -> datetime.datetime:
+    """Midnight on the first day of the month of when, in local time."""
+    return timezone.localtime(when).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(start: datetime.datetime) -> datetime.datetime:
+    return month_start(start + datetime.timedelta(days=32))
+
+
+def archive_table(month: datetime.datetime) -> str:
+    return f"{VoteEvent._meta.db_table}_{month_start(month):%Y%m}"
+
+
+def archive_tables() -> List[str]:
+    """The archive tables, oldest first."""
+    return sorted(
+        table for table in connection.introspection.table_names() if _ARCHIVE.fullmatch(table)
+    )
+
+
+def rollover(before: Optional[datetime.datetime] = None) -> Dict[str, int]:
+    """Move the events of the months before the month of before (default:
+    now) from the live table to archive tables, a month per transaction.
+
+    :returns: the number of events moved to each archive table
+    """
+    before = month_start(before or timezone.now())
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(column) for column in _COLUMNS)
+    moved = {}
+    while True:
+        oldest = (
+            VoteEvent.objects.filter(created__lt=before)
+            .order_by("created")
+            .values_list("created", flat=True)
+            .first()
+        )
+        if oldest is None:
+            return moved
+        start = month_start(oldest)
+        events = VoteEvent.objects.filter(created__gte=start, created__lt=_next_month(start))
+        table = qn(archive_table(start))
+        select, params = events.values_list(*_COLUMNS).query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} AS "
+                f"SELECT {columns} FROM {qn(VoteEvent._meta.db_table)} WHERE 1 = 0"
+            )
+            cursor.execute(f"INSERT INTO {table} ({columns}) {select}", params)
+            moved[archive_table(start)] = cursor.rowcount
+            events.delete()
+
+
+def replay(chunk_size: int = 2000) -> Dict[VoteKey, Optional[int]]:
+    """The current votes, from the events in every table.
+
+    :returns: maps the (user_id, question_id) of each vote with events to
+        its choice id, or to None if the last event removed it
+    """
+    qn = connection.ops.quote_name
+    votes = {}
+    for table in archive_tables() + [VoteEvent._meta.db_table]:
+        with connection.cursor() as cursor:
+            # ids grow with time, and archives hold older events than the
+            # live table, so this is the order the events happened in
+            cursor.execute(
+                f"SELECT user_id, question_id, choice_id FROM {qn(table)} ORDER BY id"
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for user_id, question_id, choice_id in rows:
+                    votes[(user_id, question_id)] = choice_id
+    return votes
+
+
+def _current_votes() -> Dict[VoteKey, Tuple[int, int]]:
+    """Maps the (user_id, question_id) of each vote to (id, choice_id)."""
+    return {
+        (user_id, question_id): (vote_id, choice_id)
+        for vote_id, user_id, question_id, choice_id in Vote.objects.values_list(
+            "id", "user_id", "question_id", "choice_id"
+        ).iterator()
+    }
+
+
+def differences(votes: Dict[VoteKey, Optional[int]]) -> Dict[str, int]:
+    """Compare the Vote table with replayed votes.
+
+    :returns: the number of votes with events that differ from votes
+        ("differ"), and of votes with no events ("unrecorded")
+    """
+    current = _current_votes()
+    return {
+        "differ": sum(
+            1 for key, choice_id in votes.items()
+            if current.get(key, (None, None))[1] != choice_id
+        ),
+        "unrecorded": sum(1 for key in current if key not in votes),
+    }
+
+
+def rebuild(votes: Dict[VoteKey, Optional[int]], batch_size: int = 1000) -> Dict[str, int]:
+    """Make the votes with events match votes, and recompute the vote
+    counters.  Votes with no events are kept as they are.
+
+    Votes for users, questions or choices that were deleted are skipped.
+
+    :returns: the number of votes written and skipped
+    """
+    with transaction.atomic():
+        choice_questions = dict(Choice.objects.values_list("id", "question_id"))
+        user_ids = set(User.objects.values_list("id", flat=True))
+        current = _current_votes()
+        stale = []
+        new_votes = []
+        skipped = 0
+        for (user_id, question_id), choice_id in votes.items():
+            vote_id, current_choice = current.get((user_id, question_id), (None, None))
+            if current_choice == choice_id:
+                continue
+            if vote_id is not None:
+                stale.append(vote_id)
+            if choice_id is None:
+                continue
+            if choice_questions.get(choice_id) == question_id and user_id in user_ids:
+                new_votes.append(
+                    Vote(user_id=user_id, question_id=question_id, choice_id=choice_id)
+                )
+            else:
+                skipped += 1
+        for start in range(0, len(stale), batch_size):
+            # the counters are all recomputed below
+            Vote.objects.filter(id__in=stale[start:start + batch_size]).delete(uncount=False)
+        Vote.objects.bulk_create(new_votes, batch_size=batch_size)
+        Choice.rebuild_vote_counts()
+        send_votes_changed(*Question.objects.values_list("id", flat=True))
+    return {"votes": len(new_votes), "removed": len(stale), "skipped": skipped}
+
+
+def backfill(batch_size: int = 1000) -> int:
+    """Record a cast event for each vote with no events, such as the votes
+    of a fixture loaded with loaddata.
+
+    :returns: the number of events recorded
+    """
+    recorded = replay().keys()
+    unrecorded = [
+        (VoteEvent.CAST, user_id, question_id, choice_id)
+        for (user_id, question_id), (_, choice_id) in _current_votes().items()
+        if (user_id, question_id) not in recorded
+    ]
+    for start in range(0, len(unrecorded), batch_size):
+        with transaction.atomic():
+            record(unrecorded[start:start + batch_size])
+    return len(unrecorded)
@@ -0,0 +1,706 @@
+"""Load test and benchmark of the polls views.
+
+seed() fills the database with questions, choices, users and votes.
+run() sends requests to the index, detail, results, vote and remove vote
+views from several threads at once, either through the Django test
+client or over HTTP to a threaded WSGI server running mysite.wsgi,
+and returns a report with latency percentiles, throughput and queries
+per request for each view.  The report is plain data, so it can be
+written as JSON and compared across commits.
+
+run_slow_clients() compares the sync views under WSGI with the async
+views under ASGI when many clients send and read slowly.
+
+stress() votes and reads results from many threads at once on a copy of
+the database, to compare SQLite with and without the production profile.
+
+Use them through ``manage.py benchmark_polls``, ``manage.py
+benchmark_async`` and ``manage.py stress_sqlite``, which run them on a
+temporary database.
+"""
+import asyncio
+import http.client
+import io
+import math
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Optional
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from wsgiref.util import setup_testing_defaults
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from . import voting
+from .models import Choice, Question, Vote
+
+SCENARIOS = ("index", "detail", "results", "vote", "remove_vote")
+
+# relative frequency of each scenario in the request mix
+DEFAULT_MIX = {"index": 3, "detail": 3, "results": 6, "vote": 3, "remove_vote": 1}
+
+
+# request mix of run_slow_clients(); only reads, since SQLite allows one
+# writer at a time and lock waits would hide the difference
+SLOW_CLIENT_MIX = {"index": 1, "detail": 1, "results": 2}
+
+
+@contextmanager
+def temporary_database():
+    """Create the test database in a temporary file, and destroy it after.
+
+    The database is a file, not in memory, so all threads share it.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        settings.DATABASES["default"].setdefault("TEST", {})["NAME"] = os.path.join(
+            tmpdir, "benchmark.sqlite3"
+        )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def environment() -> dict:
+    """The commit, Django version and database being benchmarked."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "django": django.get_version(),
+        "database": connection.vendor,
+    }
+
+
+def seed(questions=100, choices=4, users=200, votes=1000, batch_size=1000, rng=None):
+    """Create poll questions, choices, users and votes for a benchmark.
+
+    Each user votes at most once per question, so there can be at most
+    questions * users votes.
+
+    :returns: dict with the ids of the questions and users created.
+    """
+    rng = rng or random.Random(0)
+    now = timezone.now()
+    question_objs = Question.objects.bulk_create(
+        [
+            Question(
+                question_text=f"Benchmark question {n}",
+                pub_date=now - timedelta(days=n % 30 + 1),
+            )
+            for n in range(questions)
+        ],
+        batch_size=batch_size,
+    )
+    choice_objs = Choice.objects.bulk_create(
+        [
+            Choice(question=question, choice_text=f"Choice {k}")
+            for question in question_objs
+            for k in range(choices)
+        ],
+        batch_size=batch_size,
+    )
+    choices_by_question = defaultdict(list)
+    for choice in choice_objs:
+        choices_by_question[choice.question_id].append(choice.id)
+    # hashing a password is slow on purpose, so all users share one
+    password = make_password("benchmark")
+    user_objs = User.objects.bulk_create(
+        [User(username=f"bench{n}", password=password) for n in range(users)],
+        batch_size=batch_size,
+    )
+    question_ids = [q.id for q in question_objs]
+    user_ids = [u.id for u in user_objs]
+
+    votes = min(votes, len(question_ids) * len(user_ids))
+    keys = set()
+    while len(keys) < votes:
+        keys.add((rng.choice(user_ids), rng.choice(question_ids)))
+    Vote.objects.bulk_create(
+        [
+            Vote(
+                user_id=user_id,
+                question_id=question_id,
+                choice_id=rng.choice(choices_by_question[question_id]),
+            )
+            for user_id, question_id in keys
+        ],
+        batch_size=batch_size,
+    )
+    Choice.rebuild_vote_counts()
+    return {"questions": question_ids, "users": user_ids, "choices": choices_by_question}
+
+
+def percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _Results:
+    """Timings collected by the worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_kinds = defaultdict(int)
+
+    def add(self, scenario, seconds, queries, error):
+        with self.lock:
+            self.latencies[scenario].append(seconds)
+            # failed requests are not typical, e.g. logging the error
+            # may run many queries
+            if queries is not None and not error:
+                self.queries[scenario].append(queries)
+            if error:
+                self.errors[scenario] += 1
+                self.error_kinds[error] += 1
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        views = {}
+        for scenario in SCENARIOS:
+            latencies = sorted(self.latencies.get(scenario, []))
+            if not latencies:
+                continue
+            queries = self.queries.get(scenario, [])
+            views[scenario] = {
+                "requests": len(latencies),
+                "errors": self.errors.get(scenario, 0),
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "latency_ms": {
+                    name: round(percentile(latencies, p) * 1000, 3)
+                    for name, p in (("p50", 50), ("p95", 95), ("p99", 99))
+                },
+                "mean_latency_ms": round(statistics.fmean(latencies) * 1000, 3),
+                "queries_per_request": (
+                    round(statistics.fmean(queries), 2) if queries else None
+                ),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "error_kinds": dict(self.error_kinds),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "views": views,
+        }
+
+
+class _ClientTransport:
+    """Sends requests through the Django test client in this process."""
+
+    def __init__(self, user_ids):
+        self.clients = {}
+        for user in User.objects.filter(id__in=user_ids):
+            client = Client()
+            client.force_login(user)
+            self.clients[user.id] = client
+        self.anonymous = Client()
+
+    def request(self, method, path, user_id=None, data=None):
+        client = self.clients[user_id] if user_id else self.anonymous
+        with CaptureQueriesContext(connection) as queries:
+            if method == "POST":
+                response = client.post(path, data or {})
+            else:
+                response = client.get(path)
+        return response.status_code, len(queries)
+
+    def close(self):
+        pass
+
+
+class _HttpTransport:
+    """Sends requests over HTTP to a WSGI server."""
+
+    def __init__(self, host, port, user_ids):
+        self.connection = http.client.HTTPConnection(host, port)
+        self.cookies = {}
+        for user in User.objects.filter(id__in=user_ids):
+            client = Client()
+            client.force_login(user)
+            self.cookies[user.id] = f"sessionid={client.cookies['sessionid'].value}"
+
+    def request(self, method, path, user_id=None, data=None):
+        headers = {"Host": "localhost"}
+        if user_id:
+            headers["Cookie"] = self.cookies[user_id]
+        body = None
+        if data:
+            body = "&".join(f"{key}={value}" for key, value in data.items())
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        queries = response.getheader("X-Query-Count")
+        return response.status, int(queries) if queries is not None else None
+
+    def close(self):
+        self.connection.close()
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def count_queries(application):
+    """Wrap a WSGI application to report its query count in a header."""
+
+    def wrapped(environ, start_response):
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured["args"] = (status, headers, exc_info)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = application(environ, capture_start_response)
+            try:
+                body = b"".join(response)
+            finally:
+                # sends request_finished, which closes the db connection
+                response.close()
+        status, headers, exc_info = captured["args"]
+        headers = list(headers) + [("X-Query-Count", str(len(queries)))]
+        start_response(status, headers, exc_info)
+        return [body]
+
+    return wrapped
+
+
+def start_wsgi_server():
+    """Start mysite.wsgi in a threaded WSGI server on a free local port."""
+    from mysite.wsgi import application
+
+    server = make_server(
+        "127.0.0.1", 0, count_queries(application),
+        server_class=_ThreadingWSGIServer, handler_class=_QuietHandler,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def _pick_scenario(rng, mix):
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+
+def _worker(transport, user_ids, seeded, requests, mix, results, seed_value):
+    rng = random.Random(seed_value)
+    question_ids = seeded["questions"]
+    try:
+        for _ in range(requests):
+            scenario = _pick_scenario(rng, mix)
+            question_id = rng.choice(question_ids)
+            user_id = rng.choice(user_ids) if user_ids else None
+            method, data = "GET", None
+            if scenario == "index":
+                path = reverse("polls:index")
+                user_id = None
+            elif scenario == "detail":
+                path = reverse("polls:detail", args=(question_id,))
+            elif scenario == "results":
+                path = reverse("polls:results", args=(question_id,))
+                user_id = None
+            elif scenario == "vote":
+                path = reverse("polls:vote", args=(question_id,))
+                method = "POST"
+                data = {"choice": rng.choice(seeded["choices"][question_id])}
+            else:
+                path = reverse("polls:remove_vote", args=(question_id,))
+                method = "POST"
+            start = time.perf_counter()
+            try:
+                status, queries = transport.request(method, path, user_id, data)
+                # remove_vote answers 404 when there is no vote to remove
+                expected = scenario == "remove_vote" and status == 404
+                error = f"HTTP {status}" if status >= 400 and not expected else None
+            except Exception as e:
+                queries, error = None, f"{type(e).__name__}: {e}"
+            results.add(scenario, time.perf_counter() - start, queries, error)
+    finally:
+        transport.close()
+
+
+def _thread_worker(*args):
+    try:
+        _worker(*args)
+    finally:
+        # each thread opens its own database connection
+        connection.close()
+
+
+# the benchmark clients all have one IP address, so the rate limits
+# would deny most of their votes
+@override_settings(POLLS_RATE_LIMIT_BURST=0)
+def run(seeded, requests=1000, concurrency=8, mode="client", mix=None,
+        logins_per_worker=10, seed_value=0) -> dict:
+    """Send a mix of requests to the polls views and measure them.
+
+    :param seeded: the value returned by seed()
+    :param requests: total number of requests, shared by the workers
+    :param concurrency: number of worker threads.  With 1, requests are
+        sent from the calling thread.
+    :param mode: "client" for the Django test client, or "wsgi" for HTTP
+        requests to a threaded WSGI server
+    :param mix: relative frequency of each scenario (default DEFAULT_MIX)
+    :param logins_per_worker: number of users each worker votes as
+    :returns: the benchmark report
+    """
+    mix = {name: weight for name, weight in (mix or DEFAULT_MIX).items() if weight}
+    cache.clear()
+    server = None
+    if mode == "wsgi":
+        server = start_wsgi_server()
+        host, port = server.server_address[:2]
+
+        def transport_factory(user_ids):
+            return _HttpTransport(host, port, user_ids)
+    elif mode == "client":
+        transport_factory = _ClientTransport
+    else:
+        raise ValueError(f"unknown benchmark mode {mode!r}")
+
+    results = _Results()
+    users = seeded["users"]
+    per_worker = [requests // concurrency] * concurrency
+    for n in range(requests % concurrency):
+        per_worker[n] += 1
+    jobs = []
+    try:
+        # log in before the clock starts
+        for n in range(concurrency):
+            user_ids = users[n::concurrency][:logins_per_worker]
+            transport = transport_factory(user_ids)
+            jobs.append(
+                (transport, user_ids, seeded, per_worker[n], mix, results, seed_value + n)
+            )
+    except Exception:
+        if server:
+            server.shutdown()
+            server.server_close()
+        raise
+    start = time.perf_counter()
+    try:
+        if concurrency == 1:
+            _worker(*jobs[0])
+        else:
+            threads = [threading.Thread(target=_thread_worker, args=job) for job in jobs]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        elapsed = time.perf_counter() - start
+        if server:
+            server.shutdown()
+            server.server_close()
+    report = results.report(elapsed)
+    report["mode"] = mode
+    report["concurrency"] = concurrency
+    return report
+
+
+def site_urlconf(async_pages: bool):
+    """The site URLconf, with the sync or the async poll views."""
+    from mysite import urls
+
+    from .urls import get_urlpatterns
+
+    module = types.ModuleType(f"polls_benchmark_urls_{'async' if async_pages else 'sync'}")
+    module.urlpatterns = [
+        path("polls/", include((get_urlpatterns(async_pages), "polls")))
+        if str(pattern.pattern) == "polls/" else pattern
+        for pattern in urls.urlpatterns
+    ]
+    return module
+
+
+def _slow_client_paths(seeded, count, mix, rng):
+    paths = []
+    for _ in range(count):
+        scenario = _pick_scenario(rng, mix)
+        question_id = rng.choice(seeded["questions"])
+        if scenario == "index":
+            paths.append((scenario, reverse("polls:index")))
+        elif scenario in ("detail", "results"):
+            paths.append((scenario, reverse(f"polls:{scenario}", args=(question_id,))))
+        else:
+            raise ValueError(f"{scenario} is not a read-only scenario")
+    return paths
+
+
+def _wsgi_request(application, path, slow):
+    """Serve a GET request to a client that takes `slow` seconds to send
+    its request and again to read the response, as a WSGI worker does.
+    """
+    environ = {
+        "PATH_INFO": path,
+        "HTTP_HOST": "testserver",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.multithread": True,
+    }
+    setup_testing_defaults(environ)
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured["status"] = int(status.split()[0])
+
+    # the worker is held while the request arrives
+    time.sleep(slow)
+    response = application(environ, start_response)
+    try:
+        b"".join(response)
+    finally:
+        # sends request_finished, which closes the db connection
+        response.close()
+    # and while the response is sent
+    time.sleep(slow)
+    return captured["status"]
+
+
+async def _asgi_request(application, path, slow):
+    """Async version of _wsgi_request(), for an ASGI application."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    done = asyncio.Event()
+    captured = {}
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            await asyncio.sleep(slow)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            captured["status"] = message["status"]
+        elif not message.get("more_body"):
+            await asyncio.sleep(slow)
+            done.set()
+
+    await application(scope, receive, send)
+    done.set()
+    return captured["status"]
+
+
+@override_settings(POLLS_RATE_LIMIT_BURST=0)
+def run_slow_clients(seeded, clients=100, requests_per_client=5, slow=0.05,
+                     threads=8, mode="sync", mix=None, seed_value=0) -> dict:
+    """Measure many slow clients reading polls pages at the same time.
+
+    Each client sends its requests one after another, and takes `slow`
+    seconds to send each request and again to read each response.
+
+    * In "sync" mode, the sync views are served by mysite.wsgi with a pool
+      of `threads` workers, like a threaded WSGI server.  A worker is held
+      for the whole request, slow parts included.
+    * In "async" mode, the async views are served by mysite.asgi in an
+      event loop, which waits for the clients without holding a thread.
+
+    :param mix: relative frequency of the index, detail and results
+        scenarios (default SLOW_CLIENT_MIX)
+    :returns: the benchmark report
+    """
+    mix = {name: weight for name, weight in (mix or SLOW_CLIENT_MIX).items() if weight}
+    rng = random.Random(seed_value)
+    if mode not in ("sync", "async"):
+        raise ValueError(f"unknown benchmark mode {mode!r}")
+    cache.clear()
+    results = _Results()
+    with override_settings(ROOT_URLCONF=site_urlconf(mode == "async")):
+        jobs = [
+            _slow_client_paths(seeded, requests_per_client, mix, rng)
+            for _ in range(clients)
+        ]
+        start = time.perf_counter()
+        if mode == "sync":
+            _run_sync_clients(jobs, slow, threads, results)
+        else:
+            asyncio.run(_run_async_clients(jobs, slow, results))
+        elapsed = time.perf_counter() - start
+    report = results.report(elapsed)
+    report["mode"] = mode
+    report["clients"] = clients
+    report["slow_s"] = slow
+    if mode == "sync":
+        report["threads"] = threads
+    return report
+
+
+def _record(results, scenario, start, status=None, exception=None):
+    if exception is not None:
+        error = f"{type(exception).__name__}: {exception}"
+    else:
+        error = f"HTTP {status}" if status >= 400 else None
+    results.add(scenario, time.perf_counter() - start, None, error)
+
+
+def _run_sync_clients(jobs, slow, threads, results):
+    from mysite.wsgi import application
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+
+        def client(paths):
+            for scenario, url in paths:
+                start = time.perf_counter()
+                try:
+                    status = pool.submit(_wsgi_request, application, url, slow).result()
+                    _record(results, scenario, start, status)
+                except Exception as e:
+                    _record(results, scenario, start, exception=e)
+
+        # one light thread per client waits for the workers
+        client_threads = [threading.Thread(target=client, args=(paths,)) for paths in jobs]
+        for thread in client_threads:
+            thread.start()
+        for thread in client_threads:
+            thread.join()
+
+
+async def _run_async_clients(jobs, slow, results):
+    from mysite.asgi import application
+
+    async def client(paths):
+        for scenario, url in paths:
+            start = time.perf_counter()
+            try:
+                status = await _asgi_request(application, url, slow)
+                _record(results, scenario, start, status)
+            except Exception as e:
+                _record(results, scenario, start, exception=e)
+
+    await asyncio.gather(*(client(paths) for paths in jobs))
+
+
+@contextmanager
+def sqlite_copy(alias: str, path: str, production: bool):
+    """Copy the default database to a SQLite file, and use the copy as
+    database `alias`, with or without the SQLite production profile.
+    """
+    engine = "mysite.sqlite3" if production else "django.db.backends.sqlite3"
+    connections.settings[alias] = connections.configure_settings(
+        {DEFAULT_DB_ALIAS: {}, alias: {"ENGINE": engine, "NAME": path}}
+    )[alias]
+    try:
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
+        yield connections[alias]
+    finally:
+        # the worker threads closed their own connections
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+
+def _stress_worker(alias, seeded, operations, write_ratio, results, seed_value):
+    rng = random.Random(seed_value)
+    try:
+        for _ in range(operations):
+            question_id = rng.choice(seeded["questions"])
+            start = time.perf_counter()
+            error = None
+            try:
+                if rng.random() < write_ratio:
+                    scenario = "vote"
+                    # the vote view's write path, on the copy
+                    voting.cast_vote(
+                        rng.choice(seeded["users"]),
+                        question_id,
+                        rng.choice(seeded["choices"][question_id]),
+                        using=alias,
+                    )
+                else:
+                    scenario = "results"
+                    Question.objects.using(alias).with_choices().with_vote_totals().get(
+                        id=question_id
+                    )
+            except OperationalError as e:
+                # "database is locked"
+                error = f"OperationalError: {e}"
+            results.add(scenario, time.perf_counter() - start, None, error)
+    finally:
+        connections[alias].close()
+
+
+def stress(seeded, alias: str, threads=16, operations=200, write_ratio=0.5,
+           seed_value=0) -> dict:
+    """Vote and read results from many threads at once on database `alias`.
+
+    :param operations: number of votes and reads by each thread
+    :param write_ratio: fraction of the operations that are votes
+    :returns: the benchmark report, where errors are mostly
+        "database is locked"
+    """
+    results = _Results()
+    workers = [
+        threading.Thread(
+            target=_stress_worker,
+            args=(alias, seeded, operations, write_ratio, results, seed_value + n),
+        )
+        for n in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report = results.report(time.perf_counter() - start)
+    report["threads"] = threads
+    return report
@@ -0,0 +1,104 @@
+"""Export poll results and votes as CSV or NDJSON.
+
+The rows are read from the database with ``.iterator(chunk_size=...)``
+and written one line at a time, so exports of any size use a small,
+constant amount of memory.  The same generators serve the streaming
+export view and the ``export_results`` management command.
+"""
+import csv
+import json
+from typing import Dict, Iterable, Iterator, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .models import Choice, Vote
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+RESULT_FIELDS = [
+    "question_id",
+    "question_text",
+    "pub_date",
+    "choice_id",
+    "choice_text",
+    "votes",
+]
+
+VOTE_FIELDS = ["vote_id", "user_id", "username", "question_id", "choice_id"]
+
+CHUNK_SIZE = 2000
+
+
+def result_rows(chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """Each choice of each question with its number of votes."""
+    return (
+        Choice.objects.order_by("question_id", "id")
+        .values(
+            "question_id",
+            "choice_text",
+            "votes",
+            question_text=F("question__question_text"),
+            pub_date=F("question__pub_date"),
+            choice_id=F("id"),
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def vote_rows(chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """Each vote, with the user who cast it."""
+    return (
+        Vote.objects.order_by("id")
+        .values(
+            "user_id",
+            "question_id",
+            "choice_id",
+            vote_id=F("id"),
+            username=F("user__username"),
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+class _Line:
+    """File-like object for csv.writer that returns what is written."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows: Iterable[Dict], fields: List[str]) -> Iterator[str]:
+    writer = csv.writer(_Line())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[name] for name in fields])
+
+
+def ndjson_lines(rows: Iterable[Dict], fields: List[str]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps({name: row[name] for name in fields}, cls=DjangoJSONEncoder) + "\n"
+
+
+def export_lines(data: str = "results", fmt: str = "csv",
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Lines of an export.
+
+    :param data: "results" for vote counts per choice, or "votes" for
+        every vote by every user
+    :param fmt: "csv" or "ndjson"
+    """
+    if data == "results":
+        rows, fields = result_rows(chunk_size), RESULT_FIELDS
+    elif data == "votes":
+        rows, fields = vote_rows(chunk_size), VOTE_FIELDS
+    else:
+        raise ValueError(f"unknown export data {data!r}")
+    if fmt == "csv":
+        return csv_lines(rows, fields)
+    if fmt == "ndjson":
+        return ndjson_lines(rows, fields)
+    raise ValueError(f"unknown export format {fmt!r}")
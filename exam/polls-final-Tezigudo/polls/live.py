@@ -0,0 +1,236 @@
+"""Live poll results for many watchers.
+
+When a vote transaction commits, the votes_changed signal marks its
+questions as changed.  Every ``POLLS_LIVE_INTERVAL`` seconds a single
+thread reads the vote counts of all changed questions in one query and
+publishes one frame per question, with the counts and the change since
+the previous frame.  Watchers wait for the next frame of their question,
+so bursts of votes are coalesced into one frame per interval and one
+query serves every watcher, however many there are.
+
+Watchers get frames from
+
+* ``/polls/<id>/live/``, a stream of server-sent events.  Under ASGI the
+  stream is an async generator that holds no thread while it waits.
+* ``/polls/<id>/live/poll/?since=<seq>``, a long poll that returns the
+  next frame after ``since`` as JSON, for clients that can't use
+  server-sent events.
+
+The results page uses the stream under ASGI only.  Under WSGI a stream
+holds a worker thread for all of ``POLLS_LIVE_STREAM_SECONDS``, so the
+page long polls instead.
+
+The broker is in-process, so it sees the votes committed by this
+process only; run one process, or use the vote web service and results
+page of the process that watchers are connected to.
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from .models import Choice
+from .routers import use_primary
+from .signals import votes_changed
+
+
+def vote_counts(question_ids: Iterable[int]) -> Dict[int, Dict[int, int]]:
+    """Vote count of each choice of some questions, in one query.
+
+    The counts are read from the primary database, since a replica may
+    not have the votes that were just committed.
+    """
+    counts = {question_id: {} for question_id in question_ids}
+    with use_primary():
+        for question_id, choice_id, votes in Choice.objects.filter(
+            question_id__in=counts
+        ).values_list("question_id", "id", "votes"):
+            counts[question_id][choice_id] = votes
+    return counts
+
+
+class LiveResults:
+    """In-process publisher of per-question vote count frames.
+
+    :param interval: seconds between frames.  If None, frames are only
+        published by calling publish_pending().
+    """
+
+    def __init__(self, interval: Optional[float] = 1.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._published = threading.Condition(self._lock)
+        self._changed = set()
+        self._frames: Dict[int, dict] = {}
+        self._seq = 0
+        self._worker = None
+
+    def mark_changed(self, question_ids: Iterable[int]):
+        """Note that the votes of some questions changed."""
+        with self._lock:
+            self._changed.update(question_ids)
+        self._start_worker()
+
+    def publish_pending(self):
+        """Publish a frame for each question changed since the last call."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        if not changed:
+            return
+        counts = vote_counts(changed)
+        with self._lock:
+            for question_id, choices in counts.items():
+                self._publish(question_id, choices)
+            self._published.notify_all()
+
+    def _publish(self, question_id, choices):
+        previous = self._frames.get(question_id)
+        old_counts = previous["counts"] if previous else {}
+        deltas = {
+            choice_id: votes - old_counts.get(choice_id, 0)
+            for choice_id, votes in choices.items()
+            if votes != old_counts.get(choice_id, 0)
+        }
+        self._seq += 1
+        self._frames[question_id] = {
+            "seq": self._seq,
+            "question": question_id,
+            "counts": choices,
+            "deltas": deltas,
+            "total": sum(choices.values()),
+        }
+
+    def latest(self, question_id: int) -> dict:
+        """The latest frame of a question, read from the database if the
+        question has none yet.
+        """
+        with self._lock:
+            frame = self._frames.get(question_id)
+        if frame is None:
+            choices = vote_counts([question_id])[question_id]
+            with self._lock:
+                if question_id not in self._frames:
+                    self._publish(question_id, choices)
+                frame = self._frames[question_id]
+        return frame
+
+    def wait(self, question_id: int, since: int, timeout: float) -> Optional[dict]:
+        """Wait for a frame of the question newer than `since`.
+
+        :returns: the frame, or None if there is none before the timeout.
+        """
+        def newer():
+            frame = self._frames.get(question_id)
+            return frame if frame and frame["seq"] > since else None
+
+        with self._published:
+            return self._published.wait_for(newer, timeout)
+
+    async def await_frame(self, question_id: int, since: int, timeout: float):
+        """Async version of wait(), which checks for a new frame every
+        half interval instead of blocking a thread.
+        """
+        deadline = time.monotonic() + timeout
+        pause = (self.interval or 1.0) / 2
+        while time.monotonic() < deadline:
+            with self._lock:
+                frame = self._frames.get(question_id)
+            if frame and frame["seq"] > since:
+                return frame
+            await asyncio.sleep(min(pause, max(0, deadline - time.monotonic())))
+        return None
+
+    def _start_worker(self):
+        if self.interval is None or self._worker:
+            return
+        with self._lock:
+            if self._worker:
+                return
+            self._worker = threading.Thread(
+                target=self._run, name="polls-live-results", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.publish_pending()
+            except Exception:
+                # a failed query; those questions are published next time
+                pass
+            finally:
+                close_old_connections()
+
+
+_live = None
+_live_lock = threading.Lock()
+
+
+def get_live_results() -> LiveResults:
+    """Return the live results publisher of this process."""
+    global _live
+    with _live_lock:
+        if _live is None:
+            _live = LiveResults(interval=getattr(settings, "POLLS_LIVE_INTERVAL", 1.0))
+        return _live
+
+
+@receiver(votes_changed)
+def votes_changed_handler(sender, question_ids, **kwargs):
+    get_live_results().mark_changed(question_ids)
+
+
+def can_stream(request) -> bool:
+    """Whether a request can stream events without holding a thread."""
+    return isinstance(request, ASGIRequest)
+
+
+def sse_event(frame: dict) -> str:
+    """Format a frame as a server-sent event."""
+    return f"id: {frame['seq']}\nevent: results\ndata: {json.dumps(frame)}\n\n"
+
+
+KEEPALIVE = ": keepalive\n\n"
+
+
+def event_stream(question_id: int, since: int, duration: float, keepalive: float):
+    """Server-sent events for a question, for `duration` seconds."""
+    live = get_live_results()
+    deadline = time.monotonic() + duration
+    frame = live.latest(question_id)
+    if frame["seq"] > since:
+        yield sse_event(frame)
+        since = frame["seq"]
+    while time.monotonic() < deadline:
+        frame = live.wait(question_id, since, min(keepalive, deadline - time.monotonic()))
+        if frame:
+            since = frame["seq"]
+            yield sse_event(frame)
+        else:
+            yield KEEPALIVE
+
+
+async def async_event_stream(question_id: int, since: int, duration: float,
+                             keepalive: float, first_frame: dict):
+    """Async version of event_stream(), for ASGI servers."""
+    live = get_live_results()
+    deadline = time.monotonic() + duration
+    if first_frame["seq"] > since:
+        yield sse_event(first_frame)
+        since = first_frame["seq"]
+    while time.monotonic() < deadline:
+        frame = await live.await_frame(
+            question_id, since, min(keepalive, deadline - time.monotonic())
+        )
+        if frame:
+            since = frame["seq"]
+            yield sse_event(frame)
+        else:
+            yield KEEPALIVE
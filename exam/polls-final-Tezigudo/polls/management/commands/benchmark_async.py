@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from polls import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync views under WSGI with the async views under ASGI "
+        "when many slow clients read polls pages, on a temporary database, "
+        "and print throughput and latency as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=100)
+        parser.add_argument("--choices", type=int, default=4, help="choices per question")
+        parser.add_argument("--clients", type=int, default=200, help="concurrent clients")
+        parser.add_argument("--requests-per-client", type=int, default=5)
+        parser.add_argument(
+            "--slow",
+            type=float,
+            default=0.05,
+            help="seconds each client takes to send a request, and again to read the response",
+        )
+        parser.add_argument(
+            "--threads", type=int, default=8, help="worker threads of the WSGI server"
+        )
+        parser.add_argument(
+            "--mode",
+            choices=["sync", "async", "both"],
+            default="both",
+        )
+        parser.add_argument("--output", "-o", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        modes = ["sync", "async"] if options["mode"] == "both" else [options["mode"]]
+        params = {
+            name: options[name]
+            for name in ("questions", "choices", "clients", "requests_per_client",
+                         "slow", "threads")
+        }
+        report = {}
+        with benchmark.temporary_database():
+            seeded = benchmark.seed(
+                questions=options["questions"], choices=options["choices"], users=0, votes=0
+            )
+            for mode in modes:
+                report[mode] = benchmark.run_slow_clients(
+                    seeded,
+                    clients=options["clients"],
+                    requests_per_client=options["requests_per_client"],
+                    slow=options["slow"],
+                    threads=options["threads"],
+                    mode=mode,
+                )
+        report["params"] = params
+        report["environment"] = benchmark.environment()
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from polls import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the polls views on a temporary database and print "
+        "latency, throughput and queries per request as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=100)
+        parser.add_argument("--choices", type=int, default=4, help="choices per question")
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--votes", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=8, help="worker threads")
+        parser.add_argument(
+            "--mode",
+            choices=["client", "wsgi"],
+            default="client",
+            help="use the Django test client, or HTTP to a threaded WSGI server",
+        )
+        for scenario in benchmark.SCENARIOS:
+            parser.add_argument(
+                f"--{scenario.replace('_', '-')}-weight",
+                type=int,
+                default=benchmark.DEFAULT_MIX[scenario],
+                help=f"relative frequency of {scenario} requests",
+            )
+        parser.add_argument("--output", "-o", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        mix = {
+            scenario: options[f"{scenario}_weight"] for scenario in benchmark.SCENARIOS
+        }
+        params = {
+            name: options[name]
+            for name in ("questions", "choices", "users", "votes", "requests", "concurrency")
+        }
+        with benchmark.temporary_database():
+            seeded = benchmark.seed(
+                questions=options["questions"],
+                choices=options["choices"],
+                users=options["users"],
+                votes=options["votes"],
+            )
+            report = benchmark.run(
+                seeded,
+                requests=options["requests"],
+                concurrency=options["concurrency"],
+                mode=options["mode"],
+                mix=mix,
+            )
+        report["params"] = dict(params, mix=mix)
+        report["environment"] = benchmark.environment()
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from polls import audit, routers
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the vote events of past months to monthly archive tables. "
+        "With --check or --rebuild, replay every event to find the current "
+        "votes, and compare them with the Vote table or rebuild it and the "
+        "choice vote counters from them. Votes with no events are kept; "
+        "--backfill records events for them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            help="archive the months before the month of this date (default: today)",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="report the votes that differ from the replayed events",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="replace the votes that have events, and the vote counters, "
+            "with the replayed events",
+        )
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="record a cast event for each vote with no events, "
+            "such as votes loaded with loaddata",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now()
+        if options["before"]:
+            date = parse_date(options["before"])
+            if date is None:
+                raise CommandError(f"--before {options['before']!r} is not a date")
+            before = timezone.make_aware(
+                timezone.datetime(date.year, date.month, date.day)
+            )
+        # the events and the votes are on the primary
+        with routers.use_primary():
+            if options["backfill"]:
+                self.stdout.write(
+                    f"Recorded {audit.backfill()} events for votes with no events"
+                )
+            for table, count in audit.rollover(before).items():
+                self.stdout.write(f"Moved {count} events to {table}")
+            if not (options["check"] or options["rebuild"]):
+                return
+            votes = audit.replay()
+            differences = audit.differences(votes)
+            self.stdout.write(
+                "{differ} votes differ from the vote events, and {unrecorded} "
+                "votes have no events.".format(**differences)
+            )
+            if differences["unrecorded"] and not options["backfill"]:
+                self.stdout.write(
+                    "Votes with no events are kept by --rebuild; "
+                    "record them with --backfill."
+                )
+            if options["rebuild"]:
+                result = audit.rebuild(votes)
+                self.stdout.write(
+                    "Rebuilt {votes} votes and removed {removed}, skipping {skipped} "
+                    "for deleted users or choices.".format(**result)
+                )
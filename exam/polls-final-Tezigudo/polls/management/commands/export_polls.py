@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from polls import export, transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every poll question with its dates and choices, and optionally "
+        "the voters, as NDJSON or CSV that import_polls can read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(export.FORMATS), default="ndjson")
+        parser.add_argument(
+            "--votes",
+            action="store_true",
+            help="include the usernames of the voters for each choice",
+        )
+        parser.add_argument("--chunk-size", type=int, default=transfer.CHUNK_SIZE)
+        parser.add_argument("--output", "-o", help="output file (default: stdout)")
+
+    def handle(self, *args, **options):
+        lines = transfer.export_lines(
+            options["format"], voters=options["votes"], chunk_size=options["chunk_size"]
+        )
+        if options["output"]:
+            with open(options["output"], "w", newline="") as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
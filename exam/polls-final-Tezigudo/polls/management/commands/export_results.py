@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from polls import export
+
+
+class Command(BaseCommand):
+    help = "Write the vote counts of every poll choice, or every vote, as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(export.FORMATS), default="csv")
+        parser.add_argument(
+            "--votes",
+            action="store_true",
+            help="export each user's vote instead of the vote counts",
+        )
+        parser.add_argument("--chunk-size", type=int, default=export.CHUNK_SIZE)
+        parser.add_argument("--output", "-o", help="output file (default: stdout)")
+
+    def handle(self, *args, **options):
+        lines = export.export_lines(
+            "votes" if options["votes"] else "results",
+            options["format"],
+            chunk_size=options["chunk_size"],
+        )
+        if options["output"]:
+            with open(options["output"], "w", newline="") as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
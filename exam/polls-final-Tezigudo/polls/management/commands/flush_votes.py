@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls import vote_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Write votes waiting in the vote queue to the database, "
+        "including votes saved in vote queue journal files. Journals of "
+        "running processes are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "journal",
+            nargs="*",
+            help="journal files to replay (default: POLLS_VOTE_QUEUE_JOURNAL)",
+        )
+
+    def handle(self, *args, **options):
+        changed = vote_queue.get_vote_queue().flush()
+        journals = options["journal"] or [
+            path for path in [getattr(settings, "POLLS_VOTE_QUEUE_JOURNAL", "")] if path
+        ]
+        for journal in journals:
+            try:
+                changed += vote_queue.replay_journal(journal)
+            except vote_queue.JournalInUse as e:
+                # its process writes the votes itself
+                self.stderr.write(f"Skipped {e}.")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {changed} queued votes."))
@@ -0,0 +1,55 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import export, transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Create poll questions, choices and votes from NDJSON or CSV, as "
+        "written by export_polls, reading the input as a stream."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help='input file, or "-" for stdin')
+        parser.add_argument(
+            "--format",
+            choices=sorted(export.FORMATS),
+            help="input format (default: csv for a .csv file, otherwise ndjson)",
+        )
+        parser.add_argument(
+            "--no-votes",
+            action="store_false",
+            dest="votes",
+            help="ignore the voters in the input",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=transfer.BATCH_SIZE,
+            help="questions created in each transaction",
+        )
+
+    def handle(self, *args, **options):
+        path = options["input"]
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "ndjson")
+        if path == "-":
+            counts = self.load(sys.stdin, fmt, options)
+        else:
+            with open(path, newline="", encoding="utf-8") as lines:
+                counts = self.load(lines, fmt, options)
+        self.stdout.write(
+            "Imported {questions} questions, {choices} choices and {votes} votes, "
+            "and created {users} users.".format(**counts)
+        )
+
+    def load(self, lines, fmt, options):
+        try:
+            return transfer.import_polls(
+                transfer.read_records(lines, fmt),
+                votes=options["votes"],
+                batch_size=options["batch_size"],
+            )
+        except (transfer.PollFormatError, ValueError) as e:
+            raise CommandError(f"Import stopped: {e}")
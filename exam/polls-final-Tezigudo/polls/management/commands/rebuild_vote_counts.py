@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls.models import Choice
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored vote count of every poll choice from the Vote table."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = Choice.rebuild_vote_counts()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt vote counts for {updated} choices."))
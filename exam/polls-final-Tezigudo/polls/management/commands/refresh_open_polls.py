@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from polls import schedule
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the set of polls open for voting and cache it until the "
+        "next poll opens or closes. With --watch, do it again at each of "
+        "those times. The web server only sees the set if it shares the "
+        "cache, so this needs a cache such as Redis or Memcached."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="keep running, and refresh the open polls at each boundary",
+        )
+        parser.add_argument(
+            "--max-sleep",
+            type=float,
+            default=60,
+            help="with --watch, seconds between refreshes when no boundary is sooner",
+        )
+
+    def handle(self, *args, **options):
+        if not schedule.cache_is_shared():
+            message = (
+                "The cache is local to this process, so the web server won't "
+                "see the open polls computed here. Set CACHE_BACKEND to a "
+                "shared cache."
+            )
+            if options["watch"]:
+                raise CommandError(message)
+            self.stderr.write(message)
+        while True:
+            open_polls = schedule.refresh()
+            next_change = open_polls.next_change
+            self.stdout.write(
+                f"{len(open_polls.question_ids)} open polls; next change at "
+                f"{next_change.isoformat() if next_change else 'never'}"
+            )
+            if not options["watch"]:
+                return
+            close_old_connections()
+            sleep = options["max_sleep"]
+            if next_change:
+                sleep = min(sleep, (next_change - timezone.now()).total_seconds())
+            try:
+                time.sleep(max(0, sleep))
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from polls import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Vote and read results from many threads at once on SQLite, with the "
+        "default settings and with the production profile, and print the "
+        "errors and throughput of each as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=20)
+        parser.add_argument("--choices", type=int, default=4, help="choices per question")
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument(
+            "--operations", type=int, default=200, help="votes and reads per thread"
+        )
+        parser.add_argument(
+            "--write-ratio", type=float, default=0.5, help="fraction of operations that vote"
+        )
+        parser.add_argument(
+            "--profile", choices=["default", "production", "both"], default="both"
+        )
+        parser.add_argument("--output", "-o", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options["profile"] == "both":
+            profiles = ["default", "production"]
+        else:
+            profiles = [options["profile"]]
+        params = {
+            name: options[name]
+            for name in ("questions", "choices", "users", "threads", "operations",
+                         "write_ratio")
+        }
+        report = {}
+        with benchmark.temporary_database(), tempfile.TemporaryDirectory() as tmpdir:
+            seeded = benchmark.seed(
+                questions=options["questions"],
+                choices=options["choices"],
+                users=options["users"],
+                votes=0,
+            )
+            for profile in profiles:
+                path = os.path.join(tmpdir, f"{profile}.sqlite3")
+                with benchmark.sqlite_copy("stress", path, profile == "production"):
+                    report[profile] = benchmark.stress(
+                        seeded,
+                        "stress",
+                        threads=options["threads"],
+                        operations=options["operations"],
+                        write_ratio=options["write_ratio"],
+                    )
+        report["params"] = params
+        report["environment"] = benchmark.environment()
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
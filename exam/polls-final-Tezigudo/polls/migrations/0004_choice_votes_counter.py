@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_vote_counts(apps, schema_editor):
+    """Initialize Choice.votes from the existing Vote rows."""
+    Choice = apps.get_model("polls", "Choice")
+    Vote = apps.get_model("polls", "Vote")
+    counts = (
+        Vote.objects.filter(choice=OuterRef("pk"))
+        .values("choice")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Choice.objects.update(votes=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0003_alter_question_pub_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="choice",
+            name="votes",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_vote_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_vote_question(apps, schema_editor):
+    """Copy each vote's question from its choice and remove duplicate votes.
+
+    Votes without a choice have no question and are removed. If a user
+    has several votes for a question, only the latest one is kept.
+    Then the choice vote counters are recomputed without the removed votes.
+    """
+    Choice = apps.get_model("polls", "Choice")
+    Vote = apps.get_model("polls", "Vote")
+    Vote.objects.filter(choice__isnull=True).delete()
+    Vote.objects.update(
+        question=Subquery(
+            Choice.objects.filter(id=OuterRef("choice_id")).values("question_id")[:1]
+        )
+    )
+    latest = (
+        Vote.objects.values("user", "question")
+        .annotate(latest_id=Max("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in latest:
+        Vote.objects.filter(
+            user=duplicate["user"], question=duplicate["question"]
+        ).exclude(id=duplicate["latest_id"]).delete()
+    counts = (
+        Vote.objects.filter(choice=OuterRef("pk"))
+        .values("choice")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Choice.objects.update(votes=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("polls", "0004_choice_votes_counter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="polls.question",
+            ),
+        ),
+        migrations.RunPython(backfill_vote_question, migrations.RunPython.noop),
+    ]
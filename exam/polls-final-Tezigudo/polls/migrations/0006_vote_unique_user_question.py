@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0005_vote_question"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="vote",
+            name="question",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to="polls.question"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="vote",
+            constraint=models.UniqueConstraint(
+                fields=("user", "question"), name="unique_vote_per_user_question"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0006_vote_unique_user_question"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(fields=["question_text", "id"], name="question_text_id_idx"),
+        ),
+    ]
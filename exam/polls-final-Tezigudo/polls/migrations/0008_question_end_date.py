@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0007_question_text_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="end_date",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="end date"),
+        ),
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(fields=["pub_date", "end_date"], name="question_pub_end_idx"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0008_question_end_date"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                django.db.models.functions.text.Lower("question_text"),
+                name="question_lower_text_idx",
+            ),
+        ),
+    ]
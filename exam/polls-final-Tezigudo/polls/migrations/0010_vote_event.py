@@ -0,0 +1,90 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_vote_events(apps, schema_editor):
+    """Record a cast event for each existing vote, so that replaying the
+    events gives the current votes.
+    """
+    Vote = apps.get_model("polls", "Vote")
+    VoteEvent = apps.get_model("polls", "VoteEvent")
+    now = django.utils.timezone.now()
+    VoteEvent.objects.bulk_create(
+        (
+            VoteEvent(
+                action="cast",
+                user_id=vote.user_id,
+                question_id=vote.question_id,
+                choice_id=vote.choice_id,
+                created=now,
+            )
+            for vote in Vote.objects.filter(choice__isnull=False).order_by("id").iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("polls", "0009_question_lower_text_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteEvent",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("cast", "Cast"), ("change", "Change"), ("remove", "Remove")],
+                        max_length=6,
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+                ),
+                (
+                    "choice",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="polls.choice",
+                    ),
+                ),
+                (
+                    "question",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="polls.question",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_vote_events, migrations.RunPython.noop),
+    ]
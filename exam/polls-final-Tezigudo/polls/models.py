@@ -1,21 +1,99 @@
 import datetime
 
 from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Prefetch, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Concat, Greatest, Lower
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .signals import send_votes_changed
+
+
+class QuestionQuerySet(models.QuerySet):
+    """Queries for poll questions that are done in the database, not in Python."""
+
+    def published(self, now=None):
+        """Questions whose pub_date is not in the future."""
+        return self.filter(pub_date__lte=now or timezone.now())
+
+    def open(self, now=None):
+        """Published questions that can be voted on: no end_date, or an
+        end_date that has not passed.
+        """
+        now = now or timezone.now()
+        return self.published(now).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=now)
+        )
+
+    def closed(self, now=None):
+        """Questions whose end_date has passed."""
+        return self.filter(end_date__lt=now or timezone.now())
+
+    def with_vote_totals(self):
+        """Annotate each question with `vote_total`, the sum of its choice votes."""
+        return self.annotate(vote_total=Coalesce(Sum("choice__votes"), 0))
+
+    def with_choice_stats(self):
+        """Annotate each question with `vote_total` and `choice_count`.
+
+        Unlike with_vote_totals(), these are subqueries, not a join with
+        GROUP BY, so a page of questions in any order (as in the admin)
+        only sums the choices of the questions on the page.
+        """
+        choices = Choice.objects.filter(question=OuterRef("pk")).order_by().values("question")
+        return self.annotate(
+            vote_total=Coalesce(Subquery(choices.annotate(total=Sum("votes")).values("total")), 0),
+            choice_count=Coalesce(Subquery(choices.annotate(count=Count("pk")).values("count")), 0),
+        )
+
+    def text_startswith(self, prefix):
+        """Questions whose text starts with prefix, ignoring case.
+
+        This is a range on lower(question_text), so it uses the
+        question_lower_text_idx index, where a LIKE filter reads every row.
+        """
+        lowest = Lower(Value(prefix))
+        return self.alias(lower_text=Lower("question_text")).filter(
+            lower_text__gte=lowest,
+            # U+10FFFF sorts after every character that can follow prefix
+            lower_text__lt=Concat(lowest, Value(chr(0x10FFFF))),
+        )
+
+    def with_choices(self):
+        """Prefetch the choices of each question, ordered by choice text."""
+        return self.prefetch_related(
+            Prefetch("choice_set", queryset=Choice.objects.order_by("choice_text"))
+        )
+
 
 class Question(models.Model):
     question_text = models.CharField(max_length=200)
     # automatically set pub_date to today's date (auto_now)
     pub_date = models.DateTimeField("date published")
+    # voting closes after end_date; None means it never closes
+    end_date = models.DateTimeField("end date", null=True, blank=True)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # for keyset pagination of the index page
+            models.Index(fields=["question_text", "id"], name="question_text_id_idx"),
+            # for the published, open and closed filters
+            models.Index(fields=["pub_date", "end_date"], name="question_pub_end_idx"),
+            # for prefix search of question text in the admin
+            models.Index(Lower("question_text"), name="question_lower_text_idx"),
+        ]
 
     def can_vote(self):
         """Test if voting is allowed for this poll question.
 
         :return: True if voting is allowed, False if not.
         """
-        return timezone.now() >= self.pub_date
+        now = timezone.now()
+        return self.pub_date <= now and (self.end_date is None or now <= self.end_date)
 
     def __str__(self):
         return self.question_text
@@ -24,6 +102,14 @@ class Question(models.Model):
         now = timezone.now()
         return self.pub_date <= now
 
+    def ordered_choices(self):
+        """The choices ordered by choice text, from with_choices() if they
+        were prefetched, or else with a query run when they are used.
+        """
+        if "choice_set" in getattr(self, "_prefetched_objects_cache", {}):
+            return self.choice_set.all()
+        return self.choice_set.order_by("choice_text")
+
     @property
     def total_votes(self) -> int:
         """Total number of votes for this poll."""
@@ -41,21 +127,152 @@ class Question(models.Model):
 class Choice(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    # denormalized count of Vote rows for this choice, maintained by the
+    # vote views with F() updates. Rebuild with `manage.py rebuild_vote_counts`.
+    votes = models.PositiveIntegerField(default=0, editable=False)
 
-    @property
-    def votes(self) -> int:
-        """The number of votes for this Choice."""
+    def count_votes(self) -> int:
+        """Count the votes for this Choice directly from the Vote table."""
         return Vote.objects.filter(choice=self).count()
 
+    @classmethod
+    def change_vote_count(cls, choice_id, delta: int, using=None) -> None:
+        """Atomically add delta to the stored vote counter of a choice.
+
+        The update is done in the database using an F() expression, so
+        concurrent voters never overwrite each other's counts.
+        A counter is never decremented below zero.
+        """
+        if choice_id is None or delta == 0:
+            return
+        choices = cls.objects.using(using).filter(id=choice_id)
+        if delta < 0:
+            choices = choices.filter(votes__gte=-delta)
+        choices.update(votes=F("votes") + delta)
+
+    @classmethod
+    def change_vote_counts(cls, deltas) -> None:
+        """Add to the vote counters of many choices in one UPDATE statement.
+
+        :param deltas: maps choice id to the number to add to its counter.
+            Counters are never decremented below zero.
+        """
+        deltas = {choice_id: delta for choice_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        change = Case(
+            *(When(id=choice_id, then=delta) for choice_id, delta in deltas.items()),
+            output_field=models.IntegerField(),
+        )
+        cls.objects.filter(id__in=deltas).update(votes=Greatest(F("votes") + change, 0))
+
+    @classmethod
+    def rebuild_vote_counts(cls) -> int:
+        """Recompute the stored vote counter of every Choice from the Vote table.
+
+        :returns: the number of Choice rows updated.
+        """
+        counts = (
+            Vote.objects.filter(choice=OuterRef("pk"))
+            .values("choice")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return cls.objects.update(votes=Coalesce(Subquery(counts), 0))
+
     def __str__(self):
         return self.choice_text
 
 
+class VoteQuerySet(models.QuerySet):
+    def uncount(self) -> None:
+        """Take these votes off the vote counters of their choices."""
+        counts = (
+            self.filter(choice__isnull=False)
+            .order_by()
+            .values_list("choice_id", "question_id")
+            .annotate(count=Count("pk"))
+        )
+        deltas = {}
+        question_ids = set()
+        for choice_id, question_id, count in counts:
+            deltas[choice_id] = -count
+            question_ids.add(question_id)
+        Choice.change_vote_counts(deltas)
+        send_votes_changed(*question_ids)
+
+    def delete(self, uncount: bool = True):
+        """Delete the votes, and take them off the vote counters.
+
+        :param uncount: False if the caller adjusts the counters itself
+        """
+        if uncount:
+            self.uncount()
+        return super().delete()
+
+
 class Vote(models.Model):
-    """A vote by a user for a poll Question."""
+    """A vote by a user for a poll Question.
+
+    A user has at most one vote per question, which the database enforces.
+    Deleting votes with a queryset, or deleting a user, takes the votes off
+    the choice vote counters; Vote.delete() does not.
+    """
 
+    # the question is also reachable through choice, but storing it lets
+    # votes be found by (user, question) without a join
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE, null=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    objects = VoteQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # also serves as the composite index for (user, question) lookups
+            models.UniqueConstraint(
+                fields=["user", "question"], name="unique_vote_per_user_question"
+            ),
+        ]
+
     def __str__(self):
         return f'Vote for "{self.choice.choice_text}" by {self.user.username}'
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # the cascade deletes the user's votes without going through
+    # VoteQuerySet.delete(), so their counts are taken off here
+    Vote.objects.filter(user=instance).uncount()
+
+
+class VoteEvent(models.Model):
+    """A vote cast, changed or removed: the append-only history of votes.
+
+    Events are written in the same transaction as the change to the Vote
+    table, and are never updated.  The foreign keys have no database
+    constraints and are not deleted with the objects they refer to, so
+    the history outlives deleted users, questions and choices.  Events of
+    past months are moved to archive tables, see polls/audit.py.
+    """
+
+    CAST = "cast"
+    CHANGE = "change"
+    REMOVE = "remove"
+    ACTIONS = [(CAST, "Cast"), (CHANGE, "Change"), (REMOVE, "Remove")]
+
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    question = models.ForeignKey(
+        Question, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    # the choice voted for; None when the vote is removed
+    choice = models.ForeignKey(
+        Choice, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", null=True
+    )
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.action} by user {self.user_id} on question {self.question_id}"
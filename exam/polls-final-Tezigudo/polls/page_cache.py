@@ -0,0 +1,135 @@
+"""Caching of rendered poll pages.
+
+Fragments: the choices on the detail and results pages are rendered
+inside ``{% cache %}`` tags keyed by the question id and its results
+version (see results_cache), which changes when a vote commits or the
+question or its choices are saved.  The detail fragment is also keyed
+by the user's selected choice, so there is one fragment per choice and
+the user's choice is the only part looked up for each request.  The
+results fragment, which shows vote counts, is also keyed by where its
+results were read from, and is kept no longer than those results: a
+fragment read from a replica may miss the latest votes, so it is kept
+only until the replica has caught up.
+
+Pages: cache_anonymous_page() caches whole pages for anonymous users,
+keyed by the URL and a version: the question's results version for the
+detail page, and for the index a version of the question list, changed
+when any question is saved or deleted or a poll opens or closes.  Pages
+are cached for at most POLLS_PAGE_CACHE_TIMEOUT seconds.  Logged in
+users, and anonymous users with messages to show, get pages rendered for
+them.  Every page has ``Vary: Cookie``, so browsers and proxies don't
+share them either.
+"""
+import functools
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import patch_vary_headers
+
+from . import results_cache, schedule
+from .models import Question
+
+_INDEX_VERSION_KEY = "polls:index:version"
+
+
+def fragment_timeout() -> float:
+    """Seconds to keep fragments rendered in this context, as long as
+    the results they show are cached.
+    """
+    return results_cache.cache_timeout()
+
+
+def index_version() -> str:
+    """Version of the index, changed when a question changes and when
+    polls open or close.
+    """
+    cache = results_cache.get_cache()
+    cache.add(_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+    version = cache.get(_INDEX_VERSION_KEY) or time.time_ns()
+    return f"{version}:{schedule.get_open_polls().version}"
+
+
+def detail_version(pk) -> int:
+    return results_cache.get_version(pk)
+
+
+def invalidate_index():
+    """Change the index version, so cached index pages are not used."""
+    cache = results_cache.get_cache()
+    try:
+        cache.incr(_INDEX_VERSION_KEY)
+    except ValueError:
+        cache.add(_INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate_index()
+
+
+def _page_key(request, version) -> str:
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"polls:page:{request.method}:{version}:{path}"
+
+
+def _lookup(request, version, args, kwargs):
+    """Return (key, cached response) for a request; the key is None if
+    the page must not be cached.
+    """
+    timeout = getattr(settings, "POLLS_PAGE_CACHE_TIMEOUT", 60)
+    if (
+        timeout <= 0
+        or request.method not in ("GET", "HEAD")
+        or request.user.is_authenticated
+        # the page would show them, and they are for this user only
+        or len(messages.get_messages(request))
+    ):
+        return None, None
+    key = _page_key(request, version(*args, **kwargs))
+    return key, results_cache.get_cache().get(key)
+
+
+def _finish(response, key, status):
+    patch_vary_headers(response, ("Cookie",))
+    if key is None:
+        return response
+    response["X-Page-Cache"] = status
+    if status == "miss" and response.status_code == 200 and not response.cookies:
+        timeout = getattr(settings, "POLLS_PAGE_CACHE_TIMEOUT", 60)
+
+        def store(response):
+            results_cache.get_cache().set(key, response, timeout)
+
+        if hasattr(response, "render") and callable(response.render):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+    return response
+
+
+def cache_anonymous_page(view, version):
+    """Decorate a view, sync or async, to cache its pages for anonymous users.
+
+    :param version: function of the view's arguments that returns the
+        version of the page's content, so changed content gets new keys
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            key, cached = await sync_to_async(_lookup)(request, version, args, kwargs)
+            if cached is not None:
+                return _finish(cached, key, "hit")
+            return _finish(await view(request, *args, **kwargs), key, "miss")
+    else:
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            key, cached = _lookup(request, version, args, kwargs)
+            if cached is not None:
+                return _finish(cached, key, "hit")
+            return _finish(view(request, *args, **kwargs), key, "miss")
+    return wrapped
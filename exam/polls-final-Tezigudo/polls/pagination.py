@@ -0,0 +1,110 @@
+"""Keyset (seek) pagination.
+
+Instead of OFFSET, each page starts after (or before) the sort key of an
+item on the adjacent page, so the database can seek to it with an index
+and every page costs the same no matter how deep it is.  The sort key is
+an ordering field plus the primary key, which makes it unique and the
+order stable even when many rows have the same field value.
+
+Cursors are opaque strings that encode the key of the first or last
+item of a page.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from django.db.models import Q
+from django.http import Http404
+
+
+def encode_cursor(key) -> str:
+    data = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Decode a cursor. Raises Http404 if the cursor is not valid."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, pk = json.loads(data)
+    except (binascii.Error, ValueError, TypeError):
+        raise Http404("Invalid page cursor")
+    # the paginated field is a text field, so a cursor value is a string
+    if not isinstance(value, str) or not isinstance(pk, int):
+        raise Http404("Invalid page cursor")
+    return value, pk
+
+
+@dataclass
+class KeysetPage:
+    object_list: List = field(default_factory=list)
+    has_next: bool = False
+    has_previous: bool = False
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+
+class KeysetPaginator:
+    """Paginate a queryset ordered by (field, pk).
+
+    :param queryset: the rows to paginate
+    :param field: name of the field to order by; the primary key breaks ties
+    :param per_page: maximum number of items on a page
+    """
+
+    def __init__(self, queryset, field: str, per_page: int):
+        self.queryset = queryset
+        self.field = field
+        self.per_page = per_page
+
+    def key(self, obj):
+        return getattr(obj, self.field), obj.pk
+
+    def _rows(self, after: Optional[str], before: Optional[str]):
+        """The queryset of rows for a page, one more than the page size
+        to tell if there are more pages.
+        """
+        if before:
+            value, pk = decode_cursor(before)
+            return self.queryset.filter(
+                Q(**{f"{self.field}__lt": value}) | Q(**{self.field: value, "pk__lt": pk})
+            ).order_by(f"-{self.field}", "-pk")[: self.per_page + 1]
+        queryset = self.queryset
+        if after:
+            value, pk = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(**{f"{self.field}__gt": value}) | Q(**{self.field: value, "pk__gt": pk})
+            )
+        return queryset.order_by(self.field, "pk")[: self.per_page + 1]
+
+    def _page(self, rows: List, after: Optional[str], before: Optional[str]) -> KeysetPage:
+        more = len(rows) > self.per_page
+        if before:
+            items = rows[: self.per_page][::-1]
+            # we came from the next page, so it exists
+            has_next, has_previous = True, more
+        else:
+            items = rows[: self.per_page]
+            has_next, has_previous = more, bool(after)
+
+        page = KeysetPage(items, has_next=has_next and bool(items),
+                          has_previous=has_previous and bool(items))
+        if page.has_next:
+            page.next_cursor = encode_cursor(self.key(items[-1]))
+        if page.has_previous:
+            page.previous_cursor = encode_cursor(self.key(items[0]))
+        return page
+
+    def page(self, after: Optional[str] = None, before: Optional[str] = None) -> KeysetPage:
+        """Return the page after the `after` cursor, or before the `before`
+        cursor, or the first page if neither is given.
+        """
+        return self._page(list(self._rows(after, before)), after, before)
+
+    async def apage(self, after: Optional[str] = None,
+                    before: Optional[str] = None) -> KeysetPage:
+        """Async version of page()."""
+        rows = [row async for row in self._rows(after, before)]
+        return self._page(rows, after, before)
@@ -0,0 +1,178 @@
+"""Token bucket rate limiting of the vote views.
+
+Each user, and each client IP address, has a bucket that holds up to
+POLLS_RATE_LIMIT_BURST tokens and refills at POLLS_RATE_LIMIT_RATE
+tokens per second.  A request to a view decorated with @rate_limited
+takes a token from the bucket of its user, if logged in, and from the
+bucket of its IP address.  If either is empty, the request is denied
+with a 429 response whose Retry-After header is the seconds until a
+token is back, and no token is taken.  A burst or a rate of 0 turns the
+limit off.
+
+Clients behind one proxy or NAT share an IP address, and so an IP
+bucket.  Behind a reverse proxy, set POLLS_RATE_LIMIT_IP_HEADER to the
+META key of the header it adds the client address to, such as
+"HTTP_X_FORWARDED_FOR"; the last address in it is used, since that is
+the one the proxy added.  Only do so when every request comes through
+the proxy, as clients can send the header themselves.  With
+POLLS_RATE_LIMIT_BY_IP off, logged in users are limited by their user
+bucket only.
+
+The buckets are kept in the POLLS_RATE_LIMIT_CACHE cache (default
+"default"), so processes that share a cache share the buckets.  Reading
+and writing a bucket are separate cache calls, so concurrent requests
+can now and then take the same token: the limit is approximate.  If the
+cache fails, the buckets are kept in the memory of this process until
+it works again.
+
+stats() gives the number of requests allowed ("hits") and denied, and
+how many times the memory fallback was used.  They are shown with the
+request metrics at /debug/requests/.
+"""
+import functools
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import List, Optional
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+
+# the memory fallback keeps at most this many buckets, dropping the
+# least recently used
+MEMORY_BUCKETS = 10000
+
+_stats = Counter()
+_lock = threading.Lock()
+_memory = OrderedDict()
+
+
+def stats() -> dict:
+    """Return the number of requests allowed and denied, and the number
+    of times the buckets were kept in memory because the cache failed.
+    """
+    with _lock:
+        return {
+            "hits": _stats["hit"],
+            "denied": _stats["denied"],
+            "fallbacks": _stats["fallback"],
+        }
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def _record(event: str):
+    with _lock:
+        _stats[event] += 1
+
+
+def enabled() -> bool:
+    return (
+        getattr(settings, "POLLS_RATE_LIMIT_BURST", 20) > 0
+        and getattr(settings, "POLLS_RATE_LIMIT_RATE", 1.0) > 0
+    )
+
+
+def client_ip(request: HttpRequest) -> str:
+    header = getattr(settings, "POLLS_RATE_LIMIT_IP_HEADER", "")
+    forwarded = request.META.get(header, "") if header else ""
+    addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+    return addresses[-1] if addresses else request.META.get("REMOTE_ADDR", "")
+
+
+def bucket_keys(request: HttpRequest) -> List[str]:
+    keys = []
+    if not request.user.is_authenticated or getattr(settings, "POLLS_RATE_LIMIT_BY_IP", True):
+        keys.append(f"polls:ratelimit:ip:{client_ip(request)}")
+    if request.user.is_authenticated:
+        keys.append(f"polls:ratelimit:user:{request.user.pk}")
+    return keys
+
+
+def _get_buckets(keys):
+    try:
+        return caches[getattr(settings, "POLLS_RATE_LIMIT_CACHE", "default")].get_many(keys)
+    except Exception:
+        _record("fallback")
+        with _lock:
+            return {key: _memory[key] for key in keys if key in _memory}
+
+
+def _set_buckets(buckets, timeout):
+    try:
+        caches[getattr(settings, "POLLS_RATE_LIMIT_CACHE", "default")].set_many(
+            buckets, timeout
+        )
+    except Exception:
+        _record("fallback")
+        with _lock:
+            for key, bucket in buckets.items():
+                _memory[key] = bucket
+                _memory.move_to_end(key)
+            while len(_memory) > MEMORY_BUCKETS:
+                _memory.popitem(last=False)
+
+
+def take(keys: List[str], now: Optional[float] = None) -> float:
+    """Take a token from each bucket, if all have one.
+
+    :returns: 0 if the tokens were taken or the limit is off, otherwise
+        the seconds until every bucket has a token
+    """
+    if not enabled():
+        return 0
+    burst = getattr(settings, "POLLS_RATE_LIMIT_BURST", 20)
+    rate = getattr(settings, "POLLS_RATE_LIMIT_RATE", 1.0)
+    now = time.time() if now is None else now
+    # (tokens, time) of each bucket; a bucket not stored is full
+    stored = _get_buckets(keys)
+    tokens = {}
+    for key in keys:
+        count, updated = stored.get(key, (burst, now))
+        tokens[key] = min(burst, count + max(0.0, now - updated) * rate)
+    wait = max((1 - count) / rate for count in tokens.values())
+    if wait > 0:
+        _record("denied")
+        return wait
+    _record("hit")
+    # a bucket left alone this long is full, so it need not be kept
+    _set_buckets({key: (count - 1, now) for key, count in tokens.items()}, burst / rate + 1)
+    return 0
+
+
+def check(request: HttpRequest) -> Optional[HttpResponse]:
+    """Take the request's tokens, or return the 429 response if it has none."""
+    if not enabled():
+        return None
+    wait = take(bucket_keys(request))
+    if not wait:
+        return None
+    response = HttpResponse("Too many requests. Please try again later.", status=429)
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+def rate_limited(view):
+    """Decorate a view, sync or async, to limit the rate of its requests."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            # loading the user may read the session from the database
+            denied = await sync_to_async(check)(request)
+            if denied is not None:
+                return denied
+            return await view(request, *args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            denied = check(request)
+            if denied is not None:
+                return denied
+            return view(request, *args, **kwargs)
+    return wrapped
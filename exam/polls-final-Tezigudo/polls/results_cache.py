@@ -0,0 +1,209 @@
+"""Cache of poll results, invalidated when votes change.
+
+Each question has a version number in the cache. The results of a
+question are cached under a key that includes its version, and the
+version is bumped when the votes_changed signal says that a vote
+transaction committed, so the next request computes fresh results. Old
+entries simply expire.
+
+If ``POLLS_RESULTS_STALE_SECONDS`` is more than zero, results computed
+for an older version may be served for that many seconds after they were
+computed. This lets very busy polls recompute their results at most once
+per staleness window instead of once per vote.
+
+Results computed on a read replica are cached for at most
+``DATABASE_REPLICA_STICKY_SECONDS``, since the replica may not have the
+latest votes yet.  They are cached apart from results read from the
+primary, so a session that reads from the primary after voting never
+gets results that a lagging replica gave another request.
+
+The cache alias is ``POLLS_RESULTS_CACHE`` (default "default"), so any
+Django cache backend can be used.
+"""
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import routers
+from .models import Choice, Question
+from .signals import votes_changed
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, "POLLS_RESULTS_CACHE", "default")]
+
+
+def _version_key(question_id) -> str:
+    return f"polls:results:{question_id}:version"
+
+
+def read_source() -> str:
+    """Where results are read from in this context: "primary" or "replica"."""
+    return "replica" if routers.reads_from_replica() else "primary"
+
+
+def _latest_key(question_id, source) -> str:
+    return f"polls:results:{question_id}:{source}:latest"
+
+
+def _record(event: str):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def stats() -> dict:
+    """Return the number of cache hits, stale hits and misses so far."""
+    with _stats_lock:
+        return {
+            "hits": _stats["hit"],
+            "stale_hits": _stats["stale"],
+            "misses": _stats["miss"],
+        }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_version(question_id) -> int:
+    """Return the current results version of a question."""
+    cache = get_cache()
+    key = _version_key(question_id)
+    # start from the clock, not from 1, so entries cached before the
+    # version key was evicted can't be mistaken for current ones
+    cache.add(key, time.time_ns(), timeout=None)
+    version = cache.get(key)
+    return version if version is not None else time.time_ns()
+
+
+async def aget_version(question_id) -> int:
+    """Async version of get_version()."""
+    cache = get_cache()
+    key = _version_key(question_id)
+    await cache.aadd(key, time.time_ns(), timeout=None)
+    version = await cache.aget(key)
+    return version if version is not None else time.time_ns()
+
+
+def bump_version(question_id):
+    """Invalidate the cached results of a question immediately."""
+    cache = get_cache()
+    key = _version_key(question_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def invalidate(*question_ids: int):
+    """Invalidate the cached results of questions when the current
+    transaction commits (or now, if there is no transaction).
+    """
+    for question_id in set(question_ids):
+        transaction.on_commit(lambda qid=question_id: bump_version(qid))
+
+
+def _stale_seconds() -> float:
+    return getattr(settings, "POLLS_RESULTS_STALE_SECONDS", 0)
+
+
+def cache_timeout() -> float:
+    """Seconds to keep results computed in this context."""
+    timeout = getattr(settings, "POLLS_RESULTS_CACHE_TIMEOUT", 300)
+    if routers.reads_from_replica():
+        # results read from a replica may miss the latest votes, so keep
+        # them only until the replica has caught up
+        timeout = min(timeout, getattr(settings, "DATABASE_REPLICA_STICKY_SECONDS", 5))
+    return timeout
+
+
+def _lookup_keys(question_id, version, stale_seconds):
+    source = read_source()
+    keys = [f"polls:results:{question_id}:{source}:{version}"]
+    if stale_seconds > 0:
+        keys.append(_latest_key(question_id, source))
+    return keys
+
+
+def _lookup(keys, entries, stale_seconds):
+    """Return (results, status, version) from cache entries, or None on a miss."""
+    entry = entries.get(keys[0])
+    if entry is not None:
+        _record("hit")
+        return entry[1], "hit", entry[2]
+    latest = entries.get(keys[-1]) if stale_seconds > 0 else None
+    if latest and time.time() - latest[0] < stale_seconds:
+        _record("stale")
+        return latest[1], "stale", latest[2]
+    _record("miss")
+    return None
+
+
+def _entries(keys, results, version):
+    """Cache entries for computed results, under every lookup key."""
+    entry = (time.time(), results, version)
+    return {key: entry for key in keys}
+
+
+def get_results(question_id, compute: Callable):
+    """Return the cached results for a question, or compute and cache them.
+
+    :param question_id: id of the poll question
+    :param compute: function that computes the results; it is called
+        only on a cache miss.  Exceptions it raises are not cached.
+    :returns: a tuple (results, status, version) where status is "hit",
+        "stale" or "miss", and version is the version of the question
+        that the results were computed for, which is older than the
+        current version if they are stale.
+    """
+    cache = get_cache()
+    stale_seconds = _stale_seconds()
+    version = get_version(question_id)
+    keys = _lookup_keys(question_id, version, stale_seconds)
+    found = _lookup(keys, cache.get_many(keys), stale_seconds)
+    if found:
+        return found
+    results = compute()
+    cache.set_many(_entries(keys, results, version), timeout=cache_timeout())
+    return results, "miss", version
+
+
+async def aget_results(question_id, compute: Callable):
+    """Async version of get_results(). compute is an async function."""
+    cache = get_cache()
+    stale_seconds = _stale_seconds()
+    version = await aget_version(question_id)
+    keys = _lookup_keys(question_id, version, stale_seconds)
+    found = _lookup(keys, await cache.aget_many(keys), stale_seconds)
+    if found:
+        return found
+    results = await compute()
+    await cache.aset_many(_entries(keys, results, version), timeout=cache_timeout())
+    return results, "miss", version
+
+
+@receiver(votes_changed)
+def votes_changed_handler(sender, question_ids, **kwargs):
+    for question_id in question_ids:
+        bump_version(question_id)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    invalidate(instance.question_id)
@@ -0,0 +1,169 @@
+"""Read replica routing.
+
+ReplicaRouter sends reads to a randomly chosen read replica, and writes
+to the primary ("default") database.  Reads go to the primary instead
+
+* in views decorated with @primary_db, such as the vote views, so a
+  vote is checked against current data,
+* inside a transaction on the primary, so a transaction reads its own
+  writes,
+* for sessions, so a new login is seen at once, and
+* for a session that wrote to the database in the last
+  DATABASE_REPLICA_STICKY_SECONDS, so a voter sees their own vote
+  (read-your-writes).  ReplicaPinMiddleware keeps this time in the
+  session.
+
+Settings (read from .env by settings.py):
+    DATABASE_REPLICA_ALIASES         aliases of the replicas in DATABASES
+    DATABASE_REPLICA_STICKY_SECONDS  how long a session reads from the
+                                     primary after it writes; should be
+                                     more than the replication lag
+"""
+import functools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# session key of the time until which the session reads from the primary
+SESSION_KEY = "_db_primary_until"
+
+
+class _State:
+    """Routing state of a request, shared with its sync_to_async threads."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state: ContextVar[Optional[_State]] = ContextVar("polls_db_routing", default=None)
+
+
+def replica_aliases():
+    return getattr(settings, "DATABASE_REPLICA_ALIASES", [])
+
+
+def reads_from_replica() -> bool:
+    """True if reads in this context go to a replica."""
+    state = _state.get()
+    return bool(replica_aliases()) and not (state and state.pinned)
+
+
+@contextmanager
+def use_primary():
+    """Send reads in the block to the primary."""
+    state = _state.get()
+    if state is None:
+        token = _state.set(_State(pinned=True))
+        try:
+            yield
+        finally:
+            _state.reset(token)
+        return
+    pinned, state.pinned = state.pinned, True
+    try:
+        yield
+    finally:
+        state.pinned = pinned
+
+
+def primary_db(view):
+    """Decorate a view, sync or async, to read from the primary."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapped(*args, **kwargs):
+            with use_primary():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            with use_primary():
+                return view(*args, **kwargs)
+    return wrapped
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or model._meta.app_label == "sessions":
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state and model._meta.app_label != "sessions":
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas have the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Read from the primary for a while after a session writes.
+
+    Must come after SessionMiddleware, so the session is saved after
+    this middleware updates it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = _State(pinned=self.pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.pin(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = _State(pinned=await sync_to_async(self.pinned)(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        await sync_to_async(self.pin)(request, state)
+        return response
+
+    @staticmethod
+    def pinned(request) -> bool:
+        if not replica_aliases():
+            return False
+        return request.session.get(SESSION_KEY, 0) > time.time()
+
+    @staticmethod
+    def pin(request, state):
+        if state.wrote and replica_aliases():
+            request.session[SESSION_KEY] = time.time() + getattr(
+                settings, "DATABASE_REPLICA_STICKY_SECONDS", 5
+            )
@@ -0,0 +1,97 @@
+"""The set of polls that are open for voting, cached between boundaries.
+
+Which polls are open only changes when a question is saved or deleted,
+or at a boundary: the next pub_date or end_date after now.  So the set
+of open poll ids is computed once, with queries that use the
+(pub_date, end_date) index, and cached until the next boundary.  The
+index page reads it from the cache instead of checking every question.
+
+The ``refresh_open_polls`` management command computes the set ahead of
+time, at each boundary; without it, the first request after a boundary
+computes it.  The command runs in its own process, so this only helps
+when the cache is shared between processes (not LocMemCache).
+"""
+import datetime
+from dataclasses import dataclass
+from typing import FrozenSet, Optional
+
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import results_cache
+from .models import Question
+
+_CACHE_KEY = "polls:open"
+
+
+@dataclass(frozen=True)
+class OpenPolls:
+    question_ids: FrozenSet[int]
+    computed_at: datetime.datetime
+    # the next time a poll opens or closes, or None if none will
+    next_change: Optional[datetime.datetime]
+
+    def is_current(self, now=None) -> bool:
+        return self.next_change is None or (now or timezone.now()) < self.next_change
+
+    @property
+    def version(self) -> str:
+        return self.computed_at.isoformat()
+
+
+def compute_open_polls(now=None) -> OpenPolls:
+    """Find the open polls and the next boundary, in three queries."""
+    now = now or timezone.now()
+    question_ids = frozenset(Question.objects.open(now).values_list("id", flat=True))
+    next_pub = Question.objects.filter(pub_date__gt=now).aggregate(next=Min("pub_date"))
+    next_end = Question.objects.filter(end_date__gte=now).aggregate(next=Min("end_date"))
+    boundaries = [
+        # a poll closes just after its end_date
+        boundary for boundary in (
+            next_pub["next"],
+            next_end["next"] and next_end["next"] + datetime.timedelta(microseconds=1),
+        )
+        if boundary
+    ]
+    return OpenPolls(question_ids, now, min(boundaries, default=None))
+
+
+def refresh(now=None) -> OpenPolls:
+    """Compute the open polls and cache them until the next boundary."""
+    open_polls = compute_open_polls(now)
+    timeout = None
+    if open_polls.next_change:
+        timeout = max(1, (open_polls.next_change - open_polls.computed_at).total_seconds())
+    results_cache.get_cache().set(_CACHE_KEY, open_polls, timeout=timeout)
+    return open_polls
+
+
+def cache_is_shared() -> bool:
+    """Whether other processes see the open polls this one caches."""
+    return not isinstance(results_cache.get_cache(), (LocMemCache, DummyCache))
+
+
+def get_open_polls() -> OpenPolls:
+    """The open polls, from the cache if they are still current."""
+    open_polls = results_cache.get_cache().get(_CACHE_KEY)
+    if open_polls is None or not open_polls.is_current():
+        open_polls = refresh()
+    return open_polls
+
+
+def invalidate():
+    """Forget the cached open polls when the current transaction commits
+    (or now, if there is no transaction), so the set isn't computed again
+    from old data.
+    """
+    transaction.on_commit(lambda: results_cache.get_cache().delete(_CACHE_KEY))
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate()
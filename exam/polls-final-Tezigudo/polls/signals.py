@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.dispatch import Signal
+
+# Sent after a transaction that changed votes commits.
+# Arguments: question_ids, a set of the ids of the questions whose votes changed.
+votes_changed = Signal()
+
+
+def send_votes_changed(*question_ids: int, using=None):
+    """Send votes_changed when the current transaction on database
+    `using` commits (or now, if there is no transaction).
+    """
+    question_ids = set(question_ids)
+    if question_ids:
+        transaction.on_commit(
+            lambda: votes_changed.send(sender=None, question_ids=question_ids),
+            using=using,
+        )
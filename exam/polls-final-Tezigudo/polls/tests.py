@@ -1,10 +1,28 @@
 import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock, skipIf
 
-from django.test import TestCase
-from django.urls import reverse
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve, reverse
 from django.utils import timezone
 
-from .models import Question
+from mysite import middleware
+from . import (
+    async_views, audit, benchmark, export, live, page_cache, pagination, ratelimit,
+    results_cache, routers, schedule, transfer, vote_queue, voting,
+)
+from .models import Choice, Question, Vote, VoteEvent
+from .views import get_vote_for_user
 
 
 class QuestionModelTests(TestCase):
@@ -47,6 +65,10 @@ def create_question(question_text, days):
 
 
 class QuestionIndexViewTests(TestCase):
+    def setUp(self):
+        # pages are cached, and rolling back a test doesn't invalidate them
+        cache.clear()
+
     def test_no_questions(self):
         """
         If no questions exist, an appropriate message is displayed.
@@ -100,6 +122,10 @@ class QuestionIndexViewTests(TestCase):
 
 
 class QuestionDetailViewTests(TestCase):
+    def setUp(self):
+        # pages are cached, and rolling back a test doesn't invalidate them
+        cache.clear()
+
     def test_future_question(self):
         """
         The detail view of a question with a pub_date in the future
@@ -119,3 +145,1491 @@ class QuestionDetailViewTests(TestCase):
         url = reverse("polls:detail", args=(past_question.id,))
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
+
+    def test_choices_in_text_order(self):
+        """The choices are listed by text, as on the results page."""
+        question = create_question(question_text="Ordered?", days=-1)
+        for text in ("choice b", "choice c", "choice a"):
+            question.choice_set.create(choice_text=text)
+        content = self.client.get(reverse("polls:detail", args=(question.id,))).content.decode()
+        positions = [content.index(text) for text in ("choice a", "choice b", "choice c")]
+        self.assertEqual(sorted(positions), positions)
+
+
+class VoteCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Vote count question.", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="Choice 1")
+        self.choice2 = self.question.choice_set.create(choice_text="Choice 2")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        self.client.force_login(self.user)
+        self.vote_url = reverse("polls:vote", args=(self.question.id,))
+
+    def assertVoteCounts(self, *expected):
+        counts = [
+            Choice.objects.get(id=choice.id).votes
+            for choice in (self.choice1, self.choice2)
+        ]
+        self.assertEqual(list(expected), counts)
+
+    def test_vote_increments_count(self):
+        """Casting a vote increments the counter of the selected choice."""
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.assertVoteCounts(1, 0)
+
+    def test_same_vote_is_unchanged(self):
+        """Voting for the same choice again says so and changes nothing."""
+        self.client.post(self.vote_url, {"choice": self.choice1.id}, follow=True)
+        response = self.client.post(self.vote_url, {"choice": self.choice1.id}, follow=True)
+        self.assertEqual(
+            ["You already voted for this choice."],
+            [str(message) for message in response.context["messages"]],
+        )
+        self.assertVoteCounts(1, 0)
+
+    def test_change_vote_moves_count(self):
+        """Changing a vote moves one count from the old to the new choice."""
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.client.post(self.vote_url, {"choice": self.choice2.id})
+        self.assertVoteCounts(0, 1)
+        # voting again for the same choice does not change the counts
+        self.client.post(self.vote_url, {"choice": self.choice2.id})
+        self.assertVoteCounts(0, 1)
+
+    def test_remove_vote_decrements_count(self):
+        """Removing a vote decrements the counter of the voted choice."""
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.client.post(reverse("polls:remove_vote", args=(self.question.id,)))
+        self.assertVoteCounts(0, 0)
+        self.assertEqual(0, Vote.objects.count())
+
+    def test_remove_vote_on_closed_poll(self):
+        """A vote cannot be removed once the poll has ended."""
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.question.end_date = timezone.now() - datetime.timedelta(minutes=1)
+        self.question.save()
+        response = self.client.post(reverse("polls:remove_vote", args=(self.question.id,)))
+        self.assertContains(response, "Voting not allowed for this question")
+        self.assertVoteCounts(1, 0)
+        self.assertEqual(1, Vote.objects.count())
+
+    def test_one_vote_per_user_and_question(self):
+        """The database rejects a second vote by a user for a question."""
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(user=self.user, question=self.question, choice=self.choice2)
+        self.assertEqual(1, Vote.objects.count())
+
+    def test_get_vote_for_user_without_join(self):
+        """A user's vote is found by (user, question) without joining Choice."""
+        self.client.post(self.vote_url, {"choice": self.choice2.id})
+        with CaptureQueriesContext(connection) as queries:
+            vote = get_vote_for_user(self.question, self.user)
+        self.assertEqual(self.choice2.id, vote.choice_id)
+        self.assertEqual(1, len(queries))
+        self.assertNotIn("JOIN", queries[0]["sql"])
+
+    def test_rebuild_vote_counts_command(self):
+        """rebuild_vote_counts restores the counters from the Vote table."""
+        Vote.objects.create(user=self.user, question=self.question, choice=self.choice2)
+        Choice.objects.update(votes=7)
+        call_command("rebuild_vote_counts", stdout=StringIO())
+        self.assertVoteCounts(0, 1)
+        self.assertEqual(self.choice2.count_votes(), 1)
+
+    def test_results_query_count_is_constant(self):
+        """The results page does not run one query per choice."""
+        url = reverse("polls:results", args=(self.question.id,))
+        self.client.logout()
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(10):
+                self.question.choice_set.create(choice_text=f"Extra {n}")
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+
+class VoteCounterDeleteTests(TestCase):
+    """Votes deleted outside the vote views are taken off the counters."""
+
+    def setUp(self):
+        self.question = create_question(question_text="Counted question.", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="Choice")
+        self.users = [User.objects.create_user(f"voter{n}", password="Hackme99") for n in range(3)]
+        voting.apply_votes({(user.id, self.question.id): self.choice.id for user in self.users})
+
+    def votes(self):
+        return Choice.objects.get(id=self.choice.id).votes
+
+    def test_deleting_a_user(self):
+        self.users[0].delete()
+        self.assertEqual(2, self.votes())
+        User.objects.filter(id=self.users[1].id).delete()
+        self.assertEqual(1, self.votes())
+
+    def test_queryset_delete(self):
+        Vote.objects.filter(user__in=self.users[:2]).delete()
+        self.assertEqual(1, self.votes())
+        self.assertEqual(1, self.choice.count_votes())
+
+
+class VoteHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="History question.", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="Choice 1")
+        self.choice2 = self.question.choice_set.create(choice_text="Choice 2")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        self.client.force_login(self.user)
+
+    def events(self):
+        return list(VoteEvent.objects.order_by("id").values_list("action", "choice_id"))
+
+    def test_vote_views_record_events(self):
+        vote_url = reverse("polls:vote", args=(self.question.id,))
+        self.client.post(vote_url, {"choice": self.choice1.id})
+        self.client.post(vote_url, {"choice": self.choice2.id})
+        # the same choice again changes nothing
+        self.client.post(vote_url, {"choice": self.choice2.id})
+        self.client.post(reverse("polls:remove_vote", args=(self.question.id,)))
+        self.assertEqual(
+            [("cast", self.choice1.id), ("change", self.choice2.id), ("remove", None)],
+            self.events(),
+        )
+
+    def test_apply_votes_records_events(self):
+        key = (self.user.id, self.question.id)
+        voting.apply_votes({key: self.choice1.id})
+        voting.apply_votes({key: self.choice1.id})
+        voting.apply_votes({key: None})
+        self.assertEqual([("cast", self.choice1.id), ("remove", None)], self.events())
+
+    def test_events_outlive_deleted_questions(self):
+        voting.apply_votes({(self.user.id, self.question.id): self.choice1.id})
+        self.question.delete()
+        self.assertEqual(1, VoteEvent.objects.count())
+
+    def record_at(self, when, choice):
+        with mock.patch.object(timezone, "now", return_value=when):
+            voting.apply_votes({(self.user.id, self.question.id): choice and choice.id})
+
+    def test_rollover_and_replay(self):
+        """Events of past months move to archive tables, and replaying every
+        table gives the current votes.
+        """
+        now = timezone.now()
+        other = User.objects.create_user("other", password="Hackme99")
+        self.record_at(now - datetime.timedelta(days=70), self.choice1)
+        self.record_at(now - datetime.timedelta(days=40), None)
+        voting.apply_votes({(other.id, self.question.id): self.choice1.id})
+        self.record_at(now, self.choice2)
+
+        moved = audit.rollover()
+        self.assertEqual(2, sum(moved.values()))
+        self.assertEqual(list(moved), [t for t in audit.archive_tables() if t in moved])
+        self.assertEqual(2, VoteEvent.objects.count())
+        self.assertEqual({}, audit.rollover())
+        self.assertEqual(
+            {
+                (self.user.id, self.question.id): self.choice2.id,
+                (other.id, self.question.id): self.choice1.id,
+            },
+            audit.replay(),
+        )
+
+    def test_compact_command_rebuilds_votes(self):
+        voting.apply_votes({(self.user.id, self.question.id): self.choice2.id})
+        Vote.objects.all().delete()
+        self.choice1.votes = 5
+        self.choice1.save()
+
+        out = StringIO()
+        call_command("compact_vote_events", "--check", stdout=out)
+        self.assertIn(
+            "1 votes differ from the vote events, and 0 votes have no events",
+            out.getvalue(),
+        )
+        self.assertEqual(0, Vote.objects.count())
+
+        out = StringIO()
+        call_command("compact_vote_events", "--rebuild", stdout=out)
+        self.assertIn("Rebuilt 1 votes", out.getvalue())
+        vote = Vote.objects.get()
+        self.assertEqual((self.user.id, self.choice2.id), (vote.user_id, vote.choice_id))
+        counts = list(Choice.objects.order_by("id").values_list("votes", flat=True))
+        self.assertEqual([0, 1], counts)
+
+    def test_rebuild_keeps_votes_without_events(self):
+        """Votes loaded without events, e.g. by loaddata, survive a rebuild."""
+        other = User.objects.create_user("other", password="Hackme99")
+        voting.apply_votes({(self.user.id, self.question.id): self.choice1.id})
+        voting.apply_votes({(self.user.id, self.question.id): None})
+        Vote.objects.create(user=self.user, question=self.question, choice=self.choice2)
+        Vote.objects.create(user=other, question=self.question, choice=self.choice1)
+
+        self.assertEqual({"differ": 1, "unrecorded": 1}, audit.differences(audit.replay()))
+        result = audit.rebuild(audit.replay())
+        self.assertEqual({"votes": 0, "removed": 1, "skipped": 0}, result)
+        vote = Vote.objects.get()
+        self.assertEqual((other.id, self.choice1.id), (vote.user_id, vote.choice_id))
+
+        out = StringIO()
+        call_command("compact_vote_events", "--backfill", "--check", stdout=out)
+        self.assertIn("Recorded 1 events", out.getvalue())
+        self.assertIn("0 votes differ from the vote events, and 0 votes", out.getvalue())
+
+
+class QuestionQuerySetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        for n in range(3):
+            question = create_question(question_text=f"Question {n}.", days=-n - 1)
+            for text in ("b", "c", "a"):
+                question.choice_set.create(choice_text=text)
+        create_question(question_text="Future question.", days=5)
+
+    def test_published(self):
+        """published() excludes questions with a future pub_date."""
+        texts = Question.objects.published().values_list("question_text", flat=True)
+        self.assertNotIn("Future question.", texts)
+        self.assertEqual(3, len(texts))
+
+    def test_with_vote_totals(self):
+        """with_vote_totals() annotates the sum of the choice votes."""
+        question = Question.objects.get(question_text="Question 0.")
+        question.choice_set.filter(choice_text="a").update(votes=2)
+        question.choice_set.filter(choice_text="b").update(votes=3)
+        totals = dict(
+            Question.objects.with_vote_totals().values_list("question_text", "vote_total")
+        )
+        self.assertEqual(5, totals["Question 0."])
+        self.assertEqual(0, totals["Question 1."])
+
+    def test_with_choice_stats(self):
+        """with_choice_stats() annotates vote totals and choice counts."""
+        question = Question.objects.get(question_text="Question 0.")
+        question.choice_set.filter(choice_text="a").update(votes=2)
+        question.choice_set.filter(choice_text="b").update(votes=3)
+        stats = {
+            q.question_text: (q.vote_total, q.choice_count)
+            for q in Question.objects.with_choice_stats()
+        }
+        self.assertEqual((5, 3), stats["Question 0."])
+        self.assertEqual((0, 3), stats["Question 1."])
+        self.assertEqual((0, 0), stats["Future question."])
+
+    def test_text_startswith(self):
+        """text_startswith() matches a prefix of the text, ignoring case."""
+        texts = Question.objects.text_startswith("qUESTION 1").values_list(
+            "question_text", flat=True
+        )
+        self.assertEqual(["Question 1."], list(texts))
+        self.assertFalse(Question.objects.text_startswith("uestion").exists())
+        self.assertFalse(Question.objects.text_startswith("Question 1.x").exists())
+
+    def test_with_choices_are_ordered(self):
+        """with_choices() prefetches the choices in order of choice text."""
+        with self.assertNumQueries(2):
+            questions = list(Question.objects.with_choices())
+            texts = [c.choice_text for c in questions[0].choice_set.all()]
+        self.assertEqual(["a", "b", "c"], texts)
+
+    def test_index_query_count(self):
+        """The index page uses one query for any number of questions."""
+        # the open polls are computed ahead, as by refresh_open_polls
+        schedule.refresh()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("polls:index"))
+        self.assertEqual(3, len(response.context["question_list"]))
+
+    def test_detail_query_count(self):
+        """The detail page loads the question and its choices in two queries."""
+        question = Question.objects.get(question_text="Question 0.")
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("polls:detail", args=(question.id,)))
+        self.assertContains(response, "Question 0.")
+
+    def test_results_query_count(self):
+        """The results page loads the question, total and choices in two queries."""
+        question = Question.objects.get(question_text="Question 0.")
+        question.choice_set.filter(choice_text="c").update(votes=4)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("polls:results", args=(question.id,)))
+        self.assertEqual(4, response.context["question"].vote_total)
+
+
+class QuestionAdminTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser("admin", password="Hackme99")
+        self.client.force_login(admin)
+        self.question = create_question(question_text="What's up?", days=-1)
+        for text, votes in (("Not much", 2), ("The sky", 5)):
+            self.question.choice_set.create(choice_text=text, votes=votes)
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin:polls_question_changelist"), params)
+        self.assertEqual(200, response.status_code)
+        return response, len(queries)
+
+    def test_changelist_shows_totals(self):
+        response, _ = self.changelist_queries()
+        question = response.context["cl"].result_list[0]
+        self.assertEqual((7, 2), (question.vote_total, question.choice_count))
+
+    def test_changelist_query_count(self):
+        """The changelist uses the same queries for any number of questions."""
+        _, before = self.changelist_queries()
+        for n in range(10):
+            question = create_question(question_text=f"Question {n}.", days=-1)
+            question.choice_set.create(choice_text="a")
+        response, after = self.changelist_queries()
+        self.assertEqual(11, len(response.context["cl"].result_list))
+        self.assertEqual(before, after)
+
+    def test_search_by_prefix(self):
+        create_question(question_text="Which way?", days=-1)
+        response, _ = self.changelist_queries(q="what")
+        self.assertEqual([self.question], list(response.context["cl"].result_list))
+
+    def test_choice_inline_query_count(self):
+        """The change page shows each choice's votes without a query per choice."""
+        url = reverse("admin:polls_question_change", args=(self.question.id,))
+        self.client.get(url)  # caches the content type
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for n in range(10):
+            self.question.choice_set.create(choice_text=f"Choice {n}", votes=n)
+        with CaptureQueriesContext(connection) as more_queries:
+            response = self.client.get(url)
+        self.assertContains(response, "The sky")
+        self.assertEqual(len(queries), len(more_queries))
+
+
+class PollScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.open = create_question(question_text="Open question.", days=-2)
+        self.ending = Question.objects.create(
+            question_text="Ending question.",
+            pub_date=now - datetime.timedelta(days=1),
+            end_date=now + datetime.timedelta(hours=1),
+        )
+        self.ended = Question.objects.create(
+            question_text="Ended question.",
+            pub_date=now - datetime.timedelta(days=2),
+            end_date=now - datetime.timedelta(hours=1),
+        )
+        self.future = create_question(question_text="Future question.", days=1)
+
+    def test_querysets(self):
+        self.assertQuerysetEqual(
+            Question.objects.open().order_by("id"), [self.open, self.ending]
+        )
+        self.assertQuerysetEqual(Question.objects.closed(), [self.ended])
+        self.assertEqual(3, Question.objects.published().count())
+        self.assertFalse(self.ended.can_vote())
+        self.assertTrue(self.ending.can_vote())
+
+    def test_open_polls_and_next_change(self):
+        """The next change is the earliest pub_date or end_date to come."""
+        open_polls = schedule.compute_open_polls()
+        self.assertEqual({self.open.id, self.ending.id}, open_polls.question_ids)
+        self.assertEqual(
+            self.ending.end_date + datetime.timedelta(microseconds=1),
+            open_polls.next_change,
+        )
+
+    def test_open_polls_are_cached(self):
+        schedule.refresh()
+        with self.assertNumQueries(0):
+            schedule.get_open_polls()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.future.pub_date = timezone.now() - datetime.timedelta(minutes=1)
+            self.future.save()
+        self.assertIn(self.future.id, schedule.get_open_polls().question_ids)
+
+    def test_open_polls_after_a_boundary(self):
+        """Open polls cached before a boundary are computed again after it."""
+        schedule.refresh(now=self.ended.end_date - datetime.timedelta(minutes=1))
+        self.assertNotIn(self.ended.id, schedule.get_open_polls().question_ids)
+
+    def test_index_shows_closed_polls(self):
+        response = self.client.get(reverse("polls:index"))
+        self.assertContains(response, "voting closed", count=1)
+        self.assertContains(response, reverse("polls:detail", args=(self.ending.id,)))
+
+    def test_refresh_command(self):
+        out, err = StringIO(), StringIO()
+        call_command("refresh_open_polls", stdout=out, stderr=err)
+        self.assertIn("2 open polls; next change at ", out.getvalue())
+        # the test cache is LocMemCache, which other processes can't see
+        self.assertIn("The cache is local to this process", err.getvalue())
+        with self.assertNumQueries(0):
+            schedule.get_open_polls()
+
+    def test_watch_needs_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, "Set CACHE_BACKEND to a shared cache"):
+            call_command("refresh_open_polls", "--watch")
+        with mock.patch.object(schedule, "cache_is_shared", return_value=True):
+            err = StringIO()
+            call_command("refresh_open_polls", stdout=StringIO(), stderr=err)
+            self.assertEqual("", err.getvalue())
+
+
+class VoteQueueTests(TestCase):
+    def setUp(self):
+        self.question = create_question(question_text="Queued question.", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="Choice 1")
+        self.choice2 = self.question.choice_set.create(choice_text="Choice 2")
+        self.user1 = User.objects.create_user("voter1", password="Hackme99")
+        self.user2 = User.objects.create_user("voter2", password="Hackme99")
+        self.queue = vote_queue.VoteQueue(interval=None)
+
+    def vote_counts(self):
+        return [Choice.objects.get(id=c.id).votes for c in (self.choice1, self.choice2)]
+
+    def test_last_write_wins(self):
+        """Only the latest queued vote per user and question is written."""
+        self.queue.put(self.user1.id, self.question.id, self.choice1.id)
+        self.queue.put(self.user1.id, self.question.id, self.choice2.id)
+        self.queue.put(self.user2.id, self.question.id, self.choice1.id)
+        self.assertEqual(2, len(self.queue))
+        self.assertEqual(2, self.queue.flush())
+        vote = Vote.objects.get(user=self.user1)
+        self.assertEqual(self.choice2, vote.choice)
+        self.assertEqual([1, 1], self.vote_counts())
+        self.assertEqual(0, len(self.queue))
+
+    def test_flush_updates_and_removes_votes(self):
+        """Flushing changes existing votes and removes votes queued as None."""
+        self.queue.put(self.user1.id, self.question.id, self.choice1.id)
+        self.queue.put(self.user2.id, self.question.id, self.choice1.id)
+        self.queue.flush()
+        self.queue.put(self.user1.id, self.question.id, self.choice2.id)
+        self.queue.put(self.user2.id, self.question.id, None)
+        # savepoint, two selects, update, delete, counter update,
+        # one insert of the vote events, release
+        with self.assertNumQueries(8):
+            self.queue.flush()
+        self.assertEqual([0, 1], self.vote_counts())
+        self.assertEqual(1, Vote.objects.count())
+
+    def test_vote_views_use_queue(self):
+        """With the queue enabled, votes are written only when it is flushed."""
+        self.client.force_login(self.user1)
+        with override_settings(POLLS_VOTE_QUEUE=True), \
+                mock.patch.object(vote_queue, "_queue", self.queue):
+            self.client.post(
+                reverse("polls:vote", args=(self.question.id,)),
+                {"choice": self.choice1.id},
+            )
+            self.assertEqual(0, Vote.objects.count())
+            # the detail page shows the queued choice
+            response = self.client.get(reverse("polls:detail", args=(self.question.id,)))
+            self.assertEqual(self.choice1, response.context["selected_choice"])
+            self.queue.flush()
+            self.client.post(reverse("polls:remove_vote", args=(self.question.id,)))
+            self.assertEqual(1, Vote.objects.count())
+            self.queue.flush()
+        self.assertEqual(0, Vote.objects.count())
+        self.assertEqual([0, 0], self.vote_counts())
+
+    def test_flush_votes_replays_journal(self):
+        """flush_votes writes the votes saved in a journal file."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            journal = os.path.join(tmpdir, "votes.journal")
+            queue = vote_queue.VoteQueue(interval=None, journal=journal)
+            queue.put(self.user1.id, self.question.id, self.choice1.id)
+            queue.put(self.user1.id, self.question.id, self.choice2.id)
+            # the queue is lost without being flushed, but the journal remains
+            queue._journal_file.close()
+            queue._journal_lock.close()
+            with mock.patch.object(vote_queue, "_queue", self.queue):
+                call_command("flush_votes", journal, stdout=StringIO())
+            self.assertFalse(os.path.exists(journal))
+        self.assertEqual(self.choice2, Vote.objects.get(user=self.user1).choice)
+        self.assertEqual([0, 1], self.vote_counts())
+
+    @skipIf(vote_queue.fcntl is None, "journals are not locked without fcntl")
+    def test_flush_votes_skips_live_journal(self):
+        """The journal of a running queue is left to that queue."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            journal = os.path.join(tmpdir, "votes.journal")
+            queue = vote_queue.VoteQueue(interval=None, journal=journal)
+            queue.put(self.user1.id, self.question.id, self.choice1.id)
+            err = StringIO()
+            with mock.patch.object(vote_queue, "_queue", self.queue):
+                call_command("flush_votes", journal, stdout=StringIO(), stderr=err)
+            self.assertIn("is in use by a running process", err.getvalue())
+            self.assertTrue(os.path.exists(journal))
+            self.assertEqual(0, Vote.objects.count())
+            queue.close()
+            self.assertEqual(0, vote_queue.replay_journal(journal))
+        self.assertEqual(self.choice1, Vote.objects.get(user=self.user1).choice)
+
+
+class ResultsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        results_cache.reset_stats()
+        self.question = create_question(question_text="Cached question.", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="Choice 1")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        self.url = reverse("polls:results", args=(self.question.id,))
+
+    def vote(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("polls:vote", args=(self.question.id,)),
+                {"choice": self.choice.id},
+            )
+        self.client.logout()
+
+    def test_results_are_cached(self):
+        """A second request for results is served from the cache."""
+        response = self.client.get(self.url)
+        self.assertEqual("miss", response["X-Results-Cache"])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual("hit", response["X-Results-Cache"])
+        self.assertContains(response, "Choice 1")
+        self.assertEqual({"hits": 1, "stale_hits": 0, "misses": 1}, results_cache.stats())
+
+    def test_vote_invalidates_results(self):
+        """Voting bumps the version so results are computed again."""
+        self.client.get(self.url)
+        self.vote()
+        response = self.client.get(self.url)
+        self.assertEqual("miss", response["X-Results-Cache"])
+        self.assertEqual(1, response.context["question"].vote_total)
+
+    def test_missing_question_is_not_cached(self):
+        """A 404 for results is not stored in the cache."""
+        url = reverse("polls:results", args=(self.question.id + 1,))
+        self.assertEqual(404, self.client.get(url).status_code)
+        self.assertEqual(404, self.client.get(url).status_code)
+        self.assertEqual(2, results_cache.stats()["misses"])
+
+    @override_settings(POLLS_RESULTS_STALE_SECONDS=60)
+    def test_stale_results_within_window(self):
+        """Within the staleness window, old results are served after a vote."""
+        self.client.get(self.url)
+        self.vote()
+        response = self.client.get(self.url)
+        self.assertEqual("stale", response["X-Results-Cache"])
+        self.assertEqual(0, response.context["question"].vote_total)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Cached question.", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="Choice 1")
+        self.choice2 = self.question.choice_set.create(choice_text="Choice 2")
+        self.url = reverse("polls:detail", args=(self.question.id,))
+
+    def test_anonymous_detail_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual("miss", response["X-Page-Cache"])
+        self.assertIn("Cookie", response["Vary"])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual("hit", response["X-Page-Cache"])
+        self.assertContains(response, "Choice 2")
+
+    def test_changed_choices_are_shown(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.choice2.choice_text = "Renamed choice"
+            self.choice2.save()
+        response = self.client.get(self.url)
+        self.assertEqual("miss", response["X-Page-Cache"])
+        self.assertContains(response, "Renamed choice")
+
+    def test_new_question_on_index(self):
+        self.client.get(reverse("polls:index"))
+        create_question(question_text="Another question.", days=-1)
+        response = self.client.get(reverse("polls:index"))
+        self.assertEqual("miss", response["X-Page-Cache"])
+        self.assertContains(response, "Another question.")
+
+    def test_selected_choice_is_per_user(self):
+        """Logged in users share the cached choices, but not their selection."""
+        for name, choice in (("voter1", self.choice1), ("voter2", self.choice2)):
+            user = User.objects.create_user(name, password="Hackme99")
+            Vote.objects.create(user=user, question=self.question, choice=choice)
+            self.client.force_login(user)
+            for _ in range(2):
+                response = self.client.get(self.url)
+                self.assertNotIn("X-Page-Cache", response)
+                self.assertIn("Cookie", response["Vary"])
+                self.assertEqual(choice, response.context["selected_choice"])
+                html = response.content.decode()
+                self.assertEqual(1, html.count(" checked "))
+                self.assertRegex(html, rf'value="{choice.id}"\s+checked')
+
+    @override_settings(POLLS_PAGE_CACHE_TIMEOUT=0)
+    def test_page_cache_off(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertNotIn("X-Page-Cache", response)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed(self):
+        """seed() creates the requested objects and at most one vote per user and question."""
+        seeded = benchmark.seed(questions=5, choices=3, users=4, votes=30)
+        self.assertEqual(5, Question.objects.count())
+        self.assertEqual(15, Choice.objects.count())
+        self.assertEqual(4, len(seeded["users"]))
+        # only 5 * 4 distinct (user, question) pairs exist
+        self.assertEqual(20, Vote.objects.count())
+        self.assertEqual(20, sum(Choice.objects.values_list("votes", flat=True)))
+
+    def test_run_report(self):
+        """run() reports latency percentiles and queries for each view."""
+        seeded = benchmark.seed(questions=3, choices=2, users=2, votes=3)
+        report = benchmark.run(seeded, requests=50, concurrency=1, logins_per_worker=2)
+        self.assertEqual(50, report["requests"])
+        self.assertEqual(0, report["errors"])
+        self.assertEqual(set(benchmark.SCENARIOS), set(report["views"]))
+        index = report["views"]["index"]
+        self.assertEqual({"p50", "p95", "p99"}, set(index["latency_ms"]))
+        self.assertLessEqual(index["latency_ms"]["p50"], index["latency_ms"]["p99"])
+        # most index requests are served from the page cache
+        self.assertLess(index["queries_per_request"], 1)
+
+    def test_site_urlconf(self):
+        """site_urlconf() swaps the poll views and keeps the other URLs."""
+        urlconf = benchmark.site_urlconf(async_pages=True)
+        match = resolve("/polls/1/vote/", urlconf)
+        self.assertIs(async_views.vote, match.func)
+        self.assertEqual("polls:vote", match.view_name)
+        self.assertEqual("/accounts/login/", reverse("login", urlconf))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, benchmark.percentile(values, 50))
+        self.assertEqual(99, benchmark.percentile(values, 99))
+        self.assertIsNone(benchmark.percentile([], 50))
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        middleware.clear_requests()
+        self.question = create_question(question_text="Measured question.", days=-1)
+        self.question.choice_set.create(choice_text="Choice 1")
+
+    def test_request_is_recorded(self):
+        """The middleware records the view, time and queries of a request."""
+        self.client.get(reverse("polls:detail", args=(self.question.id,)))
+        [entry] = middleware.recent_requests()
+        self.assertEqual("polls:detail", entry["view"])
+        self.assertEqual(200, entry["status"])
+        self.assertEqual(2, entry["queries"])
+        self.assertGreaterEqual(entry["wall_ms"], entry["db_ms"])
+        self.assertEqual([], entry["duplicate_queries"])
+
+    def test_duplicate_queries(self):
+        """Queries with the same SQL run many times are reported."""
+        recorder = middleware.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for choice in Choice.objects.all():
+                Choice.objects.filter(id=choice.id).count()
+                Choice.objects.filter(id=choice.id).count()
+        [duplicate] = recorder.duplicates(2)
+        self.assertEqual(2, duplicate["count"])
+        self.assertEqual(3, recorder.count)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0)
+    def test_sampling_off(self):
+        self.client.get(reverse("polls:index"))
+        self.assertEqual([], middleware.recent_requests())
+
+    @override_settings(REQUEST_METRICS_SLOW_MS=0)
+    def test_slow_request_is_logged(self):
+        with self.assertLogs("mysite.metrics", "WARNING") as logs:
+            self.client.get(reverse("polls:index"))
+        self.assertIn('"view": "polls:index"', logs.output[0])
+
+    def test_debug_endpoint(self):
+        """Recorded requests can be read from an internal address only."""
+        self.client.get(reverse("polls:index"))
+        response = self.client.get(reverse("request_metrics"))
+        self.assertEqual("polls:index", response.json()["requests"][0]["view"])
+        self.assertIn("hits", response.json()["results_cache"])
+        self.assertIn("denied", response.json()["rate_limit"])
+        response = self.client.get(reverse("request_metrics"), REMOTE_ADDR="10.1.2.3")
+        self.assertEqual(404, response.status_code)
+
+
+@override_settings(POLLS_RATE_LIMIT_BURST=2, POLLS_RATE_LIMIT_RATE=0.5)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.reset_stats()
+        self.question = create_question(question_text="Limited question.", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="Choice 1")
+        self.choice2 = self.question.choice_set.create(choice_text="Choice 2")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        self.client.force_login(self.user)
+        self.vote_url = reverse("polls:vote", args=(self.question.id,))
+
+    def test_vote_flips_are_limited(self):
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.client.post(self.vote_url, {"choice": self.choice2.id})
+        response = self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.assertEqual(429, response.status_code)
+        self.assertEqual("2", response["Retry-After"])
+        self.assertEqual(self.choice2, Vote.objects.get().choice)
+        self.assertEqual({"hits": 2, "denied": 1, "fallbacks": 0}, ratelimit.stats())
+
+    def test_remove_vote_is_limited(self):
+        url = reverse("polls:remove_vote", args=(self.question.id,))
+        for _ in range(2):
+            self.client.post(url)
+        self.assertEqual(429, self.client.post(url).status_code)
+
+    def test_users_share_their_ip_bucket(self):
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.client.post(self.vote_url, {"choice": self.choice2.id})
+        other = User.objects.create_user("other", password="Hackme99")
+        self.client.force_login(other)
+        response = self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.assertEqual(429, response.status_code)
+        response = self.client.post(
+            self.vote_url, {"choice": self.choice1.id}, REMOTE_ADDR="10.1.2.3"
+        )
+        self.assertEqual(302, response.status_code)
+
+    def test_buckets_refill(self):
+        keys = ["polls:ratelimit:test"]
+        self.assertEqual(0, ratelimit.take(keys, now=100))
+        self.assertEqual(0, ratelimit.take(keys, now=100))
+        self.assertEqual(2, ratelimit.take(keys, now=100))
+        self.assertEqual(1, ratelimit.take(keys, now=101))
+        self.assertEqual(0, ratelimit.take(keys, now=102))
+
+    def test_memory_fallback(self):
+        """The buckets are kept in memory when the cache fails."""
+        broken = mock.Mock(**{"get_many.side_effect": OSError, "set_many.side_effect": OSError})
+        keys = ["polls:ratelimit:fallback"]
+        with mock.patch.object(ratelimit, "caches", {"default": broken}):
+            self.assertEqual(0, ratelimit.take(keys, now=100))
+            self.assertEqual(0, ratelimit.take(keys, now=100))
+            self.assertEqual(2, ratelimit.take(keys, now=100))
+        self.assertEqual(5, ratelimit.stats()["fallbacks"])
+
+    @override_settings(ROOT_URLCONF=benchmark.site_urlconf(async_pages=True))
+    def test_async_vote_is_limited(self):
+        for _ in range(2):
+            self.client.post(self.vote_url, {"choice": self.choice1.id})
+        response = self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.assertEqual(429, response.status_code)
+
+    @override_settings(POLLS_RATE_LIMIT_BURST=0)
+    def test_disabled(self):
+        for _ in range(5):
+            response = self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.assertEqual(302, response.status_code)
+
+    @override_settings(POLLS_RATE_LIMIT_RATE=0)
+    def test_zero_rate_is_disabled(self):
+        for _ in range(5):
+            response = self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(0, ratelimit.take(["polls:ratelimit:test"], now=100))
+
+    @override_settings(POLLS_RATE_LIMIT_IP_HEADER="HTTP_X_FORWARDED_FOR")
+    def test_forwarded_address(self):
+        """The address the proxy added, not one the client sent, is used."""
+        request = RequestFactory().post(
+            self.vote_url, HTTP_X_FORWARDED_FOR="1.1.1.1, 10.0.0.7", REMOTE_ADDR="10.0.0.1"
+        )
+        request.user = self.user
+        self.assertEqual(
+            ["polls:ratelimit:ip:10.0.0.7", f"polls:ratelimit:user:{self.user.pk}"],
+            ratelimit.bucket_keys(request),
+        )
+        request = RequestFactory().post(self.vote_url, REMOTE_ADDR="10.0.0.1")
+        request.user = self.user
+        self.assertEqual("10.0.0.1", ratelimit.client_ip(request))
+
+    @override_settings(POLLS_RATE_LIMIT_BY_IP=False)
+    def test_users_without_ip_buckets(self):
+        self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.client.post(self.vote_url, {"choice": self.choice2.id})
+        self.client.force_login(User.objects.create_user("other", password="Hackme99"))
+        response = self.client.post(self.vote_url, {"choice": self.choice1.id})
+        self.assertEqual(302, response.status_code)
+
+
+@override_settings(POLLS_INDEX_PAGE_SIZE=2)
+class IndexPaginationTests(TestCase):
+    def setUp(self):
+        # two questions with the same text, to check the id tie-breaker
+        self.questions = [
+            create_question(question_text=text, days=-1)
+            for text in ("a", "b", "b", "c", "d")
+        ]
+
+    def get_page(self, **params):
+        return self.client.get(reverse("polls:index"), params)
+
+    def test_pages_forward_and_back(self):
+        """Next and previous cursors walk the whole index in order."""
+        pages = []
+        response = self.get_page()
+        while True:
+            page = response.context["page"]
+            pages.append(list(response.context["question_list"]))
+            if not page.has_next:
+                break
+            response = self.get_page(after=page.next_cursor)
+        self.assertEqual(
+            [self.questions[0:2], self.questions[2:4], self.questions[4:]], pages
+        )
+        # and back from the last page
+        response = self.get_page(before=response.context["page"].previous_cursor)
+        self.assertEqual(self.questions[2:4], list(response.context["question_list"]))
+        self.assertTrue(response.context["page"].has_previous)
+
+    def test_first_page(self):
+        response = self.get_page()
+        page = response.context["page"]
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+        self.assertContains(response, f"?after={page.next_cursor}")
+
+    def test_page_query_count(self):
+        """A deep page takes one query, the same as the first page."""
+        cursor = self.get_page().context["page"].next_cursor
+        with self.assertNumQueries(1):
+            self.get_page(after=cursor)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(404, self.get_page(after="not a cursor").status_code)
+        null_value = pagination.encode_cursor([None, 1])
+        self.assertEqual(404, self.get_page(after=null_value).status_code)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.question = create_question(question_text="Exported, question", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        self.question.choice_set.create(choice_text="No")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        Vote.objects.create(user=self.user, question=self.question, choice=self.choice)
+        Choice.rebuild_vote_counts()
+        self.staff = User.objects.create_user("staff", password="Hackme99", is_staff=True)
+
+    def test_export_command_csv(self):
+        out = StringIO()
+        call_command("export_results", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(",".join(export.RESULT_FIELDS), lines[0])
+        self.assertEqual(3, len(lines))
+        self.assertIn('"Exported, question"', lines[1])
+        self.assertTrue(lines[1].endswith(",Yes,1"))
+
+    def test_export_command_votes_ndjson(self):
+        out = StringIO()
+        call_command("export_results", "--votes", "--format", "ndjson", stdout=out)
+        [line] = out.getvalue().splitlines()
+        row = json.loads(line)
+        self.assertEqual("voter", row["username"])
+        self.assertEqual(self.choice.id, row["choice_id"])
+
+    def test_export_view_streams(self):
+        """The export view streams the export to staff members."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("polls:export", args=("ndjson",)))
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in response.streaming_content]
+        self.assertEqual([1, 0], [row["votes"] for row in rows])
+
+    def test_export_view_requires_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("polls:export", args=("csv",)))
+        self.assertEqual(302, response.status_code)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("polls:export", args=("xml",)))
+        self.assertEqual(404, response.status_code)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.voters = [
+            User.objects.create_user(f"voter{n}", password="Hackme99") for n in range(3)
+        ]
+        self.question = create_question(question_text="What's up?", days=-1)
+        self.question.end_date = timezone.now() + datetime.timedelta(days=1)
+        self.question.save()
+        for text, voters in (("Not much", self.voters[:2]), ("The sky", self.voters[2:])):
+            choice = self.question.choice_set.create(choice_text=text, votes=len(voters))
+            for user in voters:
+                Vote.objects.create(user=user, question=self.question, choice=choice)
+        create_question(question_text="No choices yet.", days=-2)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command("export_polls", *args, stdout=out)
+        return out.getvalue()
+
+    def reimport(self, data, suffix, *args):
+        """Delete the polls and import them from data."""
+        Question.objects.all().delete()
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        call_command("import_polls", f.name, *args, stdout=out)
+        return out.getvalue()
+
+    def polls(self):
+        return [
+            (
+                q.question_text,
+                q.pub_date,
+                q.end_date,
+                [
+                    (c.choice_text, c.votes, sorted(v.user.username for v in c.vote_set.all()))
+                    for c in q.choice_set.order_by("id")
+                ],
+            )
+            for q in Question.objects.order_by("question_text")
+        ]
+
+    def test_ndjson_round_trip(self):
+        before = self.polls()
+        data = self.export("--votes")
+        self.assertEqual(2, len(data.splitlines()))
+        out = self.reimport(data, ".ndjson")
+        self.assertIn("Imported 2 questions, 2 choices and 3 votes, and created 0 users.", out)
+        self.assertEqual(before, self.polls())
+
+    def test_csv_round_trip(self):
+        before = self.polls()
+        data = self.export("--votes", "--format", "csv")
+        self.assertTrue(data.startswith("id,question_text,pub_date,end_date,choice_text,"))
+        self.reimport(data, ".csv", "--batch-size", "1")
+        self.assertEqual(before, self.polls())
+
+    def test_import_without_votes(self):
+        """Without voters, the vote counters start at zero."""
+        self.reimport(self.export(), ".ndjson")
+        self.assertEqual(0, Vote.objects.count())
+        self.assertEqual([0, 0], [c.votes for c in Choice.objects.all()])
+
+    def test_import_creates_voters(self):
+        record = {
+            "question_text": "New?",
+            "pub_date": "2026-01-01T00:00:00",
+            "choices": [{"choice_text": "Yes", "voters": ["voter0", "newcomer"]}],
+        }
+        counts = transfer.import_polls([record])
+        self.assertEqual({"questions": 1, "choices": 1, "votes": 2, "users": 1}, counts)
+        newcomer = User.objects.get(username="newcomer")
+        self.assertFalse(newcomer.has_usable_password())
+        question = Question.objects.get(question_text="New?")
+        self.assertTrue(timezone.is_aware(question.pub_date))
+
+    def test_import_batches_are_transactions(self):
+        """A bad record stops the import, keeping the batches before it."""
+        records = [{"question_text": f"Q{n}", "choices": []} for n in range(3)]
+        records[2]["pub_date"] = "yesterday"
+        with self.assertRaisesMessage(transfer.PollFormatError, "poll 3: pub_date"):
+            transfer.import_polls(records, batch_size=2)
+        self.assertTrue(Question.objects.filter(question_text="Q1").exists())
+        self.assertFalse(Question.objects.filter(question_text="Q2").exists())
+
+    def test_csv_rows_need_an_id(self):
+        """CSV rows are grouped into polls by id, so the id can't be missing."""
+        rows = ["question_text,choice_text\n", "Q1,a\n"]
+        with self.assertRaisesMessage(transfer.PollFormatError, "id column is missing"):
+            list(transfer.read_records(rows, "csv"))
+        rows = ["id,question_text,choice_text\n", "1,Q1,a\n", ",Q2,b\n"]
+        with self.assertRaisesMessage(transfer.PollFormatError, "line 3: id is missing"):
+            list(transfer.read_records(rows, "csv"))
+
+    def test_import_query_count(self):
+        """An import uses a few queries per batch, not per poll."""
+        records = [
+            {"question_text": f"Q{n}", "choices": [{"choice_text": "a", "voters": ["voter0"]}]}
+            for n in range(50)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            transfer.import_polls(records, batch_size=25)
+        self.assertLessEqual(len(queries), 20)
+
+    def test_bad_input(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson", delete=False) as f:
+            f.write('{"question_text": "Fine", "choices": []}\nnot json\n')
+        self.addCleanup(os.unlink, f.name)
+        with self.assertRaisesMessage(CommandError, "line 2"):
+            call_command("import_polls", f.name, stdout=StringIO())
+
+
+class VotingApiTests(TestCase):
+    def setUp(self):
+        self.questions = [create_question(question_text=f"Q{n}", days=-1) for n in range(3)]
+        self.choices = [q.choice_set.create(choice_text="Yes") for q in self.questions]
+        self.other = self.questions[0].choice_set.create(choice_text="No")
+        self.future = create_question(question_text="Future", days=5)
+        self.user = User.objects.create_user("kiosk", password="Hackme99")
+        self.client.force_login(self.user)
+        self.url = reverse("polls:api_votes")
+
+    def post(self, votes):
+        return self.client.post(self.url, {"votes": votes}, content_type="application/json")
+
+    def statuses(self, response):
+        return [result["status"] for result in response.json()["results"]]
+
+    def test_bulk_vote(self):
+        """Votes on many questions are written in one request."""
+        votes = [{"question": q.id, "choice": c.id} for q, c in zip(self.questions, self.choices)]
+        response = self.post(votes)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["created"] * 3, self.statuses(response))
+        self.assertEqual(3, Vote.objects.filter(user=self.user).count())
+        self.assertEqual(1, Choice.objects.get(id=self.choices[2].id).votes)
+
+    def test_change_and_remove(self):
+        self.post([{"question": q.id, "choice": c.id} for q, c in zip(self.questions, self.choices)])
+        response = self.post([
+            {"question": self.questions[0].id, "choice": self.other.id},
+            {"question": self.questions[1].id, "choice": None},
+            {"question": self.questions[2].id, "choice": self.choices[2].id},
+        ])
+        self.assertEqual(["changed", "removed", "unchanged"], self.statuses(response))
+        self.assertEqual(1, Choice.objects.get(id=self.other.id).votes)
+        self.assertEqual(0, Choice.objects.get(id=self.choices[0].id).votes)
+        self.assertEqual(0, Choice.objects.get(id=self.choices[1].id).votes)
+
+    def test_per_item_errors(self):
+        """Invalid items get their own status and do not stop the others."""
+        response = self.post([
+            {"question": self.questions[0].id, "choice": self.choices[1].id},
+            {"question": self.future.id, "choice": None},
+            {"question": 9999, "choice": 1},
+            {"question": "x"},
+            {"question": self.questions[1].id, "choice": None},
+            {"question": self.questions[2].id, "choice": self.choices[2].id},
+            {"question": self.questions[2].id, "choice": self.choices[2].id},
+        ])
+        self.assertEqual(
+            ["invalid_choice", "question_not_found", "question_not_found", "invalid",
+             "no_vote", "superseded", "created"],
+            self.statuses(response),
+        )
+
+    def test_missing_choice_is_invalid(self):
+        """An item without a choice doesn't remove the vote; null does."""
+        self.post([{"question": self.questions[0].id, "choice": self.choices[0].id}])
+        response = self.post([{"question": self.questions[0].id}])
+        self.assertEqual(["invalid"], self.statuses(response))
+        self.assertEqual(1, Vote.objects.filter(user=self.user).count())
+
+    def test_concurrent_insert_is_retried(self):
+        """A vote inserted by another request after the existing votes were
+        read makes the insert fail; the batch is written again and changes it.
+        """
+        question, choice = self.questions[0], self.choices[0]
+        self.post([{"question": question.id, "choice": choice.id}])
+        filter_votes = Vote.objects.filter
+        reads = []
+
+        def stale_read(*args, **kwargs):
+            # the first read misses the vote, as if it was not committed yet
+            reads.append(args)
+            return Vote.objects.none() if len(reads) == 1 else filter_votes(*args, **kwargs)
+
+        with mock.patch.object(Vote.objects, "filter", side_effect=stale_read):
+            response = self.post([{"question": question.id, "choice": self.other.id}])
+        self.assertEqual(["changed"], self.statuses(response))
+        self.assertEqual(2, len(reads))
+        self.assertEqual(self.other.id, Vote.objects.get(user=self.user).choice_id)
+        self.assertEqual([0, 1], [Choice.objects.get(id=c.id).votes for c in (choice, self.other)])
+
+    def test_query_count_is_constant(self):
+        """The number of queries does not grow with the number of votes."""
+        votes = [{"question": q.id, "choice": c.id} for q, c in zip(self.questions, self.choices)]
+        with CaptureQueriesContext(connection) as one:
+            self.post(votes[:1])
+        Vote.objects.all().delete()
+        with CaptureQueriesContext(connection) as three:
+            self.post(votes)
+        self.assertEqual(len(one), len(three))
+
+    def test_errors(self):
+        self.assertEqual(400, self.client.post(
+            self.url, "not json", content_type="application/json").status_code)
+        self.assertEqual(400, self.post("not a list").status_code)
+        self.assertEqual(405, self.client.get(self.url).status_code)
+        self.client.logout()
+        self.assertEqual(401, self.post([]).status_code)
+
+
+class LiveResultsTests(TestCase):
+    def setUp(self):
+        self.question = create_question(question_text="Live question.", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="Choice 1")
+        self.choice2 = self.question.choice_set.create(choice_text="Choice 2")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        self.live = live.LiveResults(interval=None)
+        patcher = mock.patch.object(live, "_live", self.live)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def vote(self, choice):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("polls:vote", args=(self.question.id,)), {"choice": choice.id}
+            )
+
+    def test_votes_are_coalesced(self):
+        """A burst of votes is published as one frame with the net change."""
+        first = self.live.latest(self.question.id)
+        self.vote(self.choice1)
+        self.vote(self.choice2)
+        self.assertIsNone(self.live.wait(self.question.id, first["seq"], 0))
+        with self.assertNumQueries(1):
+            self.live.publish_pending()
+        frame = self.live.wait(self.question.id, first["seq"], 0)
+        self.assertEqual({self.choice1.id: 0, self.choice2.id: 1}, frame["counts"])
+        self.assertEqual({self.choice2.id: 1}, frame["deltas"])
+        self.assertEqual(first["seq"] + 1, frame["seq"])
+
+    def test_long_poll(self):
+        """The long poll returns the next frame, or 204 if there is none."""
+        url = reverse("polls:live_poll", args=(self.question.id,))
+        frame = self.client.get(url).json()
+        self.assertEqual(0, frame["total"])
+        with override_settings(POLLS_LIVE_POLL_TIMEOUT=0):
+            response = self.client.get(url, {"since": frame["seq"]})
+        self.assertEqual(204, response.status_code)
+        self.vote(self.choice1)
+        self.live.publish_pending()
+        response = self.client.get(url, {"since": frame["seq"]})
+        self.assertEqual(1, response.json()["total"])
+
+    @override_settings(POLLS_LIVE_STREAM_SECONDS=0.2, POLLS_LIVE_KEEPALIVE=0.1)
+    def test_event_stream(self):
+        """The stream sends the current counts, then keepalives until it ends."""
+        response = self.client.get(reverse("polls:live", args=(self.question.id,)))
+        self.assertEqual("text/event-stream", response["Content-Type"])
+        events = b"".join(response.streaming_content).decode()
+        self.assertTrue(events.startswith("id: "))
+        self.assertIn("event: results", events)
+        self.assertIn(live.KEEPALIVE, events)
+
+    async def test_results_page_streams_under_asgi_only(self):
+        """The results page long polls under WSGI, where a stream holds a thread."""
+        url = reverse("polls:results", args=(self.question.id,))
+        live_url = reverse("polls:live", args=(self.question.id,))
+        poll_url = reverse("polls:live_poll", args=(self.question.id,))
+        response = await sync_to_async(self.client.get)(url)
+        self.assertContains(response, poll_url)
+        self.assertNotContains(response, "EventSource(")
+        response = await self.async_client.get(url)
+        self.assertContains(response, f'EventSource("{live_url}")')
+        self.assertNotContains(response, poll_url)
+
+
+@override_settings(ROOT_URLCONF=benchmark.site_urlconf(async_pages=True))
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Async question.", days=-1)
+        self.choice1 = self.question.choice_set.create(choice_text="Choice 1")
+        self.choice2 = self.question.choice_set.create(choice_text="Choice 2")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        # force_login is not async in Django 4.2
+        self.voter = self.async_client_class()
+        self.voter.force_login(self.user)
+
+    async def test_index(self):
+        """The async index lists published questions only."""
+        await sync_to_async(create_question)(question_text="Future question.", days=30)
+        response = await self.async_client.get(reverse("polls:index"))
+        self.assertEqual([self.question], response.context["question_list"])
+        self.assertFalse(response.context["page"].has_next)
+
+    async def test_future_detail(self):
+        future = await sync_to_async(create_question)(question_text="Future.", days=30)
+        response = await self.async_client.get(reverse("polls:detail", args=(future.id,)))
+        self.assertEqual(404, response.status_code)
+
+    async def test_vote(self):
+        """Voting twice changes the vote and the vote counts."""
+        url = reverse("polls:vote", args=(self.question.id,))
+        response = await self.voter.post(url, {"choice": self.choice1.id})
+        self.assertRedirects(
+            response, reverse("polls:results", args=(self.question.id,)),
+            fetch_redirect_response=False,
+        )
+        await self.voter.post(url, {"choice": self.choice2.id})
+        vote = await Vote.objects.aget(user=self.user, question=self.question)
+        self.assertEqual(self.choice2.id, vote.choice_id)
+        self.assertEqual(0, (await Choice.objects.aget(id=self.choice1.id)).votes)
+        self.assertEqual(1, (await Choice.objects.aget(id=self.choice2.id)).votes)
+        response = await self.voter.get(reverse("polls:detail", args=(self.question.id,)))
+        self.assertEqual(self.choice2, response.context["selected_choice"])
+
+    async def messages_shown(self):
+        response = await self.voter.get(reverse("polls:results", args=(self.question.id,)))
+        return [str(message) for message in response.context["messages"]]
+
+    async def test_vote_messages(self):
+        """The messages say whether the vote was recorded, updated or unchanged."""
+        url = reverse("polls:vote", args=(self.question.id,))
+        for choice, message in [
+            (self.choice1, "Your vote was successfully recorded."),
+            (self.choice2, "Your vote was successfully updated."),
+            (self.choice2, "You already voted for this choice."),
+        ]:
+            await self.voter.post(url, {"choice": choice.id})
+            self.assertEqual([message], await self.messages_shown())
+
+    async def test_vote_deleted_choice(self):
+        """A choice deleted while voting shows the form again with an error."""
+        key = (self.user.id, self.question.id)
+        with mock.patch.object(
+            voting, "apply_votes", return_value={key: voting.INVALID_CHOICE}
+        ):
+            response = await self.voter.post(
+                reverse("polls:vote", args=(self.question.id,)), {"choice": self.choice1.id}
+            )
+        self.assertContains(response, "Please select a choice.")
+
+    async def test_vote_requires_login(self):
+        url = reverse("polls:vote", args=(self.question.id,))
+        response = await self.async_client.post(url, {"choice": self.choice1.id})
+        self.assertEqual(302, response.status_code)
+        self.assertTrue(response.url.startswith(reverse("login")))
+        self.assertEqual(0, await Vote.objects.acount())
+
+    async def test_vote_invalid_choice(self):
+        """A choice of another question is not a valid choice."""
+        other = await sync_to_async(create_question)(question_text="Other.", days=-1)
+        other_choice = await other.choice_set.acreate(choice_text="Other choice")
+        response = await self.voter.post(
+            reverse("polls:vote", args=(self.question.id,)), {"choice": other_choice.id}
+        )
+        self.assertContains(response, "Please select a choice.")
+        self.assertEqual(0, await Vote.objects.acount())
+
+    async def test_remove_vote(self):
+        url = reverse("polls:remove_vote", args=(self.question.id,))
+        self.assertEqual(404, (await self.voter.post(url)).status_code)
+        await self.voter.post(
+            reverse("polls:vote", args=(self.question.id,)), {"choice": self.choice1.id}
+        )
+        response = await self.voter.post(url)
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(0, await Vote.objects.acount())
+        self.assertEqual(0, (await Choice.objects.aget(id=self.choice1.id)).votes)
+
+    async def test_remove_vote_on_closed_poll(self):
+        await self.voter.post(
+            reverse("polls:vote", args=(self.question.id,)), {"choice": self.choice1.id}
+        )
+        self.question.end_date = timezone.now() - datetime.timedelta(minutes=1)
+        await self.question.asave()
+        response = await self.voter.post(reverse("polls:remove_vote", args=(self.question.id,)))
+        self.assertContains(response, "Voting not allowed for this question")
+        self.assertEqual(1, await Vote.objects.acount())
+
+    async def test_results_are_cached(self):
+        url = reverse("polls:results", args=(self.question.id,))
+        response = await self.async_client.get(url)
+        self.assertEqual("miss", response["X-Results-Cache"])
+        self.assertContains(response, "Choice 1")
+        response = await self.async_client.get(url)
+        self.assertEqual("hit", response["X-Results-Cache"])
+        missing = await self.async_client.get(reverse("polls:results", args=(999,)))
+        self.assertEqual(404, missing.status_code)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    async def test_request_metrics(self):
+        """The metrics middleware counts the queries of async views."""
+        middleware.clear_requests()
+        await self.async_client.get(reverse("polls:detail", args=(self.question.id,)))
+        [entry] = middleware.recent_requests()
+        self.assertEqual("polls:detail", entry["view"])
+        self.assertEqual(2, entry["queries"])
+
+
+class SQLiteProfileTests(TransactionTestCase):
+    def setUp(self):
+        self.seeded = benchmark.seed(questions=3, choices=2, users=20, votes=0)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "stress.sqlite3")
+
+    def test_pragmas(self):
+        """The production profile sets the pragmas when it connects."""
+        with benchmark.sqlite_copy("stress", self.path, production=True) as db:
+            with db.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                self.assertEqual("wal", cursor.fetchone()[0])
+                cursor.execute("PRAGMA busy_timeout")
+                self.assertEqual(5000, cursor.fetchone()[0])
+                cursor.execute("PRAGMA synchronous")
+                # NORMAL
+                self.assertEqual(1, cursor.fetchone()[0])
+
+    def test_stress_without_lock_errors(self):
+        """Concurrent votes don't fail with "database is locked"."""
+        with benchmark.sqlite_copy("stress", self.path, production=True):
+            report = benchmark.stress(
+                self.seeded, "stress", threads=8, operations=25, write_ratio=0.8
+            )
+            self.assertEqual({}, report["error_kinds"])
+            self.assertEqual(200, report["requests"])
+            # every vote was counted once
+            votes = Vote.objects.using("stress").count()
+            counted = sum(Choice.objects.using("stress").values_list("votes", flat=True))
+            self.assertEqual(votes, counted)
+
+
+class SlowClientBenchmarkTests(TransactionTestCase):
+    def test_sync_and_async(self):
+        """run_slow_clients() serves every request in both modes."""
+        seeded = benchmark.seed(questions=3, choices=2, users=0, votes=0)
+        for mode in ("sync", "async"):
+            with self.subTest(mode=mode):
+                report = benchmark.run_slow_clients(
+                    seeded, clients=4, requests_per_client=2, slow=0, threads=2, mode=mode
+                )
+                self.assertEqual(8, report["requests"])
+                self.assertEqual({}, report["error_kinds"])
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=["replica1", "replica2"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Reads from two SQLite file replicas, which sync_replicas() makes
+    copies of the primary, like replication that lags until it is called.
+    """
+
+    replicas = ["replica1", "replica2"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        for alias in cls.replicas:
+            connections.settings[alias] = connections.configure_settings({
+                DEFAULT_DB_ALIAS: {},
+                alias: {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": os.path.join(cls.tmpdir.name, f"{alias}.sqlite3"),
+                },
+            })[alias]
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.tmpdir.cleanup()
+        super().tearDownClass()
+
+    def sync_replicas(self):
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        for alias in self.replicas:
+            replica = connections[alias]
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text="Replicated question.", days=-1)
+        self.choice = self.question.choice_set.create(choice_text="Choice 1")
+        self.user = User.objects.create_user("voter", password="Hackme99")
+        self.sync_replicas()
+        self.voter = self.client_class()
+        self.voter.force_login(self.user)
+
+    def vote(self):
+        response = self.voter.post(
+            reverse("polls:vote", args=(self.question.id,)), {"choice": self.choice.id}
+        )
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(1, Vote.objects.using(DEFAULT_DB_ALIAS).count())
+
+    def test_pages_read_from_replicas(self):
+        """Questions are shown once they reach the replicas."""
+        new = create_question(question_text="New question.", days=-1)
+        url = reverse("polls:detail", args=(new.id,))
+        self.assertEqual(404, self.client.get(url).status_code)
+        self.assertNotContains(self.client.get(reverse("polls:index")), "New question.")
+        self.sync_replicas()
+        self.assertEqual(200, self.client.get(url).status_code)
+
+    def test_voter_reads_own_vote(self):
+        """After a vote, the voter's session reads from the primary."""
+        self.vote()
+        response = self.voter.get(reverse("polls:detail", args=(self.question.id,)))
+        self.assertEqual(self.choice, response.context["selected_choice"])
+        # other users read from the replicas, which don't have the vote yet
+        response = self.client.get(reverse("polls:results", args=(self.question.id,)))
+        self.assertEqual(0, response.context["question"].vote_total)
+        self.sync_replicas()
+        cache.clear()
+        response = self.client.get(reverse("polls:results", args=(self.question.id,)))
+        self.assertEqual(1, response.context["question"].vote_total)
+
+    def test_voter_skips_results_cached_from_replica(self):
+        """Results another request read from a lagging replica are not
+        given to a voter whose session reads from the primary.
+        """
+        self.vote()
+        url = reverse("polls:results", args=(self.question.id,))
+        response = self.client.get(url)
+        self.assertEqual(0, response.context["question"].vote_total)
+        response = self.voter.get(url)
+        self.assertEqual("miss", response["X-Results-Cache"])
+        self.assertEqual(1, response.context["question"].vote_total)
+
+    def test_results_fragment_follows_read_source(self):
+        """The vote counts rendered from a replica are kept only as long as
+        its results, and a voter reading from the primary doesn't see them.
+        """
+        self.vote()
+        url = reverse("polls:results", args=(self.question.id,))
+        self.assertContains(self.client.get(url), 'id="votes-total">0<')
+        self.assertContains(self.voter.get(url), 'id="votes-total">1<')
+        self.assertEqual(5, page_cache.fragment_timeout())
+        with routers.use_primary():
+            self.assertEqual(300, page_cache.fragment_timeout())
+
+    @override_settings(DATABASE_REPLICA_STICKY_SECONDS=0)
+    def test_stickiness_expires(self):
+        self.vote()
+        response = self.voter.get(reverse("polls:detail", args=(self.question.id,)))
+        self.assertIsNone(response.context["selected_choice"])
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertIn(router.db_for_read(Question), self.replicas)
+        self.assertEqual(DEFAULT_DB_ALIAS, router.db_for_write(Question))
+        with transaction.atomic():
+            self.assertEqual(DEFAULT_DB_ALIAS, router.db_for_read(Question))
+        with routers.use_primary():
+            self.assertEqual(DEFAULT_DB_ALIAS, router.db_for_read(Question))
+        self.assertFalse(router.allow_migrate("replica1", "polls"))
+        with override_settings(DATABASE_REPLICA_ALIASES=[]):
+            self.assertEqual(DEFAULT_DB_ALIAS, router.db_for_read(Question))
@@ -0,0 +1,290 @@
+"""Import and export of polls: questions with their choices and votes.
+
+A poll is a record like::
+
+    {"id": 1, "question_text": "What's up?",
+     "pub_date": "2026-01-01T00:00:00Z", "end_date": null,
+     "choices": [{"choice_text": "Not much", "votes": 2,
+                  "voters": ["alice", "bob"]}]}
+
+written one per line as NDJSON, or as CSV with one row per choice, where
+consecutive rows with the same ``id`` are the choices of one question
+and ``voters`` is a space separated list of usernames.  A question
+without choices is a row with an empty ``choice_text``.
+
+"voters" are exported only when asked for.  On import, the id and the
+vote counts are ignored: questions get new ids, and each choice's vote
+counter is the number of voters imported for it, as the counters are
+derived from the Vote rows.  Voters that are not users yet are created
+with unusable passwords.
+
+Both directions stream.  Export reads a chunk of questions at a time,
+with one query each for their choices and votes.  Import reads one
+record at a time, and creates each batch of questions, choices, users
+and votes with bulk_create() in its own transaction, so a failed import
+keeps the batches before the bad record.
+"""
+import csv
+import datetime
+import json
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import audit, page_cache, schedule
+from .export import csv_lines
+from .models import Choice, Question, Vote, VoteEvent
+
+CSV_FIELDS = ["id", "question_text", "pub_date", "end_date", "choice_text", "votes", "voters"]
+
+CHUNK_SIZE = 2000
+
+BATCH_SIZE = 1000
+
+
+class PollFormatError(ValueError):
+    """A record that can't be imported."""
+
+
+def poll_records(voters: bool = False, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """Each question, in order of id, with its choices.
+
+    :param voters: include the usernames of the voters for each choice
+    """
+    last_id = 0
+    while True:
+        questions = list(Question.objects.filter(id__gt=last_id).order_by("id")[:chunk_size])
+        if not questions:
+            return
+        first_id, last_id = questions[0].id, questions[-1].id
+        choices = defaultdict(list)
+        for choice in (
+            Choice.objects.filter(question_id__gte=first_id, question_id__lte=last_id)
+            .order_by("id")
+            .values("id", "question_id", "choice_text", "votes")
+        ):
+            choices[choice["question_id"]].append(choice)
+        usernames = defaultdict(list)
+        if voters:
+            for choice_id, username in (
+                Vote.objects.filter(
+                    question_id__gte=first_id, question_id__lte=last_id, choice__isnull=False
+                )
+                .order_by("id")
+                .values_list("choice_id", "user__username")
+            ):
+                usernames[choice_id].append(username)
+        for question in questions:
+            yield {
+                "id": question.id,
+                "question_text": question.question_text,
+                "pub_date": question.pub_date,
+                "end_date": question.end_date,
+                "choices": [
+                    {
+                        "choice_text": choice["choice_text"],
+                        "votes": choice["votes"],
+                        **({"voters": usernames[choice["id"]]} if voters else {}),
+                    }
+                    for choice in choices[question.id]
+                ],
+            }
+
+
+def _csv_rows(records: Iterable[Dict]) -> Iterator[Dict]:
+    for record in records:
+        question = {name: record[name] for name in ("id", "question_text", "pub_date")}
+        question["end_date"] = record["end_date"] or ""
+        empty = {"choice_text": "", "votes": "", "voters": ""}
+        for choice in record["choices"] or [empty]:
+            yield {
+                **question,
+                "choice_text": choice["choice_text"],
+                "votes": choice["votes"],
+                "voters": " ".join(choice.get("voters", ())),
+            }
+
+
+def export_lines(fmt: str = "ndjson", voters: bool = False,
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Lines of an export of every poll, as "csv" or "ndjson"."""
+    records = poll_records(voters, chunk_size)
+    if fmt == "csv":
+        fields = CSV_FIELDS if voters else CSV_FIELDS[:-1]
+        return csv_lines(_csv_rows(records), fields)
+    if fmt == "ndjson":
+        # isoformat(), unlike DjangoJSONEncoder, keeps the microseconds
+        return (
+            json.dumps(record, default=datetime.datetime.isoformat) + "\n"
+            for record in records
+        )
+    raise ValueError(f"unknown export format {fmt!r}")
+
+
+def _csv_records(lines: Iterable[str]) -> Iterator[Dict]:
+    # the rows of a poll are grouped by its id, so every row needs one
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is not None and "id" not in reader.fieldnames:
+        raise PollFormatError("the id column is missing")
+    record = None
+    for row in reader:
+        if not row.get("id"):
+            raise PollFormatError(f"line {reader.line_num}: id is missing")
+        if record is None or row["id"] != record["id"]:
+            if record is not None:
+                yield record
+            record = {
+                "id": row["id"],
+                "question_text": row.get("question_text"),
+                "pub_date": row.get("pub_date") or None,
+                "end_date": row.get("end_date") or None,
+                "choices": [],
+            }
+        if row.get("choice_text"):
+            choice = {"choice_text": row["choice_text"]}
+            if row.get("voters") is not None:
+                choice["voters"] = row["voters"].split()
+            record["choices"].append(choice)
+    if record is not None:
+        yield record
+
+
+def _ndjson_records(lines: Iterable[str]) -> Iterator[Dict]:
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise PollFormatError(f"line {number}: {e}") from None
+
+
+def read_records(lines: Iterable[str], fmt: str = "ndjson") -> Iterator[Dict]:
+    """Poll records read from lines of CSV or NDJSON, one at a time."""
+    if fmt == "csv":
+        return _csv_records(lines)
+    if fmt == "ndjson":
+        return _ndjson_records(lines)
+    raise ValueError(f"unknown import format {fmt!r}")
+
+
+def _text(value, name: str, number: int) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise PollFormatError(f"poll {number}: {name} is missing")
+    return value
+
+
+def _date(value, name: str, number: int):
+    if value is None:
+        return None
+    date = parse_datetime(value) if isinstance(value, str) else None
+    if date is None:
+        raise PollFormatError(f"poll {number}: {name} {value!r} is not a date and time")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def _user_ids(usernames, counts: Counter) -> Dict[str, int]:
+    """Ids of the users with these usernames, creating those that don't exist."""
+    usernames = list(usernames)
+    user_ids = {}
+    # in chunks, to stay under the database's limit on query parameters
+    for start in range(0, len(usernames), 500):
+        user_ids.update(
+            User.objects.filter(username__in=usernames[start:start + 500])
+            .values_list("username", "id")
+        )
+    new_users = User.objects.bulk_create(
+        [
+            User(username=username, password=make_password(None))
+            for username in usernames
+            if username not in user_ids
+        ]
+    )
+    user_ids.update((user.username, user.id) for user in new_users)
+    counts["users"] += len(new_users)
+    return user_ids
+
+
+def _import_batch(batch: List, votes: bool, counts: Counter):
+    now = timezone.now()
+    questions = []
+    # (index of the question, choice text, voters) of each choice
+    choice_rows = []
+    for number, record in batch:
+        if not isinstance(record, dict):
+            raise PollFormatError(f"poll {number}: not an object")
+        questions.append(
+            Question(
+                question_text=_text(record.get("question_text"), "question_text", number),
+                pub_date=_date(record.get("pub_date"), "pub_date", number) or now,
+                end_date=_date(record.get("end_date"), "end_date", number),
+            )
+        )
+        voted = set()
+        for choice in record.get("choices") or []:
+            if not isinstance(choice, dict):
+                raise PollFormatError(f"poll {number}: a choice is not an object")
+            voters = (choice.get("voters") or []) if votes else []
+            for username in voters:
+                if username in voted:
+                    raise PollFormatError(f"poll {number}: {username} voted more than once")
+                voted.add(username)
+            text = _text(choice.get("choice_text"), "choice_text", number)
+            choice_rows.append((len(questions) - 1, text, voters))
+
+    Question.objects.bulk_create(questions)
+    # question_id, not question, skips a related object descriptor per choice
+    choices = Choice.objects.bulk_create(
+        [
+            Choice(question_id=questions[index].id, choice_text=text, votes=len(voters))
+            for index, text, voters in choice_rows
+        ]
+    )
+    user_ids = _user_ids({name for _, _, voters in choice_rows for name in voters}, counts)
+    new_votes = Vote.objects.bulk_create(
+        [
+            Vote(question_id=choice.question_id, choice_id=choice.id, user_id=user_ids[username])
+            for choice, (_, _, voters) in zip(choices, choice_rows)
+            for username in voters
+        ]
+    )
+    audit.record(
+        (VoteEvent.CAST, vote.user_id, vote.question_id, vote.choice_id) for vote in new_votes
+    )
+    counts["questions"] += len(questions)
+    counts["choices"] += len(choices)
+    counts["votes"] += len(new_votes)
+
+
+def import_polls(records: Iterable[Dict], votes: bool = True,
+                 batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Create polls from records, batch_size questions per transaction.
+
+    :param votes: create the votes of the records' voters
+    :returns: the number of questions, choices, votes and users created
+    :raises PollFormatError: for a record that can't be imported; the
+        batches before it are kept
+    """
+    counts = Counter(questions=0, choices=0, votes=0, users=0)
+    numbered = enumerate(records, 1)
+    try:
+        while True:
+            batch = list(islice(numbered, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                _import_batch(batch, votes, counts)
+    finally:
+        # bulk_create() sends no post_save signals
+        if counts["questions"]:
+            page_cache.invalidate_index()
+            schedule.invalidate()
+    return dict(counts)
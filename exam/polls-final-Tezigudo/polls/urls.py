@@ -1,13 +1,37 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
+from .page_cache import cache_anonymous_page, detail_version, index_version
+
+
+def get_urlpatterns(async_pages: bool = False):
+    """URL patterns of the polls app.
+
+    :param async_pages: use the async versions of the poll pages and
+        vote views, for ASGI servers
+    """
+    pages = async_views if async_pages else views
+    return [
+        path(
+            "",
+            cache_anonymous_page(pages.IndexView.as_view(), index_version),
+            name="index",
+        ),
+        path(
+            "<int:pk>/",
+            cache_anonymous_page(pages.DetailView.as_view(), detail_version),
+            name="detail",
+        ),
+        path("<int:pk>/results/", pages.ResultsView.as_view(), name="results"),
+        path("<int:question_id>/vote/", pages.vote, name="vote"),
+        path("<int:question_id>/live/", views.live_results, name="live"),
+        path("<int:question_id>/live/poll/", views.live_results_poll, name="live_poll"),
+        path("<int:question_id>/vote/remove", pages.remove_vote, name="remove_vote"),
+        path("export.<str:fmt>", views.export_results, name="export"),
+        path("api/votes/", api.votes, name="api_votes"),
+    ]
 
 
 app_name = "polls"
-urlpatterns = [
-    path("", views.IndexView.as_view(), name="index"),
-    path("<int:pk>/", views.DetailView.as_view(), name="detail"),
-    path("<int:pk>/results/", views.ResultsView.as_view(), name="results"),
-    path("<int:question_id>/vote/", views.vote, name="vote"),
-    path("<int:question_id>/vote/remove", views.remove_vote, name="remove_vote"),
-]
+urlpatterns = get_urlpatterns(getattr(settings, "POLLS_ASYNC_VIEWS", False))
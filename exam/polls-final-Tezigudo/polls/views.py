@@ -1,18 +1,29 @@
 from django.http import (
+    Http404,
     HttpRequest,
     HttpResponseRedirect,
     HttpResponseNotAllowed,
     HttpResponseNotFound,
     HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
 )
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
 from django.utils import timezone
 from django.views import generic
 
-from .models import Choice, Question, Vote
+from . import audit, export, live, page_cache, results_cache, schedule, vote_queue, voting
+from .signals import send_votes_changed
+from .models import Choice, Question, Vote, VoteEvent
+from .pagination import KeysetPaginator
+from .ratelimit import rate_limited
+from .routers import primary_db
 
 
 class IndexView(generic.ListView):
@@ -21,13 +32,26 @@ class IndexView(generic.ListView):
 
     def get_queryset(self):
         """
-        Return all published poll questions, sorted by question text.
+        Return a page of published poll questions, sorted by question text.
+
+        Pages are selected with the `after` or `before` cursor in the query
+        string, which the previous and next page links provide.
         """
-        return [
-            q
-            for q in Question.objects.all().order_by("question_text")
-            if q.is_published()
-        ]
+        paginator = KeysetPaginator(
+            Question.objects.published(),
+            "question_text",
+            getattr(settings, "POLLS_INDEX_PAGE_SIZE", 20),
+        )
+        self.page = paginator.page(
+            after=self.request.GET.get("after"), before=self.request.GET.get("before")
+        )
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page"] = self.page
+        context["open_polls"] = schedule.get_open_polls()
+        return context
 
 
 class DetailView(generic.DetailView):
@@ -35,30 +59,67 @@ class DetailView(generic.DetailView):
     template_name = "polls/detail.html"
 
     def get(self, request: HttpRequest, *args, **kwargs):
-        question = get_object_or_404(Question, id=kwargs["pk"])
-        if not question.is_published():
-            return HttpResponseNotFound()
+        # the choices are read only if their rendered fragment is not cached
+        question = get_object_or_404(Question.objects.published(), id=kwargs["pk"])
         # get user's previously selected choice
         if request.user.is_authenticated:
-            vote = get_vote_for_user(question, request.user)
-            choice = vote.choice if vote and vote.choice else None
+            choice = get_queued_choice(question, request.user)
+            if choice is False:
+                vote = get_vote_for_user(question, request.user)
+                choice = vote.choice if vote and vote.choice else None
         else:
             choice = None
         # pass the question and user's choice to the template as named variables
-        context = {"question": question, "selected_choice": choice}
+        context = detail_context(question, choice)
         return render(request, "polls/detail.html", context)
 
 
+def detail_context(question: Question, selected_choice=None) -> dict:
+    """Context of the detail page, with the version that keys its cached choices."""
+    return {
+        "question": question,
+        "selected_choice": selected_choice,
+        "version": results_cache.get_version(question.id),
+        "fragment_timeout": page_cache.fragment_timeout(),
+    }
+
+
 class ResultsView(generic.DetailView):
     model = Question
     template_name = "polls/results.html"
 
+    def get_queryset(self):
+        """Question with its ordered choices and total votes, in two queries."""
+        return Question.objects.with_choices().with_vote_totals()
+
+    def get_object(self, queryset=None):
+        """Get the question and its results from the results cache."""
+        question, self.cache_status, self.version = results_cache.get_results(
+            self.kwargs["pk"], lambda: super(ResultsView, self).get_object(queryset)
+        )
+        return question
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["version"] = self.version
+        context["results_source"] = results_cache.read_source()
+        context["fragment_timeout"] = page_cache.fragment_timeout()
+        context["live_stream"] = live.can_stream(self.request)
+        return context
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        response["X-Results-Cache"] = self.cache_status
+        return response
+
 
 @login_required
+@rate_limited
+@primary_db
 def vote(request: HttpRequest, question_id):
     """Vote for a choice on a poll. Must be a POST request."""
-    question = get_object_or_404(Question, id=question_id)
-    context_data = {"question": question}
+    question = get_object_or_404(Question.objects.with_choices(), id=question_id)
+    context_data = detail_context(question)
     if not question.can_vote():
         messages.error(request, "Voting not allowed for this question")
         return render(request, "polls/detail.html", context_data)
@@ -71,15 +132,21 @@ def vote(request: HttpRequest, question_id):
         messages.error(request, "Please select a choice.")
         return render(request, "polls/detail.html", context_data)
 
-    # Create a vote or update an existing vote
-    vote = get_vote_for_user(question, request.user)
-    if vote:
-        vote.choice = selected_choice
+    if vote_queue.is_enabled():
+        # the vote is written later by the vote queue
+        vote_queue.get_vote_queue().put(request.user.id, question.id, selected_choice.id)
+        messages.info(request, "Your vote was successfully recorded.")
+        return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+
+    # Create a vote or update an existing vote, and keep the choice
+    # vote counters in step with it in the same transaction.
+    status = voting.cast_vote(request.user.id, question.id, selected_choice.id)
+    if status == voting.CREATED:
+        messages.info(request, "Your vote was successfully recorded.")
+    elif status == voting.CHANGED:
         messages.info(request, "Your vote was successfully updated.")
     else:
-        vote = Vote(user=request.user, choice=selected_choice)
-        messages.info(request, "Your vote was successfully recorded.")
-    vote.save()
+        messages.info(request, "You already voted for this choice.")
     return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
 
 
@@ -93,19 +160,112 @@ def get_vote_for_user(question: Question, user) -> Vote:
     if not user.is_authenticated:
         return None
     try:
-        return Vote.objects.get(user=user, choice__question=question)
+        return Vote.objects.get(user=user, question=question)
     except Vote.DoesNotExist:
         # no vote yet
         return None
 
 
+def get_queued_choice(question: Question, user):
+    """Return the choice of a vote by the user that is still in the vote queue.
+
+    :returns: the queued Choice, None if the queued vote removes the user's
+        vote, or False if the user has no vote waiting in the queue.
+    """
+    if not vote_queue.is_enabled():
+        return False
+    queued, choice_id = vote_queue.get_vote_queue().pending_choice(user.id, question.id)
+    if not queued:
+        return False
+    if choice_id is None:
+        return None
+    # use the prefetched choices, if any
+    return next((c for c in question.choice_set.all() if c.id == choice_id), None)
+
+
+@rate_limited
+@primary_db
 def remove_vote(request: HttpRequest, question_id) -> HttpResponse:
     """Remove a user's vote for a poll question. Must be POST Request"""
-    question = get_object_or_404(Question, id=question_id)
+    question = get_object_or_404(Question.objects.with_choices(), id=question_id)
+    if not question.can_vote():
+        messages.error(request, "Voting not allowed for this question")
+        return render(request, "polls/detail.html", detail_context(question))
+
+    if vote_queue.is_enabled() and request.user.is_authenticated:
+        vote_queue.get_vote_queue().put(request.user.id, question.id, None)
+        messages.info(request, "Your vote was successfully removed")
+        return HttpResponseRedirect(reverse('polls:detail', args=(question.id,)))
 
-    vote = get_vote_for_user(question, request.user)
-    if not vote:
-        return HttpResponseNotFound("You didnt vote yet")
-    vote.delete()
+    with transaction.atomic():
+        vote = get_vote_for_user(question, request.user)
+        if not vote:
+            return HttpResponseNotFound("You didnt vote yet")
+        Choice.change_vote_count(vote.choice_id, -1)
+        vote.delete()
+        audit.record([(VoteEvent.REMOVE, request.user.id, question.id, None)])
+        send_votes_changed(question.id)
     messages.info(request, "Your vote was successfully removed")
     return HttpResponseRedirect(reverse('polls:detail', args=(question.id,)))
+
+
+@staff_member_required
+def export_results(request: HttpRequest, fmt: str) -> StreamingHttpResponse:
+    """Stream the vote counts of every choice as CSV or NDJSON.
+
+    With `?data=votes`, stream every user's vote instead.
+    """
+    data = request.GET.get("data", "results")
+    if fmt not in export.FORMATS or data not in ("results", "votes"):
+        raise Http404("Unknown export")
+    response = StreamingHttpResponse(
+        export.export_lines(data, fmt), content_type=export.FORMATS[fmt]
+    )
+    response["Content-Disposition"] = f'attachment; filename="polls-{data}.{fmt}"'
+    return response
+
+
+def _since(request: HttpRequest) -> int:
+    """The last frame seen by the client, from Last-Event-ID or ?since."""
+    try:
+        return int(request.headers.get("Last-Event-ID") or request.GET.get("since", 0))
+    except ValueError:
+        return 0
+
+
+def live_results(request: HttpRequest, question_id) -> StreamingHttpResponse:
+    """Stream the vote counts of a question as server-sent events."""
+    get_object_or_404(Question, id=question_id)
+    since = _since(request)
+    duration = getattr(settings, "POLLS_LIVE_STREAM_SECONDS", 300)
+    keepalive = getattr(settings, "POLLS_LIVE_KEEPALIVE", 15)
+    if live.can_stream(request):
+        # an async stream does not hold a thread between frames
+        first_frame = live.get_live_results().latest(question_id)
+        events = live.async_event_stream(question_id, since, duration, keepalive, first_frame)
+    else:
+        events = live.event_stream(question_id, since, duration, keepalive)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # tell nginx not to buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def live_results_poll(request: HttpRequest, question_id) -> HttpResponse:
+    """Long poll for the next vote counts of a question after ?since.
+
+    Returns the frame as JSON, or 204 No Content if there is no new
+    frame within POLLS_LIVE_POLL_TIMEOUT seconds.
+    """
+    get_object_or_404(Question, id=question_id)
+    since = _since(request)
+    results = live.get_live_results()
+    frame = results.latest(question_id)
+    if frame["seq"] <= since:
+        frame = results.wait(
+            question_id, since, getattr(settings, "POLLS_LIVE_POLL_TIMEOUT", 25)
+        )
+    if frame is None:
+        return HttpResponse(status=204)
+    return JsonResponse(frame)
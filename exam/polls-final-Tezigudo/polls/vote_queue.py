@@ -0,0 +1,268 @@
+"""Write-behind ingestion of votes.
+
+When ``POLLS_VOTE_QUEUE`` is enabled the vote views do not write to the
+database.  Instead they put the vote in an in-process queue, and a
+background thread drains the queue every ``POLLS_VOTE_QUEUE_INTERVAL``
+seconds (or as soon as ``POLLS_VOTE_QUEUE_BATCH_SIZE`` votes are waiting)
+using ``bulk_create`` and ``bulk_update``.
+
+The queue keeps only the latest vote for each (user, question), so a user
+who changes his vote several times before a flush costs one write.
+A choice of ``None`` means the vote is removed.
+
+If ``POLLS_VOTE_QUEUE_JOURNAL`` names a file, each queued vote is also
+appended to that file, so votes not yet written when the process dies can
+be recovered with ``manage.py flush_votes``.  Use a separate journal file
+for each server process.  While a process writes a journal, it holds a
+lock on ``<journal>.lock``, and flush_votes skips a journal that is
+locked, so it only replays the journals of processes that are gone.  The
+lock uses fcntl, so journals are not locked on Windows.
+"""
+import atexit
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.db import connection
+
+from .voting import VoteKey, apply_votes, count_changes
+
+
+class JournalInUse(RuntimeError):
+    """A journal that a running process is still writing."""
+
+
+def _lock_journal(path: str, wait: bool = True):
+    """Lock a journal, returning the open lock file, or None if another
+    process holds the lock and wait is False.
+    """
+    lock_file = open(path + ".lock", "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+
+def read_journal(path: str) -> Dict[VoteKey, Optional[int]]:
+    """Read the votes in a journal file, keeping the last vote per key."""
+    votes = {}
+    with open(path) as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a partly written last line, if the process died mid-write
+                continue
+            votes[(entry["user"], entry["question"])] = entry["choice"]
+    return votes
+
+
+def replay_journal(path: str, batch_size: int = 500) -> int:
+    """Apply the votes in a journal file and any rotated parts of it,
+    then delete them.
+
+    :returns: the number of votes that changed the database.
+    :raises JournalInUse: if a running process is writing the journal
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        return 0
+    lock_file = _lock_journal(path, wait=False)
+    if lock_file is None:
+        raise JournalInUse(f"{path} is in use by a running process")
+    with lock_file:
+        return _replay_parts(directory, name, path, batch_size)
+
+
+def _replay_parts(directory: str, name: str, path: str, batch_size: int) -> int:
+    # rotated parts are older than the live journal, so apply them first
+    parts = sorted(
+        os.path.join(directory, entry)
+        for entry in os.listdir(directory)
+        if entry.startswith(name + ".") and entry.endswith(".pending")
+    )
+    if os.path.exists(path):
+        parts.append(path)
+    votes = {}
+    for part in parts:
+        votes.update(read_journal(part))
+    changed = count_changes(apply_votes(votes, batch_size=batch_size))
+    for part in parts:
+        os.remove(part)
+    return changed
+
+
+class VoteQueue:
+    """An in-process queue of votes drained in batches by a worker thread.
+
+    :param batch_size: flush as soon as this many votes are waiting.
+    :param interval: seconds between flushes by the worker thread.
+        If None, the queue is only flushed by calling flush().
+    :param journal: optional path of a file where queued votes are appended.
+    """
+
+    def __init__(self, batch_size: int = 500, interval: Optional[float] = 1.0,
+                 journal: Optional[str] = None):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.journal = journal
+        self._pending: Dict[VoteKey, Optional[int]] = {}
+        self._lock = threading.Lock()
+        # serializes flushes by the worker and by callers of flush()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+        self._journal_file = None
+        # held from the first journal write until close()
+        self._journal_lock = None
+        self._rotations = 0
+        # rotated journals whose votes have not been written yet
+        self._rotated: List[str] = []
+
+    def put(self, user_id: int, question_id: int, choice_id: Optional[int]) -> None:
+        """Queue a vote, replacing any queued vote by the same user for
+        the same question.  Use choice_id None to remove the vote.
+        """
+        with self._lock:
+            self._pending[(user_id, question_id)] = choice_id
+            if self.journal:
+                self._write_journal(user_id, question_id, choice_id)
+            full = len(self._pending) >= self.batch_size
+        self._start_worker()
+        if full:
+            self._wakeup.set()
+
+    def pending_choice(self, user_id: int, question_id: int):
+        """Return (True, choice_id) if a vote by the user for the question
+        is waiting to be written, otherwise (False, None).
+        """
+        with self._lock:
+            key = (user_id, question_id)
+            if key in self._pending:
+                return True, self._pending[key]
+            return False, None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Write all queued votes to the database.
+
+        :returns: the number of votes that changed the database.
+        """
+        with self._flush_lock:
+            with self._lock:
+                votes, self._pending = self._pending, {}
+                self._rotate_journal()
+            try:
+                changed = count_changes(apply_votes(votes, batch_size=self.batch_size))
+            except Exception:
+                # put the votes back, unless newer ones were queued meanwhile
+                with self._lock:
+                    for key, choice_id in votes.items():
+                        self._pending.setdefault(key, choice_id)
+                raise
+            for rotated in self._rotated:
+                os.remove(rotated)
+            self._rotated.clear()
+            return changed
+
+    def close(self) -> None:
+        """Stop the worker thread and write any queued votes."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._worker and self._worker is not threading.current_thread():
+            self._worker.join()
+        self.flush()
+        with self._lock:
+            if self._journal_file:
+                self._journal_file.close()
+                self._journal_file = None
+            if self._journal_lock:
+                self._journal_lock.close()
+                self._journal_lock = None
+
+    def _start_worker(self):
+        if self.interval is None or self._worker or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._worker:
+                return
+            self._worker = threading.Thread(
+                target=self._run, name="polls-vote-queue", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # the votes were put back in the queue; retry next time
+                pass
+            finally:
+                # each thread has its own connection; don't hold it idle
+                connection.close()
+
+    def _write_journal(self, user_id, question_id, choice_id):
+        if self._journal_lock is None:
+            # waits if flush_votes is replaying a journal left by a
+            # process that used this path before
+            self._journal_lock = _lock_journal(self.journal)
+        if self._journal_file is None:
+            self._journal_file = open(self.journal, "a")
+        entry = {"user": user_id, "question": question_id, "choice": choice_id}
+        self._journal_file.write(json.dumps(entry) + "\n")
+        self._journal_file.flush()
+
+    def _rotate_journal(self):
+        """Move the journal aside so it can be deleted after its votes are
+        written.  Votes queued meanwhile go to a new journal file.
+        """
+        if not self.journal or self._journal_file is None:
+            return
+        self._journal_file.close()
+        self._journal_file = None
+        self._rotations += 1
+        rotated = f"{self.journal}.{os.getpid()}-{self._rotations:06d}.pending"
+        os.replace(self.journal, rotated)
+        self._rotated.append(rotated)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_vote_queue() -> VoteQueue:
+    """Return the vote queue of this process, creating it from settings."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = VoteQueue(
+                batch_size=getattr(settings, "POLLS_VOTE_QUEUE_BATCH_SIZE", 500),
+                interval=getattr(settings, "POLLS_VOTE_QUEUE_INTERVAL", 1.0),
+                journal=getattr(settings, "POLLS_VOTE_QUEUE_JOURNAL", None) or None,
+            )
+            # write any remaining votes when the process exits
+            atexit.register(_queue.close)
+        return _queue
+
+
+def is_enabled() -> bool:
+    """True if votes should be queued instead of written immediately."""
+    return getattr(settings, "POLLS_VOTE_QUEUE", False)
+
@@ -0,0 +1,162 @@
+"""Write many votes at once.
+
+apply_votes() is used by the vote queue to write its batches and by the
+JSON voting API, which lets a client vote on many questions in one request.
+cast_vote() writes a single vote, for the vote view.
+"""
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+
+from . import audit
+from .models import Choice, Vote, VoteEvent
+from .signals import send_votes_changed
+
+# (user_id, question_id) -> choice_id, or None to remove the vote
+VoteKey = Tuple[int, int]
+
+# status of each vote after apply_votes()
+CREATED = "created"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+REMOVED = "removed"
+NO_VOTE = "no_vote"
+INVALID_CHOICE = "invalid_choice"
+
+CHANGES = (CREATED, CHANGED, REMOVED)
+
+# times to write a batch whose new votes conflict with votes inserted at
+# the same time by other requests
+ATTEMPTS = 3
+
+
+def apply_votes(votes: Dict[VoteKey, Optional[int]],
+                batch_size: int = 500) -> Dict[VoteKey, str]:
+    """Write a batch of votes to the database in one transaction.
+
+    Existing votes are loaded in one query, then new votes are inserted
+    with bulk_create, changed votes are updated with bulk_update, removed
+    votes are deleted, the choice vote counters are adjusted in one
+    UPDATE, and an event for each change is added to the vote history.
+
+    If a concurrent request inserts a vote with the same user and question
+    first, the unique constraint rejects the insert; the transaction is
+    rolled back and the batch is written again, which finds that vote and
+    changes it instead, as vote() does with get_or_create().
+
+    :param votes: maps (user_id, question_id) to the selected choice id,
+        or to None if the vote should be removed.
+    :returns: the status of each vote: CREATED, CHANGED, UNCHANGED, REMOVED,
+        NO_VOTE (nothing to remove) or INVALID_CHOICE (the choice does not
+        exist or is not a choice for the question).
+    """
+    if not votes:
+        return {}
+    for attempt in range(ATTEMPTS):
+        try:
+            return _apply_votes(votes, batch_size)
+        except IntegrityError:
+            if attempt == ATTEMPTS - 1:
+                raise
+
+
+def _apply_votes(votes: Dict[VoteKey, Optional[int]], batch_size: int) -> Dict[VoteKey, str]:
+    user_ids = {user_id for user_id, _ in votes}
+    question_ids = {question_id for _, question_id in votes}
+    choice_ids = {choice_id for choice_id in votes.values() if choice_id is not None}
+    statuses = {}
+    with transaction.atomic():
+        # choice id -> question id, to reject choices deleted since they
+        # were selected or that belong to another question
+        choice_questions = dict(
+            Choice.objects.filter(id__in=choice_ids).values_list("id", "question_id")
+        )
+        existing = {}
+        for vote in Vote.objects.filter(
+            user_id__in=user_ids, question_id__in=question_ids
+        ).only("user_id", "question_id", "choice_id"):
+            existing[(vote.user_id, vote.question_id)] = vote
+
+        new_votes, changed_votes, removed_ids = [], [], []
+        deltas = Counter()
+        events = []
+        for key, choice_id in votes.items():
+            user_id, question_id = key
+            vote = existing.get(key)
+            if choice_id is None:
+                if vote:
+                    removed_ids.append(vote.id)
+                    deltas[vote.choice_id] -= 1
+                    statuses[key] = REMOVED
+                    events.append((VoteEvent.REMOVE, user_id, question_id, None))
+                else:
+                    statuses[key] = NO_VOTE
+            elif choice_questions.get(choice_id) != question_id:
+                statuses[key] = INVALID_CHOICE
+            elif vote is None:
+                new_votes.append(
+                    Vote(user_id=user_id, question_id=question_id, choice_id=choice_id)
+                )
+                deltas[choice_id] += 1
+                statuses[key] = CREATED
+                events.append((VoteEvent.CAST, user_id, question_id, choice_id))
+            elif vote.choice_id != choice_id:
+                deltas[vote.choice_id] -= 1
+                deltas[choice_id] += 1
+                vote.choice_id = choice_id
+                changed_votes.append(vote)
+                statuses[key] = CHANGED
+                events.append((VoteEvent.CHANGE, user_id, question_id, choice_id))
+            else:
+                statuses[key] = UNCHANGED
+
+        Vote.objects.bulk_create(new_votes, batch_size=batch_size)
+        Vote.objects.bulk_update(changed_votes, ["choice"], batch_size=batch_size)
+        if removed_ids:
+            # the deltas take them off the counters with the other changes
+            Vote.objects.filter(id__in=removed_ids).delete(uncount=False)
+        Choice.change_vote_counts(deltas)
+        audit.record(events)
+        send_votes_changed(
+            *(question_id for (_, question_id), status in statuses.items()
+              if status in CHANGES)
+        )
+    return statuses
+
+
+def cast_vote(user_id: int, question_id: int, choice_id: int, using=None) -> str:
+    """Cast or change one user's vote for a choice, as the vote view does.
+
+    The vote is read with select_for_update() and get_or_create(), and the
+    vote, the choice vote counters and the vote history are written in one
+    transaction.  The unique (user, question) constraint makes this safe
+    against concurrent votes by the same user: the loser of the race gets
+    the winner's vote and updates it.
+
+    :param using: the database alias (default: the router's choice)
+    :returns: CREATED, CHANGED or UNCHANGED
+    """
+    with transaction.atomic(using=using):
+        vote, created = Vote.objects.using(using).select_for_update().get_or_create(
+            user_id=user_id, question_id=question_id, defaults={"choice_id": choice_id}
+        )
+        if created:
+            Choice.change_vote_count(choice_id, 1, using=using)
+            audit.record([(VoteEvent.CAST, user_id, question_id, choice_id)], using=using)
+            status = CREATED
+        elif vote.choice_id != choice_id:
+            Choice.change_vote_count(vote.choice_id, -1, using=using)
+            Choice.change_vote_count(choice_id, 1, using=using)
+            Vote.objects.using(using).filter(id=vote.id).update(choice_id=choice_id)
+            audit.record([(VoteEvent.CHANGE, user_id, question_id, choice_id)], using=using)
+            status = CHANGED
+        else:
+            status = UNCHANGED
+        send_votes_changed(question_id, using=using)
+    return status
+
+
+def count_changes(statuses: Dict[VoteKey, str]) -> int:
+    """The number of votes that changed the database."""
+    return sum(1 for status in statuses.values() if status in CHANGES)